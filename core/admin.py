@@ -1,6 +1,21 @@
 from django.contrib import admin
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum
+from .admin_tools import FastChangeListMixin
 from .models import Category, Product, Review, Cart, CartItem, Order, OrderItem
 
+def _per_row_sum(queryset, field, expression, output_field):
+    """
+    Correlated subquery summing expression over rows of queryset pointing at
+    the outer row through field. Unlike a joined Sum it is only evaluated
+    for the rows on the page, and count() drops it.
+    """
+    return Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            total=Sum(expression, output_field=output_field)
+        ).values('total'),
+        output_field=output_field,
+    )
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug', 'created_at', 'updated_at']
@@ -9,40 +24,92 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ['created_at', 'updated_at']
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ['name', 'slug', 'price', 'stock', 'available', 'created_at', 'updated_at']
     list_filter = ['available', 'created_at', 'updated_at', 'category']
+    # Editable columns only ever cover one page of products
     list_editable = ['price', 'stock', 'available']
+    list_per_page = 50
     prepopulated_fields = {'slug': ('name',)}
-    search_fields = ['name', 'description']
-    date_hierarchy = 'created_at'
+    # Prefix and exact lookups use indexes; PostgreSQL also searches the full text
+    search_fields = ['^name', '=slug']
+    search_document = "to_tsvector('english', coalesce(core_product.name, '') || ' ' || coalesce(core_product.description, ''))"
+    autocomplete_fields = ['category']
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
+    autocomplete_fields = ['product']
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
-    list_display = ['user', 'created_at', 'updated_at', 'total_items', 'total_price']
+class CartAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ['user', 'created_at', 'updated_at', 'item_count', 'price_total']
     list_filter = ['created_at', 'updated_at']
+    list_select_related = ['user']
+    search_fields = ['=user__username']
+    autocomplete_fields = ['user']
     inlines = [CartItemInline]
     readonly_fields = ['created_at', 'updated_at', 'total_items', 'total_price']
 
+    def get_queryset(self, request):
+        items = CartItem.objects.all()
+        return super().get_queryset(request).annotate(
+            item_count=_per_row_sum(items, 'cart', F('quantity'), IntegerField()),
+            price_total=_per_row_sum(
+                items, 'cart', F('quantity') * F('product__price'), DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+
+    @admin.display(description='Total items', ordering='item_count')
+    def item_count(self, obj):
+        return obj.item_count or 0
+
+    @admin.display(description='Total price', ordering='price_total')
+    def price_total(self, obj):
+        return obj.price_total or 0
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ['get_cost']
+    readonly_fields = ['cost']
+    autocomplete_fields = ['product']
+
+    @admin.display(description='Cost')
+    def cost(self, obj):
+        # The blank "add another" row has no price yet
+        return obj.get_cost() if obj.price is not None else '-'
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'first_name', 'last_name', 'email', 'status', 'paid', 'created_at']
+class OrderAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ['id', 'user', 'first_name', 'last_name', 'email', 'status', 'paid', 'total_cost', 'created_at']
     list_filter = ['status', 'paid', 'created_at', 'updated_at']
-    search_fields = ['first_name', 'last_name', 'email', 'address', 'postal_code', 'city']
+    list_select_related = ['user']
+    search_fields = ['=id', '=email', '^last_name', '^postal_code']
+    search_document = (
+        "to_tsvector('simple', core_order.first_name || ' ' || core_order.last_name || ' ' || "
+        "core_order.email || ' ' || core_order.address || ' ' || core_order.postal_code || ' ' || core_order.city)"
+    )
+    search_config = 'simple'
+    autocomplete_fields = ['user']
     inlines = [OrderItemInline]
     readonly_fields = ['created_at', 'updated_at', 'get_total_cost']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            total=_per_row_sum(
+                OrderItem.objects.all(), 'order', F('price') * F('quantity'), DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+
+    @admin.display(description='Total', ordering='total')
+    def total_cost(self, obj):
+        return obj.total or 0
+
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ['product', 'user', 'rating', 'created_at', 'likes', 'dislikes']
     list_filter = ['rating', 'created_at']
-    search_fields = ['product__name', 'user__username', 'comment']
+    list_select_related = ['product', 'user']
+    search_fields = ['^product__name', '=user__username']
+    search_document = "to_tsvector('english', core_review.comment)"
+    autocomplete_fields = ['product', 'user']
@@ -0,0 +1,258 @@
+"""
+Background tasks.
+
+Work that does not have to finish before the response is sent (model
+refits, order follow-ups, periodic maintenance) is declared with @task and
+queued with delay() or schedule(). TASK_BACKEND decides where it runs:
+
+    'local'   a pool of TASK_WORKERS threads in the queuing process; the
+              default, for a single node and development
+    'eager'   at the call, for tests and scripts
+    'celery'  sent to CELERY_BROKER_URL and run by the celery services of
+              docker-compose.yml (needs the celery package)
+
+A task that raises is queued again up to retries times, retry_delay
+seconds later and doubling each time. schedule(key=...) drops the call
+while an earlier one with the same key is still waiting, so a burst of
+ratings costs one refit; the key is released as the task starts, so a
+change made while it runs queues another. Tasks declared local=True work
+on this process's own memory (e.g. the loaded model) and always use the
+local pool.
+
+@periodic jobs run every interval seconds: from celery beat, or from the
+local scheduler thread, where a cache lock per turn lets only one process
+run each turn. Periodic tasks declared local=True keep this process's own
+state fresh, so every process runs each of their turns itself, whatever
+the backend.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'task-pending:{}:{}'
+TURN_KEY = 'task-turn:{}:{}'
+
+registry = {}
+periodic_tasks = {}
+
+
+class Task:
+    """A registered function that can be queued by name."""
+
+    def __init__(self, func, name, retries=0, retry_delay=10.0, key_timeout=3600, local=False):
+        self.func = func
+        self.name = name
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.key_timeout = key_timeout
+        self.local = local
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Queue a call to run as soon as a worker is free."""
+        return self.schedule(args, kwargs)
+
+    def schedule(self, args=(), kwargs=None, countdown=0, key=None):
+        """
+        Queue a call.
+
+        Args:
+            args: Positional arguments; must be JSON-serializable for celery
+            kwargs: Keyword arguments
+            countdown: Seconds to wait before running
+            key: Deduplication key; the call is dropped while another call
+                of this task with the same key is waiting
+
+        Returns:
+            bool: False if the call was dropped as a duplicate
+        """
+        if key is not None:
+            # Expires on its own should the queued call be lost with its process
+            if not cache.add(PENDING_KEY.format(self.name, key), 1, timeout=countdown + self.key_timeout):
+                return False
+        get_backend(self.local).submit(self.name, tuple(args), kwargs or {}, key, 0, countdown)
+        return True
+
+
+def task(func=None, *, name=None, retries=0, retry_delay=10.0, key_timeout=3600, local=False):
+    """
+    Register a function as a task; usable with or without arguments.
+
+    Args:
+        name: Registry name, module.function by default
+        retries: Times a failing call is queued again
+        retry_delay: Seconds before the first retry, doubled after each
+        key_timeout: Seconds a deduplication key outlives its countdown
+        local: Always run on this process's thread pool
+    """
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        registry[task_name] = Task(func, task_name, retries, retry_delay, key_timeout, local)
+        return registry[task_name]
+
+    return register(func) if func is not None else register
+
+
+def periodic(interval):
+    """Run a task every interval seconds; apply on top of @task."""
+    def register(task):
+        periodic_tasks[task.name] = interval
+        return task
+
+    return register
+
+
+def execute(name, args, kwargs, key=None, attempt=0):
+    """Run one queued call; backends call this from their workers."""
+    task = registry[name]
+    if key is not None:
+        cache.delete(PENDING_KEY.format(name, key))
+    try:
+        task.func(*args, **kwargs)
+    except Exception:
+        if attempt >= task.retries:
+            logger.exception("Task %s failed", name)
+            return
+        delay = task.retry_delay * 2 ** attempt
+        logger.warning("Task %s failed, retry %d in %.0fs", name, attempt + 1, delay, exc_info=True)
+        get_backend(task.local).submit(name, args, kwargs, None, attempt + 1, delay)
+
+
+class EagerBackend:
+    """Runs every call at once in the caller; countdowns are ignored."""
+
+    def submit(self, name, args, kwargs, key=None, attempt=0, countdown=0):
+        execute(name, args, kwargs, key, attempt)
+
+
+class LocalBackend:
+    """
+    Thread pool in this process.
+
+    Delayed calls, retries and periodic turns wait in a heap served by one
+    scheduler thread. Both threads are started on first use and again
+    after a fork, so a pre-fork master never hands its pool to workers.
+    """
+
+    def __init__(self, workers=4, run_periodic=True):
+        self.workers = workers
+        self.run_periodic = run_periodic
+        self._pool = None
+        self._pid = None
+        self._queue = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._start_lock = threading.Lock()
+
+    def submit(self, name, args, kwargs, key=None, attempt=0, countdown=0):
+        self.start()
+        call = (name, args, kwargs, key, attempt)
+        if countdown > 0:
+            self._push(time.monotonic() + countdown, call)
+        else:
+            self._pool.submit(self._run, call)
+
+    def _push(self, run_at, call):
+        with self._wakeup:
+            heapq.heappush(self._queue, (run_at, next(self._sequence), call))
+            self._wakeup.notify()
+
+    def start(self):
+        """Start the pool and scheduler in this process unless running."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the parent's queue, threads and the locks they held stay with the parent
+                self._wakeup = threading.Condition()
+                self._queue = []
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='task')
+            for name, interval in periodic_tasks.items():
+                if self.run_periodic or registry[name].local:
+                    self._push(time.monotonic() + interval - time.time() % interval, (None, name))
+            threading.Thread(target=self._schedule_forever, name='task-scheduler', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _schedule_forever(self):
+        while True:
+            with self._wakeup:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._wakeup.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, _, call = heapq.heappop(self._queue)
+            if call[0] is None:
+                self._turn(call[1])
+            else:
+                self._pool.submit(self._run, call)
+
+    def _turn(self, name):
+        interval = periodic_tasks[name]
+        turn = int(time.time() // interval)
+        self._push(time.monotonic() + interval - time.time() % interval, (None, name))
+        # Every process has a scheduler; the first to claim the turn runs it
+        if registry[name].local or cache.add(TURN_KEY.format(name, turn), 1, timeout=interval):
+            self._pool.submit(self._run, (name, (), {}, None, 0))
+
+    def _run(self, call):
+        try:
+            execute(*call)
+        except Exception:
+            logger.exception("Task %s could not run", call[0])
+        finally:
+            connections.close_all()
+
+
+class CeleryBackend:
+    """Sends calls to the broker; see ecommerce/celery.py."""
+
+    def __init__(self):
+        from ecommerce.celery import app
+
+        self.app = app
+
+    def submit(self, name, args, kwargs, key=None, attempt=0, countdown=0):
+        self.app.send_task('core.run_task', args=(name, list(args), kwargs, key, attempt), countdown=countdown or None)
+
+
+BACKENDS = {'local': LocalBackend, 'eager': EagerBackend, 'celery': CeleryBackend}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(local=False):
+    """Return the process-wide backend, or the local pool for local tasks."""
+    configured = getattr(settings, 'TASK_BACKEND', 'local')
+    name = 'local' if local and configured != 'eager' else configured
+    if name not in _backends:
+        with _backends_lock:
+            if name not in _backends:
+                if name == 'local':
+                    # Under celery, beat runs the periodic tasks
+                    _backends[name] = LocalBackend(
+                        getattr(settings, 'TASK_WORKERS', 4), run_periodic=configured == 'local'
+                    )
+                else:
+                    _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def start_scheduler():
+    """Start running periodic tasks in this process if any run locally."""
+    configured = getattr(settings, 'TASK_BACKEND', 'local')
+    if configured == 'local' or (configured != 'eager' and any(registry[name].local for name in periodic_tasks)):
+        get_backend(local=True).start()
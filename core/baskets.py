@@ -0,0 +1,234 @@
+"""
+"Frequently bought together" index built from order baskets.
+
+Orders are turned into a sparse basket x product matrix B; B.T @ B gives
+how many baskets contain each pair of products. Pairs seen in at least
+BASKET_MIN_COUNT baskets are scored by lift (co-occurrence relative to
+what independent purchases would give; ranking by PMI = log(lift) is the
+same), and the best BASKET_TOP_K per product are written to a single .npy
+table that web processes memory-map and look up with a binary search.
+
+The raw counts are kept next to the table, so update() only has to read
+the orders placed since the last run. Orders younger than
+BASKET_SETTLE_SECONDS are left for the next run, giving transactions that
+were still open a chance to commit.
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import routers
+from .models import OrderItem
+
+
+def _directory():
+    return getattr(settings, 'BASKET_INDEX_DIR', os.path.join(settings.BASE_DIR, 'var', 'baskets'))
+
+
+def _path(name):
+    return os.path.join(_directory(), name)
+
+
+def _save(name, writer):
+    """Write a file next to its final name and move it into place atomically."""
+    os.makedirs(_directory(), exist_ok=True)
+    tmp = _path(f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'wb') as f:
+        writer(f)
+    os.replace(tmp, _path(name))
+
+
+class Counts:
+    """Co-occurrence counts: product ids, per-product and per-pair basket counts."""
+
+    def __init__(self, ids=None, item_counts=None, pairs=None, baskets=0, last_order_id=0):
+        from scipy import sparse
+
+        self.ids = np.zeros(0, dtype=np.int64) if ids is None else ids
+        self.item_counts = np.zeros(0, dtype=np.int64) if item_counts is None else item_counts
+        self.pairs = sparse.csr_matrix((len(self.ids), len(self.ids)), dtype=np.int64) if pairs is None else pairs
+        self.baskets = baskets
+        self.last_order_id = last_order_id
+
+    @classmethod
+    def load(cls):
+        from scipy import sparse
+
+        try:
+            data = np.load(_path('counts.npz'))
+        except FileNotFoundError:
+            return cls()
+        size = len(data['ids'])
+        pairs = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=(size, size))
+        return cls(data['ids'], data['item_counts'], pairs, int(data['baskets']), int(data['last_order_id']))
+
+    def save(self):
+        _save('counts.npz', lambda f: np.savez(
+            f, ids=self.ids, item_counts=self.item_counts, baskets=self.baskets,
+            last_order_id=self.last_order_id, data=self.pairs.data, indices=self.pairs.indices,
+            indptr=self.pairs.indptr,
+        ))
+
+    def add(self, order_items):
+        """
+        Add baskets to the counts.
+
+        Args:
+            order_items: (n, 2) array of (order_id, product_id) rows
+        """
+        from scipy import sparse
+
+        if not len(order_items):
+            return
+        order_ids, rows = np.unique(order_items[:, 0], return_inverse=True)
+        ids = np.union1d(self.ids, order_items[:, 1])
+        if len(ids) != len(self.ids):
+            # Re-index existing counts onto the grown product list
+            position = np.searchsorted(ids, self.ids)
+            old = self.pairs.tocoo()
+            self.pairs = sparse.csr_matrix(
+                (old.data, (position[old.row], position[old.col])), shape=(len(ids), len(ids))
+            )
+            item_counts = np.zeros(len(ids), dtype=np.int64)
+            item_counts[position] = self.item_counts
+            self.ids, self.item_counts = ids, item_counts
+
+        cols = np.searchsorted(self.ids, order_items[:, 1])
+        baskets = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.int64), (rows, cols)), shape=(len(order_ids), len(self.ids))
+        )
+        baskets.data[:] = 1  # a product listed twice in one order counts once
+        together = (baskets.T @ baskets).tocsr()
+        diagonal = together.diagonal()
+        self.item_counts += diagonal
+        together = together - sparse.diags(diagonal, format='csr')
+        together.eliminate_zeros()
+        self.pairs = (self.pairs + together).tocsr()
+        self.baskets += len(order_ids)
+        self.last_order_id = max(self.last_order_id, int(order_ids.max()))
+
+    def top_k(self, k, min_count):
+        """
+        Best k partners of every product by lift.
+
+        Returns:
+            numpy.ndarray: Structured array with product, related[k] and
+            score[k] fields, sorted by product; unused slots hold -1 and 0
+        """
+        coo = self.pairs.tocoo()
+        keep = coo.data >= min_count
+        rows, cols, together = coo.row[keep], coo.col[keep], coo.data[keep].astype(np.float64)
+        lift = together * self.baskets / (self.item_counts[rows] * self.item_counts[cols])
+
+        order = np.lexsort((-lift, rows))
+        rows, cols, lift = rows[order], cols[order], lift[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        keep = rank < k
+        rows, cols, lift, rank = rows[keep], cols[keep], lift[keep], rank[keep]
+
+        products = np.unique(rows)
+        table = np.zeros(len(products), dtype=[('product', '<i8'), ('related', '<i8', (k,)), ('score', '<f4', (k,))])
+        table['product'] = self.ids[products]
+        table['related'] = -1
+        slot = np.searchsorted(products, rows)
+        table['related'][slot, rank] = self.ids[cols]
+        table['score'][slot, rank] = lift
+        return table
+
+
+def _order_items(after_order_id):
+    settle = getattr(settings, 'BASKET_SETTLE_SECONDS', 60)
+    with routers.analytics():
+        rows = list(
+            OrderItem.objects.filter(
+                order_id__gt=after_order_id, order__created_at__lt=timezone.now() - timedelta(seconds=settle)
+            ).order_by().values_list('order_id', 'product_id').iterator(chunk_size=10_000)
+        )
+    return np.array(rows, dtype=np.int64).reshape(-1, 2)
+
+
+_update_lock = threading.Lock()
+
+
+def update(full=False):
+    """
+    Fold new orders into the counts and rewrite the lookup table.
+
+    Runs one at a time in a process: two runs folding in the same orders
+    would count them twice.
+
+    Args:
+        full: Rebuild from every order instead of only the new ones
+
+    Returns:
+        int: Number of products with related products in the table
+    """
+    with _update_lock:
+        counts = Counts() if full else Counts.load()
+        counts.add(_order_items(counts.last_order_id))
+        table = counts.top_k(getattr(settings, 'BASKET_TOP_K', 10), getattr(settings, 'BASKET_MIN_COUNT', 2))
+        counts.save()
+        _save('index.npy', lambda f: np.save(f, table))
+    return len(table)
+
+
+class BasketIndex:
+    """Memory-mapped lookup table, re-opened when update() replaces it."""
+
+    def __init__(self, path, check_interval=30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._table = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self):
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            with self._lock:
+                self._checked = now
+                try:
+                    mtime = os.stat(self.path).st_mtime_ns
+                except FileNotFoundError:
+                    self._table = self._mtime = None
+                else:
+                    if mtime != self._mtime:
+                        self._table, self._mtime = np.load(self.path, mmap_mode='r'), mtime
+        return self._table
+
+    def related(self, product_id, n=4):
+        """
+        Products most often bought together with product_id.
+
+        Returns:
+            list: (product_id, lift) pairs, best first
+        """
+        table = self._current()
+        if table is None or not len(table):
+            return []
+        i = int(np.searchsorted(table['product'], product_id))
+        if i == len(table) or table['product'][i] != product_id:
+            return []
+        row = table[i]
+        return [(int(pid), float(score)) for pid, score in zip(row['related'][:n], row['score'][:n]) if pid >= 0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the process-wide basket index."""
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = BasketIndex(_path('index.npy'), getattr(settings, 'BASKET_RELOAD_INTERVAL', 30.0))
+    return _index
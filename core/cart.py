@@ -0,0 +1,139 @@
+"""
+Session-backed shopping cart.
+
+The cart lives in the session (the cache when SESSION_ENGINE is the cache
+backend), so browsing and editing it costs no database writes. It is
+written to Cart/CartItem lazily: at checkout, when an anonymous cart is
+merged at login, at logout, and at most once every CART_PERSIST_INTERVAL
+seconds while it is being edited.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Cart, CartItem, Product
+
+
+def _lines_from_db(user):
+    return {
+        str(product_id): quantity
+        for product_id, quantity in CartItem.objects.filter(cart__user=user).values_list('product_id', 'quantity')
+    }
+
+
+class SessionCart:
+    """Shopping cart stored in the session as {product_id: quantity}."""
+
+    def __init__(self, request, user=None):
+        self.session = request.session
+        # Login signals pass the user; request.user may not be set yet
+        self.user = user or getattr(request, 'user', None)
+        self.session_key = getattr(settings, 'CART_SESSION_ID', 'cart')
+        data = self.session.get(self.session_key)
+        if data is None:
+            data = {'lines': {}, 'user_id': None, 'persisted_at': 0, 'dirty': False}
+            if self._authenticated:
+                # First request of this session: pick up the saved cart once
+                data['lines'] = _lines_from_db(self.user)
+                data['user_id'] = self.user.id
+                data['persisted_at'] = time.time()
+                self.session[self.session_key] = data
+        self.data = data
+        self._items = None
+
+    @property
+    def _authenticated(self):
+        return self.user is not None and self.user.is_authenticated
+
+    @property
+    def lines(self):
+        """Dictionary mapping product IDs to quantities."""
+        return {int(product_id): quantity for product_id, quantity in self.data['lines'].items()}
+
+    def __len__(self):
+        return sum(self.data['lines'].values())
+
+    def __iter__(self):
+        if self._items is None:
+            # One query for all lines, reused until the cart changes
+            lines = self.lines
+            products = Product.objects.select_related('category').in_bulk(list(lines))
+            self._items = [
+                {
+                    'product': products[product_id],
+                    'quantity': quantity,
+                    'price': products[product_id].price,
+                    'total_price': products[product_id].price * quantity,
+                }
+                for product_id, quantity in lines.items() if product_id in products
+            ]
+        return iter(self._items)
+
+    @property
+    def total_price(self):
+        return sum((item['total_price'] for item in self), Decimal('0'))
+
+    def add(self, product_id, quantity=1, override_quantity=False):
+        """Add a product or change its quantity."""
+        key = str(product_id)
+        lines = self.data['lines']
+        lines[key] = quantity if override_quantity else lines.get(key, 0) + quantity
+        if lines[key] <= 0:
+            del lines[key]
+        self._changed()
+
+    def remove(self, product_id):
+        """Remove a product from the cart."""
+        if self.data['lines'].pop(str(product_id), None) is not None:
+            self._changed()
+
+    def clear(self, persist=False):
+        """Empty the cart."""
+        self.data['lines'] = {}
+        self._changed(persist=persist)
+
+    def _changed(self, persist=None):
+        self._items = None
+        self.data['dirty'] = True
+        # Anonymous visitors only get a session once they put something in
+        self.session[self.session_key] = self.data
+        if persist is None:
+            interval = getattr(settings, 'CART_PERSIST_INTERVAL', 300)
+            persist = time.time() - self.data['persisted_at'] >= interval
+        if persist:
+            self.persist()
+
+    def persist(self, force=False):
+        """
+        Write the cart to Cart/CartItem with one upsert and one delete.
+
+        Does nothing for anonymous users or when nothing changed since the
+        last write, unless force is set.
+        """
+        if not self._authenticated or not (self.data['dirty'] or force):
+            return
+        lines = self.lines
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            CartItem.objects.filter(cart=cart).exclude(product_id__in=list(lines)).delete()
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=quantity) for product_id, quantity in lines.items()],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity', 'updated_at'],
+            )
+        self.data['dirty'] = False
+        self.data['persisted_at'] = time.time()
+        self.session.modified = True
+
+    def merge_saved_cart(self):
+        """Add the user's saved cart to an anonymous cart and save the result."""
+        if self.data['user_id'] == self.user.id:
+            return
+        lines = self.data['lines']
+        for product_id, quantity in _lines_from_db(self.user).items():
+            lines[product_id] = lines.get(product_id, 0) + quantity
+        self.data['user_id'] = self.user.id
+        self.persist(force=True)
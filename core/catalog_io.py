@@ -0,0 +1,326 @@
+"""
+Streaming bulk import and export of the product catalog.
+
+Files are CSV (with a header row) or JSON Lines, one product per row with
+the columns in FIELDS; products are matched on slug and categories are
+given by slug. Import reads the file lazily in chunks, validates and
+slugifies them in worker processes (at most a few chunks in flight, so
+memory does not grow with the file) and writes each batch with one
+INSERT ... ON CONFLICT (slug) DO UPDATE; a description or available a row
+leaves out keeps its value on an existing product. With only=('price',
+'stock') rows just update those columns of existing products with
+bulk_update.
+
+Bulk writes skip Product signals, so import creates the missing rating
+summaries, bumps card versions and retires cached catalog pages itself.
+Export streams rows from a server-side cursor on the analytics database.
+"""
+import csv
+import json
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.text import slugify
+
+FIELDS = ('slug', 'name', 'description', 'price', 'stock', 'available', 'category')
+REQUIRED = ('name', 'price', 'stock', 'category')
+# Left out of a row, these keep their value on an existing product
+OPTIONAL = ('description', 'available')
+UPDATABLE = ('price', 'stock', 'available')
+MAX_ERRORS = 100
+
+TRUE = {'1', 'true', 'yes', 'y', 't'}
+FALSE = {'0', 'false', 'no', 'n', 'f'}
+
+
+def detect_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(f, fmt):
+    """Yield (line number, row dict) from an open text file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError as e:
+                    yield line_num, e
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _price(value):
+    try:
+        price = Decimal(str(value).strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'{value!r} is not a number')
+    if not price.is_finite() or not Decimal(0) <= price < Decimal('1e8'):
+        raise ValueError(f'price {value} out of range')
+    return price
+
+
+def _stock(value):
+    stock = int(str(value).strip())
+    if stock < 0:
+        raise ValueError('stock cannot be negative')
+    return stock
+
+
+def _available(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise ValueError(f'available must be true or false, got {value!r}')
+
+
+def _text(limit):
+    def clean(value):
+        text = str(value).strip()
+        if limit and len(text) > limit:
+            raise ValueError(f'longer than {limit} characters')
+        return text
+    return clean
+
+
+PARSERS = {
+    'name': _text(200),
+    'description': _text(None),
+    'price': _price,
+    'stock': _stock,
+    'available': _available,
+    'category': lambda value: slugify(str(value)),
+}
+
+
+def clean_chunk(args):
+    """
+    Validate and normalise a chunk of rows; runs in a worker process.
+
+    Args:
+        args: (list of (line, row), fields to keep, fields that must be set)
+
+    Returns:
+        tuple: (list of cleaned dicts, list of (line, error message))
+    """
+    chunk, fields, required = args
+    cleaned, errors = [], []
+    for line, row in chunk:
+        if not isinstance(row, dict):
+            errors.append((line, f'not a JSON object: {row}'))
+            continue
+        try:
+            product = {'slug': slugify(row.get('slug') or row.get('name') or '')}
+            if not product['slug']:
+                raise ValueError('slug or name is required')
+            for field in fields:
+                value = row.get(field)
+                if value is None or (field != 'description' and str(value).strip() == ''):
+                    if field in required:
+                        raise ValueError(f'{field} is required')
+                    continue
+                try:
+                    product[field] = PARSERS[field](value)
+                except ValueError as e:
+                    raise ValueError(f'invalid {field}: {e}')
+            cleaned.append(product)
+        except ValueError as e:
+            errors.append((line, str(e)))
+    return cleaned, errors
+
+
+def _bounded_map(pool, func, items, in_flight):
+    """Like pool.map, but only submits in_flight items ahead of the consumer."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class CatalogImport:
+    """
+    Upserts cleaned rows batch by batch and keeps the totals.
+
+    Args:
+        only: Update just these columns of existing products
+        create_categories: Create categories missing from the database
+            instead of rejecting their products
+    """
+
+    def __init__(self, only=None, create_categories=False):
+        from .models import Category
+
+        self.only = tuple(only) if only else None
+        self.create_categories = create_categories
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.written = 0
+        self.missing = 0
+        self.errors = []
+        self.error_count = 0
+
+    @property
+    def fields(self):
+        return self.only or FIELDS[1:]
+
+    @property
+    def required(self):
+        return self.only or REQUIRED
+
+    def add_errors(self, errors):
+        self.error_count += len(errors)
+        self.errors.extend(errors[:MAX_ERRORS - len(self.errors)])
+
+    def write(self, rows):
+        """Write one batch of cleaned rows in a transaction."""
+        # The last row for a slug wins, and a statement may touch a row once
+        rows = list({row['slug']: row for row in rows}.values())
+        if self.only:
+            self._update(rows)
+        else:
+            rows = self._resolve_categories(rows)
+            self._upsert(rows)
+
+    def _resolve_categories(self, rows):
+        from .models import Category
+
+        missing = {row['category'] for row in rows} - set(self.categories)
+        if missing and self.create_categories:
+            Category.objects.bulk_create(
+                [Category(slug=slug, name=slug.replace('-', ' ').title()) for slug in sorted(missing)],
+                ignore_conflicts=True,
+            )
+            self.categories.update(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+            missing = set()
+        if missing:
+            self.add_errors([(None, f'unknown category "{row["category"]}" for {row["slug"]}')
+                             for row in rows if row['category'] in missing])
+            rows = [row for row in rows if row['category'] not in missing]
+        return rows
+
+    def _upsert(self, rows):
+        from .models import Product, ProductRating
+
+        # One statement per set of optional columns the rows supplied
+        groups = defaultdict(list)
+        for row in rows:
+            groups[tuple(field for field in OPTIONAL if field in row)].append(row)
+        with transaction.atomic():
+            for supplied, group in groups.items():
+                Product.objects.bulk_create(
+                    [
+                        Product(
+                            slug=row['slug'], name=row['name'], description=row.get('description', ''),
+                            price=row['price'], stock=row['stock'], available=row.get('available', True),
+                            category_id=self.categories[row['category']],
+                        )
+                        for row in group
+                    ],
+                    update_conflicts=True, unique_fields=['slug'],
+                    update_fields=['name', *supplied, 'price', 'stock', 'category', 'updated_at'],
+                )
+            ids = list(Product.objects.filter(slug__in=[row['slug'] for row in rows]).values_list('id', flat=True))
+            ProductRating.objects.bulk_create([ProductRating(product_id=pk) for pk in ids], ignore_conflicts=True)
+            ProductRating.objects.filter(product_id__in=ids).update(version=F('version') + 1)
+        self.written += len(ids)
+
+    def _update(self, rows):
+        from .models import Product, ProductRating
+
+        ids = dict(Product.objects.filter(slug__in=[row['slug'] for row in rows]).values_list('slug', 'id'))
+        products = [Product(pk=ids[row['slug']], **{field: row[field] for field in self.only})
+                    for row in rows if row['slug'] in ids]
+        self.missing += len(rows) - len(products)
+        with transaction.atomic():
+            Product.objects.bulk_update(products, self.only)
+            ProductRating.objects.filter(product_id__in=[p.pk for p in products]).update(version=F('version') + 1)
+        self.written += len(products)
+
+
+def import_catalog(f, fmt, batch_size=5000, workers=None, only=None, create_categories=False, progress=None):
+    """
+    Stream a catalog file into the database.
+
+    Args:
+        f: Open text file
+        fmt: 'csv' or 'jsonl'
+        batch_size: Rows validated per task and written per statement
+        workers: Validation processes; 0 validates in this process
+        only: Only update these columns (subset of UPDATABLE)
+        create_categories: Create unknown categories
+        progress: Called with the CatalogImport after every batch
+
+    Returns:
+        CatalogImport: Totals and the first MAX_ERRORS errors
+    """
+    from .fragments import bump_catalog_version
+
+    if only and not set(only) <= set(UPDATABLE):
+        raise ValueError(f'Only {", ".join(UPDATABLE)} can be updated on their own')
+    catalog = CatalogImport(only, create_categories)
+    tasks = ((chunk, catalog.fields, catalog.required) for chunk in _chunks(read_rows(f, fmt), batch_size))
+
+    def consume(results):
+        for cleaned, errors in results:
+            catalog.add_errors(errors)
+            catalog.write(cleaned)
+            if progress:
+                progress(catalog)
+
+    if workers == 0:
+        consume(map(clean_chunk, tasks))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            consume(_bounded_map(pool, clean_chunk, tasks, 2 * workers))
+    bump_catalog_version()
+    return catalog
+
+
+def export_catalog(f, fmt, chunk_size=5000):
+    """
+    Write every product to f; returns the number of rows.
+
+    Rows come from a server-side cursor (on databases that have them), so
+    memory use does not depend on the size of the catalog.
+    """
+    from . import routers
+    from .models import Product
+
+    columns = ('slug', 'name', 'description', 'price', 'stock', 'available', 'category__slug')
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+    with routers.analytics():
+        rows = Product.objects.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(FIELDS, row)), default=str) + '\n')
+            count += 1
+    return count
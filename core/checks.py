@@ -0,0 +1,29 @@
+"""
+System checks of the core app.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Refuse a per-process default cache in a deployment (check --deploy).
+
+    SingleFlight locks, task deduplication keys and periodic turns are
+    taken in the default cache; in a cache each process keeps to itself
+    every process takes them at once.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'The default cache ({backend}) is not shared between processes.',
+        hint='Set CACHE_URL to a Redis server, or configure another shared cache as CACHES["default"].',
+        id='core.E001',
+    )]
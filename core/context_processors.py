@@ -1,18 +1,22 @@
-""
+"""
 Context processors for the core application.
 """
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
-from .views.recommendations import get_recommendations
+from .cart import SessionCart
 
 def recommendations(request):
-    ""
+    """
     Add recommendations to the template context for authenticated users.
     """
     context = {}
     
     if request.user.is_authenticated:
+        # Imported here so rendering a template does not load the views
+        # (and nothing else) unless recommendations are actually shown
+        from .views.recommendations import get_recommendations
+
         # Cache recommendations for 1 hour (3600 seconds)
         @method_decorator(cache_page(3600))
         def get_cached_recommendations():
@@ -28,3 +32,14 @@ def recommendations(request):
             context['recommended_products'] = []
     
     return context
+
+def cart(request):
+    """
+    Add the session cart to the template context.
+
+    Only its length is shown on most pages, which is read from the session
+    without touching the database.
+    """
+    if not hasattr(request, 'session'):
+        return {}
+    return {'cart': SessionCart(request)}
@@ -0,0 +1,328 @@
+"""
+Write-behind buffering of review like/dislike counters.
+
+Votes only touch a buffer on the request path. Pending deltas are written to
+the Review table periodically, one batched UPDATE per flush, so a popular
+review no longer serializes every voter on its row lock.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Review
+from .review_feed import helpfulness_expression
+
+logger = logging.getLogger(__name__)
+
+VOTE_FIELDS = {'like': 'likes', 'dislike': 'dislikes'}
+
+
+class SeenSet:
+    """Bloom filter of (review, user) pairs, used to reject duplicate votes."""
+
+    def __init__(self, size_bits=1 << 23, hashes=4):
+        self.size = size_bits
+        self.hashes = hashes
+        self.bits = bytearray(size_bits // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 8:(i + 1) * 8], 'little') % self.size
+
+    def add(self, key):
+        """Add a key, returning False if it was (probably) present already."""
+        added = False
+        with self._lock:
+            for pos in self._positions(key):
+                byte, bit = divmod(pos, 8)
+                if not self.bits[byte] & (1 << bit):
+                    self.bits[byte] |= 1 << bit
+                    added = True
+        return added
+
+
+class VoteBuffer:
+    """Base class for vote counter buffers."""
+
+    def __init__(self, flush_interval=5.0, batch_size=500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    def first_vote(self, review_id, user_id):
+        """Record that a user voted on a review, False if they already had."""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def add(self, review_id, field, delta=1):
+        """Add a delta to a review's pending counter."""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def pending(self, review_ids):
+        """Return {review_id: {field: delta}} for deltas not yet written."""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def drain(self):
+        """Take every pending delta out of the buffer."""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def vote(self, review_id, user_id, vote):
+        """
+        Buffer a like or dislike.
+
+        Args:
+            review_id: ID of the review being voted on
+            user_id: ID of the voting user
+            vote: Either 'like' or 'dislike'
+
+        Returns:
+            bool: False if the user had already voted on this review
+        """
+        field = VOTE_FIELDS[vote]
+        if not self.first_vote(review_id, user_id):
+            return False
+        self.add(review_id, field)
+        self.start_flusher()
+        return True
+
+    def merge(self, reviews):
+        """Add pending deltas to the counters of already loaded reviews."""
+        reviews = list(reviews)
+        pending = self.pending([review.id for review in reviews])
+        for review in reviews:
+            for field, delta in pending.get(review.id, {}).items():
+                setattr(review, field, getattr(review, field) + delta)
+        return reviews
+
+    def flush(self):
+        """
+        Write pending deltas to the database.
+
+        Returns:
+            int: Number of reviews updated
+        """
+        deltas = self.drain()
+        if not deltas:
+            return 0
+        try:
+            write_deltas(deltas, self.batch_size)
+        except Exception:
+            # Put the votes back so the next flush retries them
+            for review_id, fields in deltas.items():
+                for field, delta in fields.items():
+                    self.add(review_id, field, delta)
+            raise
+        return len(deltas)
+
+    def start_flusher(self):
+        """Start the background thread that flushes on an interval."""
+        if self._flusher is not None or not self.flush_interval:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_forever, name='review-vote-flusher', daemon=True
+                )
+                self._flusher.start()
+                atexit.register(self._flush_quietly)
+
+    def _flush_forever(self):
+        stopped = threading.Event()
+        while not stopped.wait(self.flush_interval):
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing review votes failed")
+
+
+class LocalVoteBuffer(VoteBuffer):
+    """
+    Keeps pending votes in this process; for single-process servers and tests.
+
+    Duplicate votes are only caught per process and best-effort: the seen
+    set lives in this process's memory and is lost on restart, so with
+    several workers the same user's second vote can be counted by another
+    one. Use CacheVoteBuffer where that matters.
+    """
+
+    def __init__(self, seen_bits=1 << 23, **kwargs):
+        super().__init__(**kwargs)
+        self.seen = SeenSet(seen_bits)
+        self._deltas = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def first_vote(self, review_id, user_id):
+        return self.seen.add(f'{review_id}:{user_id}')
+
+    def add(self, review_id, field, delta=1):
+        with self._lock:
+            self._deltas[review_id][field] += delta
+
+    def pending(self, review_ids):
+        with self._lock:
+            return {
+                review_id: dict(self._deltas[review_id])
+                for review_id in review_ids if review_id in self._deltas
+            }
+
+    def drain(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(lambda: defaultdict(int))
+        return {review_id: dict(fields) for review_id, fields in deltas.items()}
+
+
+class CacheVoteBuffer(VoteBuffer):
+    """
+    Keeps pending votes, and who already voted, in a shared cache.
+
+    Counters are changed with atomic incr. The first vote on a review since
+    it was last flushed also appends the review to a journal in the cache (a
+    sequence number and one key per entry), so whichever process flushes
+    finds every review with pending votes, including those counted by a
+    process that has since died.
+    """
+    prefix = 'review-votes'
+
+    def __init__(self, alias='default', seen_timeout=None, dirty_timeout=24 * 3600, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = caches[alias]
+        self.seen_timeout = seen_timeout
+        self.dirty_timeout = dirty_timeout
+
+    def _key(self, review_id, field):
+        return f'{self.prefix}:{review_id}:{field}'
+
+    def _incr(self, key, delta=1):
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            if self.cache.add(key, delta, timeout=None):
+                return delta
+            return self.cache.incr(key, delta)
+
+    def first_vote(self, review_id, user_id):
+        digest = hashlib.blake2b(f'{review_id}:{user_id}'.encode(), digest_size=8).hexdigest()
+        return self.cache.add(f'{self.prefix}:seen:{digest}', 1, timeout=self.seen_timeout)
+
+    def add(self, review_id, field, delta=1):
+        self._incr(self._key(review_id, field), delta)
+        # The flag is only cleared by the flush that reads this review, so
+        # a review is journaled once per flush however many votes it gets
+        if self.cache.add(f'{self.prefix}:dirty:{review_id}', 1, timeout=self.dirty_timeout):
+            entry = self._incr(f'{self.prefix}:journal')
+            self.cache.set(f'{self.prefix}:journal:{entry}', review_id, timeout=self.dirty_timeout)
+
+    def pending(self, review_ids):
+        keys = {
+            self._key(review_id, field): (review_id, field)
+            for review_id in review_ids for field in VOTE_FIELDS.values()
+        }
+        pending = defaultdict(dict)
+        for key, value in self.cache.get_many(keys).items():
+            if value:
+                review_id, field = keys[key]
+                pending[review_id][field] = value
+        return dict(pending)
+
+    def _dirty(self):
+        """Take the reviews journaled since the last flush off the journal."""
+        head_key, retry_key = f'{self.prefix}:journal-head', f'{self.prefix}:journal-retry'
+        head = self.cache.get(head_key, 0)
+        end = self.cache.get(f'{self.prefix}:journal', 0)
+        if end < head:
+            # The sequence was evicted and started over
+            head = 0
+        retry = self.cache.get(retry_key, [])
+        entries = {f'{self.prefix}:journal:{entry}': entry for entry in retry + list(range(head + 1, end + 1))}
+        found = self.cache.get_many(entries)
+        # An entry's number is taken before the entry is written, so one
+        # not written yet is looked for again (once) by the next flush
+        missing = [entry for key, entry in entries.items() if key not in found and entry not in retry]
+        self.cache.set_many({head_key: end, retry_key: missing}, timeout=None)
+        review_ids = set(found.values())
+        # Clear the flags before reading the counters: a vote arriving
+        # after this journals its review again
+        self.cache.delete_many(list(found) + [f'{self.prefix}:dirty:{review_id}' for review_id in review_ids])
+        return review_ids
+
+    def drain(self):
+        lock_key = f'{self.prefix}:flush-lock'
+        if not self.cache.add(lock_key, 1, timeout=60):
+            # Another process is flushing, try again next interval
+            return {}
+        try:
+            dirty = self._dirty()
+            if not dirty:
+                return {}
+            deltas = self.pending(dirty)
+            for review_id, fields in deltas.items():
+                for field, value in fields.items():
+                    # Only take what was read; votes that arrived since stay
+                    self.cache.decr(self._key(review_id, field), value)
+            return deltas
+        finally:
+            self.cache.delete(lock_key)
+
+
+def write_deltas(deltas, batch_size=500):
+    """
+    Apply counter deltas with one UPDATE per batch of reviews.
+
+    Args:
+        deltas: Dictionary mapping review IDs to {field: delta} dictionaries
+        batch_size: Maximum number of reviews per UPDATE statement
+    """
+    review_ids = sorted(deltas)
+    for start in range(0, len(review_ids), batch_size):
+        batch = review_ids[start:start + batch_size]
+        changes = {}
+        for field in VOTE_FIELDS.values():
+            whens = [
+                When(pk=review_id, then=Value(deltas[review_id][field]))
+                for review_id in batch if deltas[review_id].get(field)
+            ]
+            if whens:
+                changes[field] = F(field) + Case(*whens, default=Value(0), output_field=IntegerField())
+        if changes:
+            # SET expressions read the old counters, so the score is given the new ones
+            changes['helpfulness'] = helpfulness_expression(
+                changes.get('likes', F('likes')), changes.get('dislikes', F('dislikes'))
+            )
+            Review.objects.filter(pk__in=batch).update(**changes)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """Return the process-wide vote buffer configured in settings."""
+    global _buffer
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = {
+                    'flush_interval': getattr(settings, 'REVIEW_VOTE_FLUSH_INTERVAL', 5.0),
+                    'batch_size': getattr(settings, 'REVIEW_VOTE_BATCH_SIZE', 500),
+                }
+                if getattr(settings, 'REVIEW_VOTE_BUFFER', 'local') == 'cache':
+                    _buffer = CacheVoteBuffer(
+                        alias=getattr(settings, 'REVIEW_VOTE_CACHE_ALIAS', 'default'), **options
+                    )
+                    # Flush votes other processes counted even if this one takes none
+                    _buffer.start_flusher()
+                else:
+                    _buffer = LocalVoteBuffer(**options)
+    return _buffer
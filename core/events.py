@@ -0,0 +1,219 @@
+"""
+Buffered ingestion of storefront behavior events.
+
+Views call record(), which appends a tuple to an in-process ring buffer and
+returns; it takes a few microseconds and never touches the database. A
+background thread drains the buffer every EVENT_FLUSH_INTERVAL seconds,
+appends the events to BehaviorEvent with bulk_create and folds the ones
+made by logged-in users into ImplicitScore (EVENT_WEIGHTS per kind), which
+the recommender reads as implicit feedback.
+
+If the buffer fills up faster than it is flushed the oldest events are
+dropped rather than slowing requests down. A batch the database rejects
+goes back to the front of the buffer with the ones after it, to be tried
+again at the next flush.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+
+from .models import BehaviorEvent, ImplicitScore, Product
+
+logger = logging.getLogger(__name__)
+
+KINDS = {
+    'view': BehaviorEvent.VIEW,
+    'cart_add': BehaviorEvent.CART_ADD,
+    'cart_remove': BehaviorEvent.CART_REMOVE,
+    'search': BehaviorEvent.SEARCH,
+    'purchase': BehaviorEvent.PURCHASE,
+}
+DEFAULT_WEIGHTS = {'view': 1.0, 'cart_add': 3.0, 'cart_remove': -2.0, 'purchase': 5.0}
+
+
+class EventBuffer:
+    """Bounded in-process buffer of (timestamp, kind, user, product, session, query) tuples."""
+
+    def __init__(self, capacity=100_000, flush_interval=2.0, batch_size=1000, weights=None):
+        self.events = deque(maxlen=capacity)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.weights = {KINDS[name]: weight for name, weight in (weights or DEFAULT_WEIGHTS).items()}
+        self.dropped = 0
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    def record(self, kind, user_id=None, product_id=None, session_key='', query=''):
+        """Buffer one event; deque.append is atomic, so no lock is taken."""
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((time.time(), kind, user_id, product_id, session_key or '', query[:200]))
+        if self._flusher is None:
+            self.start_flusher()
+
+    def drain(self):
+        """Take up to everything currently buffered, oldest first."""
+        drained = []
+        for _ in range(len(self.events)):
+            try:
+                drained.append(self.events.popleft())
+            except IndexError:
+                break
+        return drained
+
+    def flush(self):
+        """
+        Write buffered events and their implicit scores to the database.
+
+        Returns:
+            int: Number of events written
+        """
+        events = self.drain()
+        if not events:
+            return 0
+        written = 0
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            try:
+                with transaction.atomic():
+                    BehaviorEvent.objects.bulk_create([
+                        BehaviorEvent(
+                            created_at=datetime.fromtimestamp(ts, timezone.utc), kind=kind, user_id=user_id,
+                            product_id=product_id, session_key=session_key, query=query,
+                        )
+                        for ts, kind, user_id, product_id, session_key, query in batch
+                    ])
+                    apply_scores(score_deltas(batch, self.weights))
+            except Exception:
+                logger.exception("Writing behavior events failed; %d kept for the next flush", len(events) - start)
+                self.put_back(events[start:])
+                break
+            written += len(batch)
+        if self.dropped:
+            logger.warning("Event buffer overflowed, %d events dropped", self.dropped)
+            self.dropped = 0
+        return written
+
+    def put_back(self, events):
+        """Return unwritten events to the front of the buffer, oldest first."""
+        # A full buffer makes room by dropping its newest events
+        self.dropped += max(0, len(self.events) + len(events) - self.events.maxlen)
+        self.events.extendleft(reversed(events))
+
+    def start_flusher(self):
+        """Start the background thread that flushes on an interval."""
+        if self._flusher is not None or not self.flush_interval:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_forever, name='event-flusher', daemon=True)
+                self._flusher.start()
+                atexit.register(self._flush_quietly)
+
+    def _flush_forever(self):
+        stopped = threading.Event()
+        while not stopped.wait(self.flush_interval):
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing behavior events failed")
+
+
+def score_deltas(events, weights):
+    """Sum event weights per (user_id, product_id) for logged-in users."""
+    deltas = defaultdict(float)
+    for _, kind, user_id, product_id, _, _ in events:
+        weight = weights.get(kind)
+        if weight and user_id and product_id:
+            deltas[user_id, product_id] += weight
+    return deltas
+
+
+def apply_scores(deltas):
+    """
+    Add score deltas to ImplicitScore with one insert and one UPDATE.
+
+    Args:
+        deltas: Dictionary mapping (user_id, product_id) to a score delta
+    """
+    if not deltas:
+        return
+    # Skip users and products deleted since the event was recorded
+    users = set(User.objects.filter(pk__in={u for u, _ in deltas}).values_list('pk', flat=True))
+    products = set(Product.objects.filter(pk__in={p for _, p in deltas}).values_list('pk', flat=True))
+    deltas = {key: delta for key, delta in deltas.items() if key[0] in users and key[1] in products}
+    if not deltas:
+        return
+
+    ImplicitScore.objects.bulk_create(
+        [ImplicitScore(user_id=u, product_id=p) for u, p in deltas], ignore_conflicts=True
+    )
+    ids = {
+        (u, p): pk for pk, u, p in ImplicitScore.objects.filter(
+            user_id__in={u for u, _ in deltas}, product_id__in={p for _, p in deltas}
+        ).values_list('pk', 'user_id', 'product_id')
+    }
+    whens = [When(pk=ids[key], then=Value(delta)) for key, delta in deltas.items() if key in ids]
+    ImplicitScore.objects.filter(pk__in=[ids[key] for key in deltas if key in ids]).update(
+        score=F('score') + Case(*whens, default=Value(0.0), output_field=FloatField())
+    )
+
+
+def implicit_rating(score):
+    """Map an implicit score onto the 1-4 scale used for purchases by the recommender."""
+    return min(4.0, 1.0 + math.log1p(max(score, 0.0)))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_event_buffer():
+    """Return the process-wide event buffer configured in settings."""
+    global _buffer
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = EventBuffer(
+                    capacity=getattr(settings, 'EVENT_BUFFER_SIZE', 100_000),
+                    flush_interval=getattr(settings, 'EVENT_FLUSH_INTERVAL', 2.0),
+                    batch_size=getattr(settings, 'EVENT_BATCH_SIZE', 1000),
+                    weights=getattr(settings, 'EVENT_WEIGHTS', None),
+                )
+    return _buffer
+
+
+def record(request, kind, product_id=None, query=''):
+    """
+    Record a behavior event for the current request.
+
+    Args:
+        request: Current request, used for the user and session
+        kind: One of the BehaviorEvent kinds
+        product_id: Product the event is about, if any
+        query: Search terms, for SEARCH events
+    """
+    if not getattr(settings, 'EVENTS_ENABLED', True):
+        return
+    user = getattr(request, 'user', None)
+    session = getattr(request, 'session', None)
+    get_event_buffer().record(
+        kind,
+        user.id if user is not None and user.is_authenticated else None,
+        product_id,
+        session.session_key if session is not None else '',
+        query,
+    )
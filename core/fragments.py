@@ -0,0 +1,138 @@
+"""
+Fragment and page caching for catalog pages.
+
+Product cards are cached under a key that contains the product's card
+version (ProductRating.version, bumped from Product and Review signals).
+The version is loaded with the product itself, so a page of cards costs a
+single cache get_many and only the cards that changed are re-rendered.
+
+Cached HTML never contains a CSRF token; forms use a placeholder that is
+filled in per request when the HTML is served.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from . import metrics
+
+CSRF_PLACEHOLDER = '<!--csrf-token-->'
+CATALOG_VERSION_KEY = 'catalog-version'
+
+
+def _cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def fill_csrf(html, request):
+    """Replace CSRF placeholders with a hidden input for this request."""
+    if CSRF_PLACEHOLDER not in html:
+        return html
+    field = format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request))
+    return html.replace(CSRF_PLACEHOLDER, field)
+
+
+def card_key(product, template_name):
+    """Cache key of a product card, or None if the product has no version yet."""
+    summary = getattr(product, 'rating_summary', None)
+    if summary is None:
+        return None
+    return f'product-card:{template_name}:{product.id}:{summary.version}'
+
+
+def render_product_cards(products, request=None, template_name='includes/product_card.html'):
+    """
+    Render a card for each product, reusing cached cards where possible.
+
+    Products should be loaded with select_related('rating_summary').
+
+    Args:
+        products: Iterable of Product instances
+        request: Current request, used to fill in CSRF tokens
+        template_name: Card template
+
+    Returns:
+        list: Safe HTML strings, one per product, in order
+    """
+    cache = _cache()
+    products = list(products)
+    keys = [card_key(product, template_name) for product in products]
+    cached = cache.get_many([key for key in keys if key])
+    metrics.record_cache(hits=len(cached), misses=len(products) - len(cached))
+
+    cards, fresh = [], {}
+    for product, key in zip(products, keys):
+        html = cached.get(key) if key else None
+        if html is None:
+            html = render_to_string(template_name, {'product': product, 'csrf_placeholder': CSRF_PLACEHOLDER})
+            if key:
+                fresh[key] = html
+        cards.append(html)
+    if fresh:
+        cache.set_many(fresh, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 86400))
+
+    if request is not None and not getattr(request, '_defer_csrf', False):
+        cards = [fill_csrf(html, request) for html in cards]
+    return [mark_safe(html) for html in cards]
+
+
+def catalog_version():
+    """Current catalog version; changes whenever any product card does."""
+    cache = _cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog page."""
+    cache = _cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def cache_anonymous_page(timeout=None):
+    """
+    Cache a GET view's full response for visitors without a session.
+
+    Anyone with a session (logged in, a cart or pending messages) gets the
+    view rendered as usual. Entries are keyed by the catalog version, so a
+    product or review change retires them all at once.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD')
+                or settings.SESSION_COOKIE_NAME in request.COOKIES
+                or 'messages' in request.COOKIES
+                or request.user.is_authenticated
+            ):
+                return view(request, *args, **kwargs)
+
+            cache = _cache()
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'catalog-page:{catalog_version()}:{path}'
+            html = cache.get(key)
+            metrics.record_cache(hits=html is not None, misses=html is None)
+            if html is None:
+                # Leave placeholders in the HTML that goes into the cache
+                request._defer_csrf = True
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming or response.cookies:
+                    return response
+                html = response.content.decode(response.charset)
+                cache.set(key, html, timeout if timeout is not None else getattr(settings, 'CATALOG_PAGE_CACHE_TIMEOUT', 300))
+            return HttpResponse(fill_csrf(html, request))
+        return wrapped
+    return decorator
@@ -0,0 +1,186 @@
+"""
+Inventory reservation engine for checkout.
+
+Stock is never read, modified and written back. Each line is taken with a
+conditional ``UPDATE ... SET stock = stock - q WHERE stock >= q``, all lines
+of a cart in one transaction and in product id order, so concurrent buyers
+cannot oversell and cannot deadlock each other.
+"""
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    """Raised when a product cannot cover the requested quantity."""
+
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f"Not enough stock for product {product_id} (wanted {quantity})")
+
+
+def _run_atomic(func, attempts=5):
+    """
+    Run func in a transaction, retrying if it hit a lock conflict.
+
+    SQLite refuses to upgrade a read transaction to a write one while another
+    writer is active, and PostgreSQL can pick a deadlock victim; both surface
+    as OperationalError and the transaction can simply be run again.
+    """
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return func()
+        except OperationalError:
+            if attempt == attempts - 1 or transaction.get_connection().in_atomic_block:
+                raise
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+
+
+def _merge_lines(lines):
+    """Collapse (product_id, quantity) pairs into a sorted list of totals."""
+    totals = defaultdict(int)
+    for product_id, quantity in lines:
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        totals[product_id] += quantity
+    # Always lock rows in the same order to avoid deadlocks between carts
+    return sorted(totals.items())
+
+
+def take_stock(lines):
+    """
+    Atomically decrement stock for every line, or for none of them.
+
+    Must be called inside a transaction.
+
+    Args:
+        lines: Iterable of (product_id, quantity) pairs
+
+    Raises:
+        InsufficientStock: If any product cannot cover its quantity
+    """
+    for product_id, quantity in _merge_lines(lines):
+        updated = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+            stock=F('stock') - quantity
+        )
+        if not updated:
+            raise InsufficientStock(product_id, quantity)
+
+
+def return_stock(lines):
+    """Put stock back for (product_id, quantity) pairs, in lock order."""
+    for product_id, quantity in _merge_lines(lines):
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity)
+
+
+def reserve(lines, ttl=None):
+    """
+    Hold stock for a checkout.
+
+    Args:
+        lines: Iterable of (product_id, quantity) pairs
+        ttl: Seconds before the reservation expires back into stock
+
+    Returns:
+        uuid.UUID: Token identifying the reservation
+
+    Raises:
+        InsufficientStock: If any product cannot cover its quantity
+    """
+    if ttl is None:
+        ttl = getattr(settings, 'INVENTORY_RESERVATION_TTL', 900)
+    lines = _merge_lines(lines)
+    token = uuid.uuid4()
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+
+    def hold():
+        take_stock(lines)
+        StockReservation.objects.bulk_create([
+            StockReservation(token=token, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in lines
+        ])
+
+    _run_atomic(hold)
+    return token
+
+
+def commit(token):
+    """
+    Turn a reservation into a sale; the stock stays taken.
+
+    Returns:
+        dict: Mapping of product IDs to committed quantities, empty if the
+        reservation is unknown or has already expired
+    """
+    reservations = _claim(StockReservation.objects.filter(token=token, expires_at__gt=timezone.now()))
+    return {r.product_id: r.quantity for r in reservations}
+
+
+def release(token):
+    """Cancel an uncommitted reservation and return its stock."""
+    return len(_claim(StockReservation.objects.filter(token=token), restock=True))
+
+
+def release_expired(now=None, batch_size=500):
+    """
+    Return stock held by reservations that expired without being committed.
+
+    Returns:
+        int: Number of reservations released
+    """
+    expired = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    released = 0
+    while True:
+        count = len(_claim(expired, restock=True, limit=batch_size))
+        released += count
+        if count < batch_size:
+            return released
+
+
+class _Claimed(Exception):
+    """Another transaction removed some of the rows being claimed."""
+
+
+def _claim(queryset, restock=False, limit=None, attempts=5):
+    """
+    Delete the reservations matched by queryset and return them.
+
+    Rows are read first and then deleted by primary key as the first
+    statement of the transaction, so SQLite takes its write lock up front
+    and PostgreSQL never holds row locks across a read. If a concurrent
+    commit, release or sweep got to any of the rows in between, the whole
+    claim is rolled back and retried with a fresh read.
+    """
+    queryset = queryset.order_by('product_id')
+    if limit is not None:
+        queryset = queryset[:limit]
+
+    for _ in range(attempts):
+        reservations = list(queryset)
+        if not reservations:
+            return reservations
+
+        def take():
+            deleted, _ = StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).delete()
+            if deleted != len(reservations):
+                raise _Claimed
+            if restock:
+                return_stock((r.product_id, r.quantity) for r in reservations)
+
+        try:
+            _run_atomic(take)
+        except _Claimed:
+            continue
+        return reservations
+    raise OperationalError("Reservations kept changing while being claimed")
@@ -0,0 +1,335 @@
+"""
+Asyncio load generator for storefront user journeys.
+
+Each virtual user keeps one HTTP/1.1 keep-alive connection and its own
+cookie jar, and loops over scripted journeys (browsing, shopping, buying)
+with exponentially distributed think time between steps. Every request is
+recorded under the route it exercised, so results can be compared per
+route between runs.
+
+Only the standard library is used: the client speaks just enough HTTP for
+the storefront (Content-Length and chunked bodies, Set-Cookie, no TLS).
+"""
+import asyncio
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlencode, urlsplit
+
+PRODUCT_LINK = re.compile(rb'/products/(\d+)/')
+
+# Routes of core.urls, and the sign in page of django.contrib.auth.urls
+DEFAULT_PATHS = {
+    'home': '/',
+    'product_list': '/products/',
+    'product_detail': '/products/{id}/',
+    'cart_detail': '/cart/',
+    'cart_add': '/cart/add/{id}/',
+    'cart_remove': '/cart/remove/{id}/',
+    'order_create': '/orders/create/',
+    'recommendations': '/recommendations/',
+    'login': '/accounts/login/',
+}
+
+
+class HTTPError(Exception):
+    pass
+
+
+@dataclass
+class Response:
+    status: int
+    headers: dict
+    body: bytes
+
+
+class Client:
+    """Minimal keep-alive HTTP/1.1 client with a cookie jar."""
+
+    def __init__(self, base_url, timeout=30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme != 'http':
+            raise ValueError('Only http:// targets are supported')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = self._writer = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._reader = self._writer = None
+
+    async def request(self, method, path, data=None, headers=None):
+        body = urlencode(data).encode() if data is not None else b''
+        lines = [
+            f'{method} {self.prefix}{path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Connection: keep-alive',
+            'User-Agent: ecommerce-loadtest',
+        ]
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{k}={v}' for k, v in self.cookies.items()))
+        if data is not None:
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+        if body or method == 'POST':
+            lines.append(f'Content-Length: {len(body)}')
+        for name, value in (headers or {}).items():
+            lines.append(f'{name}: {value}')
+        raw = ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+        for attempt in (1, 2):
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout
+                )
+            try:
+                self._writer.write(raw)
+                await self._writer.drain()
+                return await asyncio.wait_for(self._read_response(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server closed an idle keep-alive connection; retry once
+                await self.close()
+                if attempt == 2:
+                    raise
+
+    async def _read_response(self):
+        status_line = await self._reader.readuntil(b'\r\n')
+        parts = status_line.split(b' ', 2)
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+            raise HTTPError(f'Bad status line: {status_line!r}')
+        status = int(parts[1])
+
+        headers = {}
+        while True:
+            line = await self._reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                cookie = value.split(';', 1)[0]
+                key, _, cookie_value = cookie.partition('=')
+                if cookie_value and 'max-age=0' not in value.lower():
+                    self.cookies[key.strip()] = cookie_value
+                else:
+                    self.cookies.pop(key.strip(), None)
+            else:
+                headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    await self._reader.readuntil(b'\r\n')
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await self._reader.readexactly(int(headers['content-length']))
+        elif status in (204, 304):
+            body = b''
+        else:
+            body = await self._reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return Response(status, headers, body)
+
+
+@dataclass
+class Sample:
+    """One request; status is negated (or 0) when the request failed."""
+    route: str
+    status: int
+    latency: float
+
+
+@dataclass
+class Run:
+    """Shared state of one load test run."""
+    paths: dict
+    think_time: float
+    deadline: float
+    credentials: list = field(default_factory=list)
+    product_ids: list = field(default_factory=list)
+    samples: list = field(default_factory=list)
+    rng: random.Random = field(default_factory=random.Random)
+
+
+class Journey:
+    """One virtual user's scripted session."""
+
+    def __init__(self, run, client):
+        self.run = run
+        self.client = client
+        self.rng = run.rng
+        # The session cookie alone is no sign of it: anonymous carts set one too
+        self.logged_in = False
+
+    async def step(self, route, method='GET', data=None, **params):
+        if time.monotonic() >= self.run.deadline:
+            raise asyncio.CancelledError
+        path = self.run.paths[route].format(**params)
+        headers = {}
+        if method == 'POST':
+            headers['X-CSRFToken'] = self.client.cookies.get('csrftoken', '')
+            data = {'csrfmiddlewaretoken': self.client.cookies.get('csrftoken', ''), **(data or {})}
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, data, headers)
+            status = response.status
+        except (OSError, asyncio.TimeoutError, HTTPError, asyncio.IncompleteReadError):
+            response, status = None, 0
+        # Anything but a page or a redirect (0: no response at all) is an error,
+        # and so is being sent to sign in
+        ok = 200 <= status < 400
+        if ok and route != 'login' and self._to_login(response):
+            ok = False
+            self.logged_in = False
+        self.run.samples.append(Sample(route, status if ok else -abs(status), time.perf_counter() - start))
+        if response is not None and route in ('home', 'product_list'):
+            found = {int(pid) for pid in PRODUCT_LINK.findall(response.body)}
+            if found and len(self.run.product_ids) < 10_000:
+                self.run.product_ids.extend(found - set(self.run.product_ids))
+        if self.run.think_time:
+            await asyncio.sleep(self.rng.expovariate(1 / self.run.think_time))
+        return response
+
+    def _to_login(self, response):
+        location = response.headers.get('location')
+        return location is not None and urlsplit(location).path == self.client.prefix + self.run.paths['login']
+
+    def product(self):
+        ids = self.run.product_ids
+        # Favour the first products listed, as real traffic does
+        return ids[min(int(self.rng.paretovariate(1.2)) - 1, len(ids) - 1)] if ids else None
+
+    async def browse(self):
+        await self.step('home')
+        await self.step('product_list')
+        for _ in range(self.rng.randint(1, 4)):
+            if self.product() is not None:
+                await self.step('product_detail', id=self.product())
+
+    async def shop(self):
+        await self.browse()
+        added = []
+        for _ in range(self.rng.randint(1, 3)):
+            product = self.product()
+            if product is not None:
+                await self.step('cart_add', 'POST', {'quantity': 1}, id=product)
+                added.append(product)
+        await self.step('cart_detail')
+        if added and self.rng.random() < 0.3:
+            await self.step('cart_remove', 'POST', id=added[0])
+            await self.step('cart_detail')
+
+    async def buy(self):
+        if not self.run.credentials:
+            return await self.shop()
+        if not self.logged_in:
+            username, password = self.rng.choice(self.run.credentials)
+            await self.step('login')
+            response = await self.step('login', 'POST', {'username': username, 'password': password})
+            # A failed sign in shows the form again; a successful one redirects
+            self.logged_in = response is not None and 300 <= response.status < 400
+        await self.shop()
+        await self.step('order_create')
+        await self.step('order_create', 'POST', {
+            'first_name': 'Load', 'last_name': 'Test', 'email': 'loadtest@example.com',
+            'address': '1 Test Street', 'postal_code': '00000', 'city': 'Testville',
+        })
+        await self.step('recommendations')
+
+
+async def virtual_user(run, base_url, mix):
+    client = Client(base_url)
+    journey = Journey(run, client)
+    names, weights = zip(*mix.items())
+    try:
+        while time.monotonic() < run.deadline:
+            await getattr(journey, run.rng.choices(names, weights)[0])()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await client.close()
+
+
+async def run_load(base_url, concurrency, duration, mix, think_time=1.0, ramp_up=0.0,
+                   credentials=None, paths=None, seed=None):
+    """
+    Run journeys from concurrency virtual users for duration seconds.
+
+    Args:
+        base_url: Server to test, e.g. http://127.0.0.1:8000
+        concurrency: Number of simulated users
+        duration: Seconds to run for
+        mix: Dictionary mapping journey names (browse, shop, buy) to weights
+        think_time: Mean pause between steps in seconds
+        ramp_up: Seconds over which to start the users
+        credentials: List of (username, password) pairs for the buy journey
+        paths: Overrides for DEFAULT_PATHS
+        seed: Seed for journey choices
+
+    Returns:
+        tuple: (list of Sample, elapsed seconds)
+    """
+    run = Run(
+        paths={**DEFAULT_PATHS, **(paths or {})},
+        think_time=think_time,
+        deadline=time.monotonic() + duration,
+        credentials=list(credentials or []),
+        rng=random.Random(seed),
+    )
+    started = time.perf_counter()
+
+    async def delayed(i):
+        if ramp_up:
+            await asyncio.sleep(ramp_up * i / concurrency)
+        await virtual_user(run, base_url, mix)
+
+    await asyncio.gather(*(delayed(i) for i in range(concurrency)))
+    return run.samples, time.perf_counter() - started
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """Requests/sec and latency percentiles (ms) per route and overall."""
+    def stats(group):
+        latencies = sorted(s.latency * 1000 for s in group)
+        return {
+            'requests': len(group),
+            'errors': sum(1 for s in group if s.status <= 0),
+            'rps': round(len(group) / elapsed, 2) if elapsed else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        }
+
+    routes = {}
+    for sample in samples:
+        routes.setdefault(sample.route, []).append(sample)
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'total': stats(samples),
+        'routes': {route: stats(group) for route, group in sorted(routes.items())},
+    }
@@ -0,0 +1,27 @@
+"""
+Build the "frequently bought together" index.
+---------------------------------------------
+Reads the orders placed since the last run (or all of them with --full),
+updates the stored co-occurrence counts and rewrites the memory-mapped
+lookup table read by the product page. Run it from cron; checkouts also
+trigger it every BASKET_UPDATE_INTERVAL seconds.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import baskets
+
+
+class Command(BaseCommand):
+    help = 'Update the frequently bought together index from new orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recount every order from scratch')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products = baskets.update(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed related products for {products} products in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,59 @@
+"""
+Build responsive image renditions for existing product images.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import renditions
+from core.models import Product
+
+
+def _init_worker():
+    # Spawned workers start without Django; forked ones must not share
+    # the parent's database connections.
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate WebP/JPEG renditions for product images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes, defaults to CPU count')
+        parser.add_argument('--batch-size', type=int, default=200, help='Manifests stored per database round trip')
+        parser.add_argument('--force', action='store_true', help='Rebuild renditions that look up to date')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').only('id', 'image', 'image_renditions').order_by('id')
+        jobs = {
+            product.id: product.image.name
+            for product in products.iterator(chunk_size=2000)
+            if options['force'] or renditions.needs_renditions(product)
+        }
+        if not jobs:
+            self.stdout.write(self.style.SUCCESS('All product images have renditions'))
+            return
+
+        connections.close_all()
+        done = failed = 0
+        pending = {}
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = {pool.submit(renditions.render_stored, name): product_id for product_id, name in jobs.items()}
+            for future in as_completed(futures):
+                product_id = futures[future]
+                try:
+                    pending[product_id] = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'Product {product_id}: {exc}')
+                    continue
+                if len(pending) >= options['batch_size']:
+                    done += renditions.save_manifests(pending)
+                    pending = {}
+                    self.stdout.write(f'{done}/{len(jobs)} products')
+        done += renditions.save_manifests(pending)
+
+        self.stdout.write(self.style.SUCCESS(f'Built renditions for {done} products ({failed} failed)'))
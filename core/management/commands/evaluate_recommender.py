@@ -0,0 +1,70 @@
+"""
+Offline evaluation of recommender backends.
+-------------------------------------------
+Splits reviews and purchases by time, fits each backend on the earlier
+part and reports precision@k, recall@k, NDCG@k and coverage on what users
+went on to like or buy, next to fit time and per-call latency, so a
+faster model can be checked for being as good as the one it replaces.
+"""
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.recommendations import evaluation
+
+
+class Command(BaseCommand):
+    help = 'Evaluate recommender backends on a time-based split of reviews and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', action='append', default=[], metavar='NAME',
+                            help=f'{", ".join(evaluation.BACKENDS)} or a dotted class path (repeatable)')
+        parser.add_argument('-k', type=int, default=10, help='Recommendation list length')
+        parser.add_argument('--test-fraction', type=float, default=0.2,
+                            help='Share of interactions, by time, held out for testing')
+        parser.add_argument('--min-rating', type=float, default=4.0,
+                            help='Lowest held-out rating counted as relevant (purchases are 4)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--max-users', type=int, help='Evaluate a random sample of users')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write results to this JSON file')
+
+    def handle(self, *args, **options):
+        if not 0 < options['test_fraction'] < 1:
+            raise CommandError('--test-fraction must be between 0 and 1')
+        backends = options['backend'] or list(evaluation.BACKENDS)
+        split = evaluation.time_split(
+            evaluation.load_timed_interactions(), options['test_fraction'], options['min_rating']
+        )
+        self.stdout.write(
+            f'{len(split.train)} training pairs, {len(split.test)} users with held-out items'
+        )
+
+        results = []
+        for backend in backends:
+            try:
+                results.append(evaluation.evaluate(
+                    backend, split, k=options['k'], workers=options['workers'],
+                    max_users=options['max_users'], seed=options['seed'],
+                ))
+            except (ImportError, AttributeError) as e:
+                raise CommandError(f'Unknown backend "{backend}": {e}')
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        k = options['k']
+        self.stdout.write(
+            f'{"backend":<24}{"users":>7}{f"P@{k}":>9}{f"R@{k}":>9}{f"NDCG@{k}":>9}{"cover":>8}'
+            f'{"fit s":>9}{"p50 ms":>9}{"p95 ms":>9}'
+        )
+        for r in results:
+            self.stdout.write(
+                f'{r["backend"]:<24}{r["users"]:>7}{r["precision"]:>9.4f}{r["recall"]:>9.4f}{r["ndcg"]:>9.4f}'
+                f'{r["coverage"]:>8.3f}{r["fit_s"]:>9.2f}{r["p50_ms"]:>9.2f}{r["p95_ms"]:>9.2f}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'cutoff': split.cutoff, 'results': results}, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        self.stdout.write(self.style.SUCCESS(f'Evaluated {len(results)} backends'))
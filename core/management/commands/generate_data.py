@@ -0,0 +1,94 @@
+"""
+Generate a production-sized synthetic dataset for load and capacity testing.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import synthetic
+from core.fragments import bump_catalog_version
+from core.models import Category
+from core.ratings import rebuild_summaries
+
+# Reviews, carts and orders only depend on users and products
+PHASES = (('categories',), ('products', 'users'), ('reviews', 'carts', 'orders'))
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create synthetic categories, products, users, reviews, carts and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=200_000)
+        parser.add_argument('--reviews', type=int, default=1_000_000)
+        parser.add_argument('--carts', type=int, default=50_000)
+        parser.add_argument('--orders', type=int, default=500_000)
+        parser.add_argument('--days', type=int, default=730, help='Length of the generated history')
+        parser.add_argument('--end', type=date.fromisoformat, default=None,
+                            help='Last day of the history (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of product popularity')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default=None, help='Slug/username prefix, defaults to synth<seed>')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes, defaults to CPU count')
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        if options['categories'] < 1 or options['products'] < 1 or options['users'] < 1:
+            raise CommandError('At least one category, product and user are needed')
+        if options['carts'] > options['users']:
+            raise CommandError('Each cart needs its own user, so --carts may not exceed --users')
+
+        prefix = options['prefix'] or f'synth{options["seed"]}'
+        if Category.objects.filter(slug__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Data with prefix "{prefix}" already exists, pick another --prefix or --seed')
+
+        plan = synthetic.Plan(
+            seed=options['seed'],
+            categories=options['categories'],
+            products=options['products'],
+            users=options['users'],
+            reviews=options['reviews'],
+            carts=options['carts'],
+            orders=options['orders'],
+            days=options['days'],
+            end=options['end'] or date.today(),
+            prefix=prefix,
+            zipf=options['zipf'],
+        )
+        started = time.perf_counter()
+
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=synthetic.init_worker, initargs=(plan,)
+        ) as pool:
+            created = {}
+            for tables in PHASES:
+                work = [item for table in tables for item in synthetic.chunks(plan, table, options['chunk_size'])]
+                created.update(self._run(pool, work, tables, started))
+
+        synthetic.reset_sequences()
+        for table, count in created.items():
+            if count != plan.counts[table]:
+                self.stdout.write(self.style.WARNING(
+                    f'{table}: {count:,} created of {plan.counts[table]:,} requested'
+                ))
+        self.stdout.write('Rebuilding rating summaries...')
+        rebuild_summaries()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Generated dataset in {time.perf_counter() - started:.1f}s'))
+
+    def _run(self, pool, work, tables, started):
+        created = dict.fromkeys(tables, 0)
+        remaining = len(work)
+        futures = [pool.submit(synthetic.run_chunk, item) for item in work]
+        for future in as_completed(futures):
+            table, rows = future.result()
+            created[table] += rows
+            remaining -= 1
+            progress = ', '.join(f'{name}: {count:,}' for name, count in created.items())
+            self.stdout.write(f'[{time.perf_counter() - started:7.1f}s] {progress} ({remaining} chunks left)')
+        return created
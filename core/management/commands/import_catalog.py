@@ -0,0 +1,65 @@
+"""
+Bulk import products from CSV or JSON Lines.
+--------------------------------------------
+Streams the file, validates rows in worker processes and upserts them in
+batches keyed on slug. Use --only price,stock for a stock and price sync
+of existing products. Invalid rows are reported and skipped.
+"""
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Import or update products from a CSV or JSONL file ("-" for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--only', help=f'Only update these columns: {", ".join(catalog_io.UPDATABLE)}')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create unknown categories instead of rejecting their products')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Validation processes, defaults to CPU count; 0 validates inline')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else catalog_io.detect_format(path))
+        only = [field.strip() for field in options['only'].split(',')] if options['only'] else None
+        started = time.perf_counter()
+
+        def progress(catalog):
+            rate = catalog.written / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f'\r{catalog.written} rows written ({rate:,.0f}/s)', ending='')
+
+        try:
+            f = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+        try:
+            catalog = catalog_io.import_catalog(
+                f, fmt, batch_size=options['batch_size'], workers=options['workers'], only=only,
+                create_categories=options['create_categories'], progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        self.stdout.write('')
+        for line, error in catalog.errors:
+            self.stderr.write(f'line {line}: {error}' if line else error)
+        if catalog.error_count > len(catalog.errors):
+            self.stderr.write(f'... and {catalog.error_count - len(catalog.errors)} more errors')
+        summary = f'{catalog.written} products written in {time.perf_counter() - started:.1f}s'
+        if catalog.missing:
+            summary += f', {catalog.missing} unknown slugs skipped'
+        if catalog.error_count:
+            summary += f', {catalog.error_count} rows rejected'
+        style = self.style.WARNING if catalog.error_count or catalog.missing else self.style.SUCCESS
+        self.stdout.write(style(summary))
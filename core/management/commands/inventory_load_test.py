@@ -0,0 +1,114 @@
+"""
+Concurrency load test for the inventory reservation engine.
+-----------------------------------------------------------
+Runs many simulated checkouts from worker threads against a handful of
+scarce products and verifies that stock is neither oversold nor lost.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from core import inventory
+from core.models import Category, Product, StockReservation
+
+
+class Command(BaseCommand):
+    help = 'Hammer the inventory reservation engine from many threads and check the results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--checkouts', type=int, default=2000)
+        parser.add_argument('--products', type=int, default=5)
+        parser.add_argument('--stock', type=int, default=500)
+        parser.add_argument('--max-lines', type=int, default=3)
+        parser.add_argument('--abandon-rate', type=float, default=0.2,
+                            help='Share of checkouts that release their reservation')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated products')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        category, _ = Category.objects.get_or_create(slug='inventory-load-test', defaults={'name': 'Load Test'})
+        products = [
+            Product.objects.create(
+                name=f'Load test product {i}',
+                slug=f'inventory-load-test-{options["seed"]}-{i}-{time.time_ns()}',
+                description='Generated by inventory_load_test',
+                price=1,
+                category=category,
+                stock=options['stock'],
+            )
+            for i in range(options['products'])
+        ]
+        product_ids = [p.id for p in products]
+
+        # Pre-generate carts so every run with the same seed does the same work
+        carts = [
+            (
+                [(rng.choice(product_ids), rng.randint(1, 3)) for _ in range(rng.randint(1, options['max_lines']))],
+                rng.random() < options['abandon_rate'],
+            )
+            for _ in range(options['checkouts'])
+        ]
+
+        stats = {'sold': 0, 'abandoned': 0, 'rejected': 0, 'errors': 0}
+        sold = {pid: 0 for pid in product_ids}
+
+        def checkout(cart):
+            lines, abandon = cart
+            try:
+                token = inventory.reserve(lines)
+            except inventory.InsufficientStock:
+                return 'rejected', {}
+            except OperationalError:
+                return 'errors', {}
+            if abandon:
+                inventory.release(token)
+                return 'abandoned', {}
+            return 'sold', inventory.commit(token)
+
+        def worker(chunk):
+            results = []
+            try:
+                for cart in chunk:
+                    results.append(checkout(cart))
+            finally:
+                connections.close_all()
+            return results
+
+        chunks = [carts[i::options['threads']] for i in range(options['threads'])]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            for results in pool.map(worker, chunks):
+                for outcome, lines in results:
+                    stats[outcome] += 1
+                    for pid, quantity in lines.items():
+                        sold[pid] += quantity
+        elapsed = time.perf_counter() - started
+
+        final = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'stock'))
+        leftover = StockReservation.objects.filter(product_id__in=product_ids).count()
+        problems = [
+            f'product {pid}: {options["stock"]} - {sold[pid]} sold != {final[pid]} left'
+            for pid in product_ids
+            if options['stock'] - sold[pid] != final[pid]
+        ]
+        if leftover:
+            problems.append(f'{leftover} reservations left behind')
+
+        self.stdout.write(
+            f'{options["checkouts"]} checkouts on {options["threads"]} threads in {elapsed:.2f}s '
+            f'({options["checkouts"] / elapsed * 60:.0f}/min)'
+        )
+        for outcome, count in stats.items():
+            self.stdout.write(f'  {outcome}: {count}')
+
+        if not options['keep']:
+            Product.objects.filter(id__in=product_ids).delete()
+
+        if problems:
+            raise CommandError('Inventory mismatch:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Stock is consistent'))
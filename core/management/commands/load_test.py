@@ -0,0 +1,167 @@
+"""
+HTTP load test of the storefront.
+---------------------------------
+Runs scripted user journeys against a running server (or one it starts)
+and reports requests/sec and latency percentiles per route. Results can
+be saved as JSON and compared with an earlier run. Responses other than
+2xx and 3xx count as errors, and the command fails when more than
+--max-error-rate of the requests were errors.
+"""
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import loadtest
+
+
+def _pairs(value, sep):
+    try:
+        return dict((key.strip(), val.strip()) for key, val in (item.split(sep, 1) for item in value.split(',') if item))
+    except ValueError:
+        raise CommandError(f'Expected a comma separated list of key{sep}value, got "{value}"')
+
+
+class Command(BaseCommand):
+    help = 'Load test storefront journeys over HTTP and report per-route latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--start-server', action='store_true',
+                            help='Start gunicorn (or runserver if gunicorn is missing) on --base-url')
+        parser.add_argument('--server-workers', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=20, help='Simulated users')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run')
+        parser.add_argument('--ramp-up', type=float, default=0.0, help='Seconds over which users start')
+        parser.add_argument('--think-time', type=float, default=1.0, help='Mean pause between steps')
+        parser.add_argument('--mix', default='browse=6,shop=3,buy=1', help='Journey weights')
+        parser.add_argument('--login', action='append', default=[], metavar='USER:PASSWORD',
+                            help='Account used by the buy journey (repeatable)')
+        parser.add_argument('--synthetic-logins', type=int, default=0, metavar='N',
+                            help='Also use the first N users made by generate_data')
+        parser.add_argument('--synthetic-prefix', default='synth0')
+        parser.add_argument('--path', action='append', default=[], metavar='ROUTE=PATH',
+                            help='Override the path of a route, e.g. login=/login/')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--compare', help='Compare with results saved by an earlier run')
+        parser.add_argument('--max-error-rate', type=float, default=0.5,
+                            help='Fail when more than this share of the requests were errors')
+
+    def handle(self, *args, **options):
+        mix = {name: float(weight) for name, weight in _pairs(options['mix'], '=').items()}
+        unknown = set(mix) - {'browse', 'shop', 'buy'}
+        if unknown:
+            raise CommandError(f'Unknown journeys: {", ".join(sorted(unknown))}')
+        paths = _pairs(','.join(options['path']), '=')
+        credentials = [tuple(login.split(':', 1)) for login in options['login']]
+        credentials += [
+            (f'{options["synthetic_prefix"]}-user-{i}', 'password') for i in range(options['synthetic_logins'])
+        ]
+
+        server = self._start_server(options) if options['start_server'] else None
+        try:
+            samples, elapsed = asyncio.run(loadtest.run_load(
+                options['base_url'], options['concurrency'], options['duration'], mix,
+                think_time=options['think_time'], ramp_up=options['ramp_up'],
+                credentials=credentials, paths=paths, seed=options['seed'],
+            ))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+        results = loadtest.summarize(samples, elapsed)
+        results['run'] = {
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'commit': self._commit(),
+            **{key: options[key] for key in ('base_url', 'concurrency', 'duration', 'think_time', 'mix')},
+        }
+        self._report(results, self._load(options['compare']) if options['compare'] else None)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        total = results['total']
+        if not total['requests']:
+            raise CommandError('No requests were made')
+        if total['errors'] > options['max_error_rate'] * total['requests']:
+            raise CommandError(
+                f'{total["errors"]} of {total["requests"]} requests failed, '
+                f'more than --max-error-rate {options["max_error_rate"]:g}'
+            )
+
+    def _report(self, results, previous):
+        header = f'{"route":<18}{"reqs":>8}{"errs":>6}{"rps":>9}{"p50":>9}{"p95":>9}{"p99":>9}'
+        if previous:
+            header += f'{"Δp95":>9}{"Δrps":>8}'
+        self.stdout.write(header)
+        rows = list(results['routes'].items()) + [('TOTAL', results['total'])]
+        for route, stats in rows:
+            line = (
+                f'{route:<18}{stats["requests"]:>8}{stats["errors"]:>6}{stats["rps"]:>9.1f}'
+                f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}'
+            )
+            before = (previous or {}).get('routes', {}).get(route) if route != 'TOTAL' else (previous or {}).get('total')
+            if before:
+                line += f'{_change(before["p95_ms"], stats["p95_ms"]):>9}{_change(before["rps"], stats["rps"]):>8}'
+            self.stdout.write(line)
+        style = self.style.SUCCESS if not results['total']['errors'] else self.style.WARNING
+        self.stdout.write(style(
+            f'{results["total"]["requests"]} requests in {results["elapsed_s"]}s, {results["total"]["errors"]} errors'
+        ))
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def _start_server(self, options):
+        url = urlsplit(options['base_url'])
+        address = f'{url.hostname}:{url.port or 80}'
+        if shutil.which('gunicorn'):
+            command = ['gunicorn', 'ecommerce.wsgi:application', '--bind', address,
+                       '--workers', str(options['server_workers']), '--log-level', 'warning']
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', address, '--noreload']
+        self.stdout.write(f'Starting {" ".join(command)}')
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'Server exited with status {server.returncode}')
+            try:
+                socket.create_connection((url.hostname, url.port or 80), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('Server did not start within 30 seconds')
+
+
+def _change(before, after):
+    if not before:
+        return '-'
+    return f'{(after - before) / before * 100:+.0f}%'
@@ -0,0 +1,63 @@
+"""
+Report where process start-up time goes.
+-----------------------------------------
+Starts a fresh interpreter with ``python -X importtime``, runs one start-up
+stage (Django setup, URLconf import or the full WSGI application including
+the recommender warm-up) and lists the slowest imports, so regressions in
+worker boot and CLI start-up show up before they ship.
+"""
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+STAGES = {
+    'setup': 'import django; django.setup()',
+    'urls': 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns',
+    'wsgi': 'import ecommerce.wsgi',
+}
+
+# Modules that should only be loaded by code that actually needs them
+HEAVY = ('numpy', 'scipy', 'sklearn', 'pandas', 'PIL', 'core.recommendations.recommender')
+
+
+class Command(BaseCommand):
+    help = 'Profile import time of a fresh process for a start-up stage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stage', choices=sorted(STAGES), default='urls')
+        parser.add_argument('--top', type=int, default=25, help='Number of imports to list')
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')}
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STAGES[options['stage']]],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        wall = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f'Stage "{options["stage"]}" failed:\n{result.stderr[-2000:]}')
+
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            imports.append((int(cumulative_us), int(self_us), name.rstrip()))
+        top_level = [entry for entry in imports if not entry[2].startswith('  ')]
+        total = sum(cumulative for cumulative, _, _ in top_level)
+
+        self.stdout.write(f'Stage "{options["stage"]}": {wall:.2f}s wall, {total / 1e6:.2f}s importing {len(imports)} modules')
+        self.stdout.write(f'{"cumulative ms":>14}{"self ms":>10}  module')
+        for cumulative, own, name in sorted(imports, reverse=True)[:options['top']]:
+            self.stdout.write(f'{cumulative / 1000:>14.1f}{own / 1000:>10.1f}  {name.strip()}')
+
+        heavy = sorted({name.strip() for _, _, name in imports} & set(HEAVY))
+        if heavy:
+            self.stdout.write(self.style.WARNING(f'Heavy modules loaded: {", ".join(heavy)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No heavy modules loaded'))
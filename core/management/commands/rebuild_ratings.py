@@ -0,0 +1,17 @@
+"""
+Recompute the denormalized product rating summaries from the Review table.
+"""
+from django.core.management.base import BaseCommand
+
+from core.ratings import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild product rating summaries from existing reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help='Only rebuild these products')
+
+    def handle(self, *args, **options):
+        count = rebuild_summaries(options['product_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rating summaries'))
@@ -0,0 +1,14 @@
+"""
+Return stock held by checkout reservations that were never completed.
+"""
+from django.core.management.base import BaseCommand
+
+from core.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock reservations back into stock'
+
+    def handle(self, *args, **options):
+        count = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Released {count} expired reservations'))
@@ -0,0 +1,88 @@
+"""
+Replay a storm of payment webhooks.
+-----------------------------------
+Uses the stub gateway to pay for unpaid orders with every event delivered
+several times in shuffled order, sends the deliveries from many threads
+(in-process, or over HTTP to a running server with --url), waits for the
+consumer to apply them and checks that every order ended in the state its
+events call for.
+"""
+import secrets
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import DecimalField, F, Sum
+from django.test.utils import override_settings
+
+from core import payments
+from core.loadtest import percentile
+from core.models import Order, PaymentEvent
+from core.payment_stub import StubGateway, deliver
+
+
+class Command(BaseCommand):
+    help = 'Deliver a burst of duplicated, shuffled payment webhooks and check the orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000, help='Unpaid orders to pay for')
+        parser.add_argument('--duplicates', type=int, default=3, help='Deliveries of each event')
+        parser.add_argument('--fail-rate', type=float, default=0.1)
+        parser.add_argument('--refund-rate', type=float, default=0.05)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--url', help='Webhook URL of a running server; deliveries stay in-process without it')
+        parser.add_argument('--secret', help='Webhook secret, STRIPE_WEBHOOK_SECRET by default')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for the consumer')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        secret = options['secret'] or settings.STRIPE_WEBHOOK_SECRET
+        if not secret:
+            if options['url']:
+                raise CommandError('Pass --secret or set STRIPE_WEBHOOK_SECRET to sign for a running server')
+            secret = secrets.token_hex(16)
+
+        orders = list(
+            Order.objects.filter(paid=False, status='pending').order_by('-pk').annotate(
+                total=Sum(F('items__price') * F('items__quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+            ).values_list('pk', 'total')[:options['orders']]
+        )
+        if not orders:
+            raise CommandError('There are no unpaid pending orders to pay for')
+        deliveries, expected = StubGateway(secret).storm(
+            [(pk, total or 0) for pk, total in orders], options['duplicates'],
+            options['fail_rate'], options['refund_rate'], options['seed'],
+        )
+
+        with override_settings(STRIPE_WEBHOOK_SECRET=secret):
+            started = time.perf_counter()
+            results = deliver(deliveries, options['url'], concurrency=options['concurrency'])
+            elapsed = time.perf_counter() - started
+            statuses = Counter(status for status, _ in results)
+            latencies = sorted(seconds * 1000 for _, seconds in results)
+            self.stdout.write(
+                f'{len(deliveries)} deliveries for {len(orders)} orders in {elapsed:.2f}s '
+                f'({len(deliveries) / elapsed:.0f}/s), statuses {dict(statuses)}, '
+                f'p50 {percentile(latencies, 50):.1f}ms p99 {percentile(latencies, 99):.1f}ms'
+            )
+
+            started = time.perf_counter()
+            deadline = time.monotonic() + options['timeout']
+            while PaymentEvent.objects.filter(processed_at__isnull=True, order_id__in=expected).exists():
+                if time.monotonic() > deadline:
+                    raise CommandError(f'Events still pending after {options["timeout"]:.0f}s')
+                if not options['url']:
+                    # Do not wait for the delayed task; drain in this process
+                    payments.process_pending()
+                else:
+                    time.sleep(0.2)
+            self.stdout.write(f'Events applied {time.perf_counter() - started:.2f}s after the last delivery')
+
+        final = dict(Order.objects.filter(pk__in=expected).values_list('pk', 'paid'))
+        problems = [f'order {pk}: paid={final.get(pk)}, expected {paid}' for pk, paid in expected.items() if final.get(pk) != paid]
+        outcomes = Counter(PaymentEvent.objects.filter(order_id__in=expected).values_list('outcome', flat=True))
+        self.stdout.write(f'Stored events by outcome: {dict(outcomes)}')
+        if problems:
+            raise CommandError(f'{len(problems)} orders in the wrong state:\n' + '\n'.join(problems[:20]))
+        self.stdout.write(self.style.SUCCESS(f'All {len(expected)} orders are in the expected state'))
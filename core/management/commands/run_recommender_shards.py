@@ -0,0 +1,85 @@
+"""
+Serve the recommender as item-partitioned shards.
+-------------------------------------------------
+Starts one process per address in RECOMMENDER_SHARDS (or only --index i,
+to run shards on separate machines). Each process trains the part of the
+model for the products it owns and answers the coordinators in the web
+processes; crashed shards are restarted.
+"""
+import multiprocessing
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def _serve_shard(index, count, address, filter_refresh):
+    # Spawned shards start without Django; forked ones must not share
+    # the parent's database connections.
+    django.setup()
+    connections.close_all()
+
+    from core.recommendations import load_interactions
+    from core.recommendations.sharding import ItemShard, ShardServer
+
+    shard = ItemShard(index, count, filter_refresh)
+    started = time.time()
+    shard.fit(load_interactions(), started)
+    connections.close_all()
+    ShardServer(shard, address).serve_forever()
+
+
+class Command(BaseCommand):
+    help = 'Run recommender shard processes for the addresses in RECOMMENDER_SHARDS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index', type=int, help='Only run this shard, in the foreground')
+        parser.add_argument('--refit-interval', type=float, default=0,
+                            help='Retrain all shards every this many seconds (0 disables)')
+
+    def handle(self, *args, **options):
+        addresses = list(getattr(settings, 'RECOMMENDER_SHARDS', None) or [])
+        if not addresses:
+            raise CommandError('Set RECOMMENDER_SHARDS to the shard addresses')
+        count = len(addresses)
+        filter_refresh = getattr(settings, 'RECOMMENDER_FILTER_REFRESH', 60)
+
+        if options['index'] is not None:
+            if not 0 <= options['index'] < count:
+                raise CommandError(f'--index must be between 0 and {count - 1}')
+            self.stdout.write(f'Serving shard {options["index"]} of {count} on {addresses[options["index"]]}')
+            _serve_shard(options['index'], count, addresses[options['index']], filter_refresh)
+            return
+
+        connections.close_all()
+        processes = {}
+        next_refit = time.monotonic() + options['refit_interval'] if options['refit_interval'] else None
+        try:
+            while True:
+                for index, address in enumerate(addresses):
+                    process = processes.get(index)
+                    if process is None or not process.is_alive():
+                        if process is not None:
+                            self.stderr.write(f'Shard {index} exited with status {process.exitcode}, restarting')
+                        process = multiprocessing.Process(
+                            target=_serve_shard, args=(index, count, address, filter_refresh),
+                            name=f'recommender-shard-{index}', daemon=True,
+                        )
+                        process.start()
+                        processes[index] = process
+                        self.stdout.write(f'Started shard {index} of {count} on {address} (pid {process.pid})')
+                if next_refit is not None and time.monotonic() >= next_refit:
+                    from core import recommendations
+
+                    # Through the same lock as refits the web processes ask for
+                    recommendations.refit()
+                    self.stdout.write(f'Refit the {count} shards')
+                    next_refit = time.monotonic() + options['refit_interval']
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Stopping shards'))
+        finally:
+            for process in processes.values():
+                process.terminate()
@@ -0,0 +1,213 @@
+"""
+In-process request metrics with Prometheus text exposition.
+
+InstrumentationMiddleware fills a RequestMetrics object for each sampled
+request; code that wants to report cache lookups or time spent in a
+subsystem uses record_cache() and span(), which are no-ops outside a
+sampled request. Finished requests are folded into histograms kept per
+process and rendered by the /metrics view.
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+class Histogram:
+    """Fixed-bucket histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe store of labelled counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (h.buckets, list(h.counts), h.sum, h.count)
+                for key, h in self._histograms.items()
+            }
+
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, text = self._help[name]
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+            described.add(name)
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name)
+            lines.append(f'{name}{_labels(labels)} {value:g}')
+
+        for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            header(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels, le=f"{bound:g}")} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {count}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:g}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = MetricsRegistry()
+registry.describe('ecommerce_requests_total', 'counter', 'Sampled requests by view and status code.')
+registry.describe('ecommerce_request_duration_seconds', 'histogram', 'Wall time per sampled request.')
+registry.describe('ecommerce_db_queries', 'histogram', 'Database queries per sampled request.')
+registry.describe('ecommerce_db_duration_seconds', 'histogram', 'Time spent in database queries per sampled request.')
+registry.describe('ecommerce_n_plus_one_total', 'counter', 'Sampled requests that repeated one query shape too often.')
+registry.describe('ecommerce_cache_requests_total', 'counter', 'Instrumented cache lookups by result.')
+registry.describe('ecommerce_span_duration_seconds', 'histogram', 'Time spent in instrumented subsystems per request.')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Measurements collected while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = defaultdict(int)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.spans = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper (see connection.execute_wrapper)."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated_queries(self, threshold):
+        """Return {fingerprint: count} for query shapes run at least threshold times."""
+        fingerprints = defaultdict(int)
+        for sql, count in self.statements.items():
+            fingerprints[_IN_LIST.sub('(...)', sql)] += count
+        return {sql: count for sql, count in fingerprints.items() if count >= threshold}
+
+    def finish(self, view, status, n_plus_one_threshold=5):
+        """Fold this request into the process-wide registry."""
+        labels = {'view': view}
+        registry.inc('ecommerce_requests_total', {'view': view, 'status': str(status)})
+        registry.observe('ecommerce_request_duration_seconds', labels, time.perf_counter() - self.started)
+        registry.observe('ecommerce_db_queries', labels, self.queries, COUNT_BUCKETS)
+        registry.observe('ecommerce_db_duration_seconds', labels, self.db_time)
+        if self.cache_hits:
+            registry.inc('ecommerce_cache_requests_total', {'view': view, 'result': 'hit'}, self.cache_hits)
+        if self.cache_misses:
+            registry.inc('ecommerce_cache_requests_total', {'view': view, 'result': 'miss'}, self.cache_misses)
+        for name, seconds in self.spans.items():
+            registry.observe('ecommerce_span_duration_seconds', {'view': view, 'span': name}, seconds)
+
+        repeated = self.repeated_queries(n_plus_one_threshold)
+        if repeated:
+            registry.inc('ecommerce_n_plus_one_total', labels)
+            for sql, count in repeated.items():
+                logger.warning("Possible N+1 in %s: %d x %s", view, count, sql[:300])
+
+
+def current():
+    """Metrics of the request being served, or None if it is not sampled."""
+    return _current.get()
+
+
+def record_cache(hits=0, misses=0):
+    """Count cache lookups against the current request."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+@contextmanager
+def span(name):
+    """Time a block of code against the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.spans[name] += time.perf_counter() - start
+
+
+def activate(metrics):
+    """Make metrics the current request's; returns a token for deactivate()."""
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
@@ -0,0 +1,112 @@
+"""
+Middleware for the core application.
+"""
+import random
+import sys
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, profiling, routers
+
+
+class InstrumentationMiddleware:
+    """
+    Record wall time, database queries, cache lookups and subsystem spans
+    for a sample of requests.
+
+    METRICS_SAMPLE_RATE controls the share of requests measured; requests
+    that are not sampled only pay for one random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 0.05)
+        self.n_plus_one_threshold = getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if not self.enabled or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        current = metrics.RequestMetrics()
+        token = metrics.activate(current)
+        status = 500
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(current))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.deactivate(token)
+            match = getattr(request, 'resolver_match', None)
+            view = match.view_name if match is not None else 'unresolved'
+            current.finish(view, status, self.n_plus_one_threshold)
+
+
+class ProfilingMiddleware:
+    """
+    Sample the Python stacks of some requests (see core.profiling).
+
+    A request is profiled when its PROFILER_HEADER holds a valid token, or
+    at random for PROFILER_SAMPLE_RATE of requests. With PROFILER_ENABLED
+    off the middleware is left out of the stack altogether.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+        header = getattr(settings, 'PROFILER_HEADER', 'X-Profile')
+        self.header = header
+        self.meta_key = 'HTTP_' + header.upper().replace('-', '_')
+
+    def __call__(self, request):
+        token = request.META.get(self.meta_key)
+        requested = token is not None and profiling.check_token(token)
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            return self.get_response(request)
+
+        sampler = profiling.get_sampler()
+        with sampler.profile(sys._getframe()) as samples:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        sampler.add(match.view_name if match is not None else 'unresolved', samples)
+        if requested:
+            response[f'{self.header}-Samples'] = str(sum(samples.values()))
+        return response
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Serve safe requests from the read replica, except right after a write.
+
+    A request that writes sets a short-lived cookie so that the same
+    browser keeps reading from the primary for DATABASE_REPLICA_PIN_SECONDS,
+    long enough for the replica to catch up with what the user just did.
+    """
+    cookie_name = 'db_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        pinned_until = request.COOKIES.get(self.cookie_name, '')
+        read_from_replica = request.method in ('GET', 'HEAD', 'OPTIONS') and not (
+            pinned_until.isdigit() and int(pinned_until) > time.time()
+        )
+        with routers.request_scope(read_from_replica) as wrote:
+            response = self.get_response(request)
+        if wrote[0]:
+            response.set_cookie(
+                self.cookie_name, str(int(time.time() + self.pin_seconds)),
+                max_age=self.pin_seconds, httponly=True, samesite='Lax',
+            )
+        return response
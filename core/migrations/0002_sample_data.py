@@ -1,30 +1,35 @@
 from django.db import migrations
+from django.utils.text import slugify
 
 
 def create_sample_data(apps, schema_editor):
-    # Get models
+    # Get models; historical models skip save(), so slugs are set here
     Category = apps.get_model('core', 'Category')
     Product = apps.get_model('core', 'Product')
     
     # Create categories
     electronics = Category.objects.create(
         name='Electronics',
+        slug=slugify('Electronics'),
         description='Latest electronic gadgets and devices.'
     )
     
     clothing = Category.objects.create(
         name='Clothing',
+        slug=slugify('Clothing'),
         description='Fashionable clothing for all occasions.'
     )
     
     books = Category.objects.create(
         name='Books',
+        slug=slugify('Books'),
         description='Bestselling books in various genres.'
     )
     
     # Create sample products
     Product.objects.create(
         name='Wireless Earbuds',
+        slug=slugify('Wireless Earbuds'),
         description='High-quality wireless earbuds with noise cancellation.',
         price=99.99,
         category=electronics,
@@ -34,6 +39,7 @@ def create_sample_data(apps, schema_editor):
     
     Product.objects.create(
         name='Smartwatch',
+        slug=slugify('Smartwatch'),
         description='Feature-rich smartwatch with health tracking.',
         price=199.99,
         category=electronics,
@@ -43,6 +49,7 @@ def create_sample_data(apps, schema_editor):
     
     Product.objects.create(
         name='Cotton T-Shirt',
+        slug=slugify('Cotton T-Shirt'),
         description='Comfortable cotton t-shirt for everyday wear.',
         price=24.99,
         category=clothing,
@@ -52,6 +59,7 @@ def create_sample_data(apps, schema_editor):
     
     Product.objects.create(
         name='Jeans',
+        slug=slugify('Jeans'),
         description='Classic blue jeans for a casual look.',
         price=59.99,
         category=clothing,
@@ -61,6 +69,7 @@ def create_sample_data(apps, schema_editor):
     
     Product.objects.create(
         name='Python Programming Book',
+        slug=slugify('Python Programming Book'),
         description='Comprehensive guide to Python programming.',
         price=39.99,
         category=books,
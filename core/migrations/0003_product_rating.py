@@ -0,0 +1,43 @@
+# Generated by Django 4.2.10 on 2026-10-19 07:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_summaries(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductRating = apps.get_model('core', 'ProductRating')
+    Review = apps.get_model('core', 'Review')
+
+    summaries = {pk: ProductRating(product_id=pk) for pk in Product.objects.values_list('id', flat=True)}
+    for product_id, rating in Review.objects.values_list('product_id', 'rating').iterator():
+        summary = summaries[product_id]
+        summary.count += 1
+        summary.total += rating
+        setattr(summary, f'star_{rating}', getattr(summary, f'star_{rating}') + 1)
+    ProductRating.objects.bulk_create(summaries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_sample_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='core.product')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('star_1', models.PositiveIntegerField(default=0)),
+                ('star_2', models.PositiveIntegerField(default=0)),
+                ('star_3', models.PositiveIntegerField(default=0)),
+                ('star_4', models.PositiveIntegerField(default=0)),
+                ('star_5', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
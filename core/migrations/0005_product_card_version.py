@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-19 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productrating',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0006_product_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BehaviorEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Product view'), (2, 'Cart add'), (3, 'Cart remove'), (4, 'Search'), (5, 'Purchase')])),
+                ('user_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('product_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('session_key', models.CharField(blank=True, max_length=40)),
+                ('query', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImplicitScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='implicit_scores', to='core.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='implicit_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# Full-text indexes behind the admin search (see core.admin_tools). The
+# expressions must match the search_document of the admin classes exactly.
+# Only PostgreSQL has them; other databases search with search_fields.
+INDEXES = {
+    'core_product_search_idx': (
+        'core_product',
+        "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))",
+    ),
+    'core_review_search_idx': ('core_review', "to_tsvector('english', comment)"),
+    'core_order_search_idx': (
+        'core_order',
+        "to_tsvector('simple', first_name || ' ' || last_name || ' ' || email || ' ' || address "
+        "|| ' ' || postal_code || ' ' || city)",
+    ),
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, (table, expression) in INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin (({expression}))')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY keeps the tables writable while the indexes build, but
+    # cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_behavior_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:31
+
+from django.db import migrations, models
+
+
+def score_existing_reviews(apps, schema_editor):
+    from core.review_feed import helpfulness_expression
+
+    Review = apps.get_model('core', 'Review')
+    Review.objects.exclude(likes=0, dislikes=0).update(helpfulness=helpfulness_expression())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='helpfulness',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        # Before the indexes, so they are built once over the final values
+        migrations.RunPython(score_existing_reviews, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='review_product_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-helpfulness', '-id'], name='review_product_helpful_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_review_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('type', models.CharField(max_length=100)),
+                ('order_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('payload', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, choices=[('applied', 'Applied'), ('ignored', 'Ignored'), ('unknown_order', 'Unknown order'), ('amount_mismatch', 'Amount mismatch'), ('stale', 'Older than an applied event')], max_length=20)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='payment_event_pending_idx'), models.Index(fields=['order_id', 'created_at'], name='payment_event_order_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.urls import reverse
 from django.utils.text import slugify
 
 class Category(models.Model):
@@ -17,6 +19,9 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def get_absolute_url(self):
+        return reverse('product_list_by_category', args=[self.slug])
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -29,6 +34,8 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/%Y/%m/%d/', blank=True)
+    # Resized copies of image, see core.renditions
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     stock = models.PositiveIntegerField()
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -58,14 +65,64 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     likes = models.PositiveIntegerField(default=0)
     dislikes = models.PositiveIntegerField(default=0)
+    # Lower bound of the share of helpful votes (see core.review_feed);
+    # kept up to date when vote counters are written
+    helpfulness = models.FloatField(default=0, editable=False)
 
     class Meta:
         ordering = ['-created_at']
         unique_together = ['product', 'user']
+        # Keyset pages of a product's reviews walk one of these
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_recent_idx'),
+            models.Index(fields=['product', '-helpfulness', '-id'], name='review_product_helpful_idx'),
+        ]
 
     def __str__(self):
         return f'Review by {self.user.username} on {self.product.name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the row looked like so rating summaries can apply
+        # a delta on save without re-reading it.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+class ProductRating(models.Model):
+    """Denormalized rating summary, maintained incrementally from Review signals."""
+    product = models.OneToOneField(Product, related_name='rating_summary', on_delete=models.CASCADE, primary_key=True)
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    star_1 = models.PositiveIntegerField(default=0)
+    star_2 = models.PositiveIntegerField(default=0)
+    star_3 = models.PositiveIntegerField(default=0)
+    star_4 = models.PositiveIntegerField(default=0)
+    star_5 = models.PositiveIntegerField(default=0)
+    # Bumped whenever anything shown on the product card changes; part of
+    # the card's fragment cache key
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Rating of {self.product_id}: {self.average:.2f} ({self.count})'
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def bayesian_average(self):
+        """Average shrunk towards RATING_PRIOR_MEAN for products with few reviews."""
+        prior_mean = getattr(settings, 'RATING_PRIOR_MEAN', 3.0)
+        prior_weight = getattr(settings, 'RATING_PRIOR_WEIGHT', 5)
+        return (prior_mean * prior_weight + self.total) / (prior_weight + self.count)
+
+    @property
+    def histogram(self):
+        """List of (stars, count) pairs from 5 down to 1."""
+        return [(stars, getattr(self, f'star_{stars}')) for stars in range(5, 0, -1)]
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -143,3 +200,98 @@ class OrderItem(models.Model):
 
     def get_cost(self):
         return self.price * self.quantity
+
+class StockReservation(models.Model):
+    """Stock held back for a checkout; returned to the product if it expires unused."""
+    token = models.UUIDField(db_index=True)
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} ({self.token})'
+
+class BehaviorEvent(models.Model):
+    """
+    Append-only log of storefront behavior, written in batches by core.events.
+
+    User and product are plain integers so events can be inserted in bulk
+    without foreign key checks and outlive the rows they refer to.
+    """
+    VIEW = 1
+    CART_ADD = 2
+    CART_REMOVE = 3
+    SEARCH = 4
+    PURCHASE = 5
+    KIND_CHOICES = [
+        (VIEW, 'Product view'),
+        (CART_ADD, 'Cart add'),
+        (CART_REMOVE, 'Cart remove'),
+        (SEARCH, 'Search'),
+        (PURCHASE, 'Purchase'),
+    ]
+
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    user_id = models.PositiveIntegerField(null=True, blank=True)
+    product_id = models.PositiveIntegerField(null=True, blank=True)
+    session_key = models.CharField(max_length=40, blank=True)
+    query = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.get_kind_display()} by {self.user_id or self.session_key or "anonymous"}'
+
+class ImplicitScore(models.Model):
+    """Weighted sum of a user's behavior events on a product, for the recommender."""
+    user = models.ForeignKey(User, related_name='implicit_scores', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='implicit_scores', on_delete=models.CASCADE)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'product']
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.product_id}: {self.score:.1f}'
+
+class PaymentEvent(models.Model):
+    """
+    Payment gateway webhook event, stored as received and applied later by
+    core.payments.
+
+    event_id is the gateway's id; its unique index is what makes repeated
+    deliveries of the same event harmless. order_id is a plain integer so
+    an event for an unknown order is still kept.
+    """
+    APPLIED = 'applied'
+    IGNORED = 'ignored'
+    UNKNOWN_ORDER = 'unknown_order'
+    AMOUNT_MISMATCH = 'amount_mismatch'
+    STALE = 'stale'
+    OUTCOME_CHOICES = [
+        (APPLIED, 'Applied'),
+        (IGNORED, 'Ignored'),
+        (UNKNOWN_ORDER, 'Unknown order'),
+        (AMOUNT_MISMATCH, 'Amount mismatch'),
+        (STALE, 'Older than an applied event'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    order_id = models.PositiveIntegerField(null=True, blank=True)
+    payload = models.TextField()
+    created_at = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES, blank=True)
+
+    class Meta:
+        indexes = [
+            # The consumer only ever reads the events it has not processed
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='payment_event_pending_idx'),
+            models.Index(fields=['order_id', 'created_at'], name='payment_event_order_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.type} {self.event_id}'
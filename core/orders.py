@@ -0,0 +1,75 @@
+"""
+Order placement: turns a cart into an order in one transaction.
+
+Cart lines and products are read with row locks inside the transaction,
+so the order is built from the quantities, prices and availability that
+hold when it commits. Apart from one stock UPDATE per product, the number
+of queries does not depend on the size of the cart: cart lines and
+products are each loaded with one query, order lines are written with one
+bulk INSERT and the cart is emptied with one DELETE.
+"""
+from django.db import transaction
+
+from . import inventory
+from .models import CartItem, Order, OrderItem, Product
+from .signals import order_placed
+
+
+def place_order(user, details, reservation=None):
+    """
+    Create an order from a user's cart and empty the cart.
+
+    Args:
+        user: User placing the order
+        details: Dictionary of Order fields (name, email and address)
+        reservation: Optional token from inventory.reserve() that already
+            holds the stock for the cart
+
+    Returns:
+        Order: The new order
+
+    Raises:
+        ValueError: If the cart is empty, changed concurrently or contains
+            products that are no longer available
+        inventory.InsufficientStock: If stock ran out for any line
+    """
+    with transaction.atomic():
+        # Cart lines are read under lock, so the quantities ordered are the
+        # ones being deleted and a concurrent edit of the cart waits for us
+        items = list(
+            CartItem.objects.select_for_update().filter(cart__user=user).order_by('pk')
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        if not items:
+            raise ValueError("Your cart is empty")
+        lines = {product_id: quantity for _, product_id, quantity in items}
+
+        # Empty the cart before writing anything else: where rows cannot be
+        # locked (SQLite) it is the write that serializes double submits,
+        # and a second checkout of the same cart deletes nothing.
+        deleted, _ = CartItem.objects.filter(pk__in=[pk for pk, _, _ in items]).delete()
+        if deleted != len(items):
+            raise ValueError("Your cart changed during checkout, please try again")
+
+        # Lock the products (in id order, like take_stock) so the prices and
+        # availability the order is built from cannot change before commit
+        products = Product.objects.select_for_update().order_by('pk').in_bulk(list(lines))
+        unavailable = [pid for pid in lines if pid not in products or not products[pid].available]
+        if unavailable:
+            raise ValueError("Some products in your cart are no longer available")
+
+        if reservation is None:
+            inventory.take_stock(lines.items())
+        elif inventory.commit(reservation) != lines:
+            raise ValueError("Your reservation does not match your cart or has expired")
+
+        order = Order.objects.create(user=user, **details)
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[pid], price=products[pid].price, quantity=quantity)
+            for pid, quantity in sorted(lines.items())
+        ])
+
+        transaction.on_commit(lambda: order_placed.send(
+            sender=Order, order=order, items=order_items, user_id=user.id
+        ))
+    return order
@@ -0,0 +1,147 @@
+"""
+Local stand-in for the payment gateway.
+
+StubGateway makes events shaped and signed like the gateway's for orders of
+this shop. deliver() sends them to the webhook, either over HTTP to a
+running server or in-process through Django's test client. storm()
+reproduces a busy sale as the webhook sees it: every event delivered
+several times, in shuffled order, with some first payment attempts failing
+and some payments refunded.
+"""
+import json
+import random
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.db import connections
+
+from .payments import FAILED, PAID, REFUNDED, SIGNATURE_HEADER, signature
+
+
+class StubGateway:
+    """Builds and signs gateway events with a webhook secret."""
+
+    def __init__(self, secret, clock=time.time):
+        self.secret = secret
+        self.clock = clock
+
+    def event(self, type, order_id, amount, created=None):
+        """
+        A gateway event.
+
+        Args:
+            type: Event type, e.g. payments.PAID
+            order_id: Order the payment is for
+            amount: Amount in the currency's main unit
+            created: Unix time the gateway created the event
+        """
+        return {
+            'id': f'evt_{secrets.token_hex(12)}',
+            'object': 'event',
+            'type': type,
+            'created': int(self.clock() if created is None else created),
+            'data': {'object': {
+                'id': f'pi_{secrets.token_hex(12)}',
+                'object': 'payment_intent',
+                'amount': int(round(amount * 100)),
+                'currency': 'usd',
+                'metadata': {'order_id': str(order_id)},
+            }},
+        }
+
+    def sign(self, payload, timestamp=None):
+        """Stripe-Signature header for a payload."""
+        timestamp = int(self.clock() if timestamp is None else timestamp)
+        return f't={timestamp},v1={signature(payload, self.secret, timestamp)}'
+
+    def delivery(self, event):
+        """(body, signature header) of one delivery of an event."""
+        payload = json.dumps(event).encode()
+        return payload, self.sign(payload)
+
+    def storm(self, orders, duplicates=3, fail_rate=0.1, refund_rate=0.05, seed=None):
+        """
+        Deliveries paying for a list of orders, as a burst would bring them.
+
+        Args:
+            orders: (order_id, total) pairs
+            duplicates: Deliveries of each event
+            fail_rate: Share of orders whose first payment attempt fails
+            refund_rate: Share of orders refunded after paying
+            seed: Seed for the random choices and the shuffle
+
+        Returns:
+            tuple: (list of (body, header) in delivery order, {order_id:
+            True if it should end up paid})
+        """
+        rng = random.Random(seed)
+        now = int(self.clock())
+        events = []
+        expected = {}
+        for order_id, total in orders:
+            if rng.random() < fail_rate:
+                events.append(self.event(FAILED, order_id, total, now - 3))
+            events.append(self.event(PAID, order_id, total, now - 2))
+            refunded = rng.random() < refund_rate
+            if refunded:
+                events.append(self.event(REFUNDED, order_id, total, now - 1))
+            expected[order_id] = not refunded
+        deliveries = [self.delivery(event) for event in events for _ in range(duplicates)]
+        rng.shuffle(deliveries)
+        return deliveries, expected
+
+
+def deliver(deliveries, url=None, path='/payments/webhook/', concurrency=16):
+    """
+    Send deliveries to the webhook from concurrency threads.
+
+    Args:
+        deliveries: (body, header) pairs
+        url: Webhook URL of a running server; without it deliveries go
+            in-process to path through Django's test client
+
+    Returns:
+        list: (HTTP status, seconds) per delivery, in order
+    """
+    local = threading.local()
+
+    def send(delivery):
+        body, header = delivery
+        started = time.perf_counter()
+        if url:
+            request = Request(url, data=body, method='POST', headers={
+                'Content-Type': 'application/json', SIGNATURE_HEADER: header,
+            })
+            try:
+                with urlopen(request, timeout=30) as response:
+                    status = response.status
+            except HTTPError as e:
+                status = e.code
+            except URLError:
+                status = 0
+        else:
+            if not hasattr(local, 'client'):
+                from django.test import Client
+
+                local.client = Client()
+            status = local.client.post(
+                path, data=body, content_type='application/json', headers={SIGNATURE_HEADER: header}
+            ).status_code
+        return status, time.perf_counter() - started
+
+    def worker(chunk):
+        try:
+            return [send(delivery) for delivery in chunk]
+        finally:
+            connections.close_all()
+
+    chunks = [deliveries[i::concurrency] for i in range(concurrency)]
+    results = [None] * len(deliveries)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for offset, chunk_results in enumerate(pool.map(worker, chunks)):
+            results[offset::concurrency] = chunk_results
+    return results
@@ -0,0 +1,294 @@
+"""
+Sampling profiler for production requests.
+
+ProfilingMiddleware profiles PROFILER_SAMPLE_RATE of requests, and every
+request whose PROFILER_HEADER carries a token from make_token() (the
+profiles admin page shows one). While at least one request is being
+profiled, a single sampler thread wakes every PROFILER_INTERVAL seconds
+and records the Python stack of each profiled thread, from the middleware
+down; when the request ends its stacks are added to the totals of its URL
+name. Requests that are not profiled are not touched, and with nothing to
+profile the sampler thread sleeps.
+
+Totals are kept per process and written to PROFILER_DIR, one file per
+process, at most every PROFILER_FLUSH_INTERVAL seconds. load() merges the
+files; collapsed() turns stacks into "frame;frame;frame count" lines, the
+input of flamegraph.pl and speedscope, and top_functions() into the
+functions the samples were spent in.
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import signing
+
+TOKEN_SALT = 'core.profiling'
+RESET_MARKER = 'reset'
+
+
+def _directory():
+    return getattr(settings, 'PROFILER_DIR', os.path.join(settings.BASE_DIR, 'var', 'profiles'))
+
+
+def make_token():
+    """Signed value of PROFILER_HEADER that gets a request profiled."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def check_token(token):
+    """Whether a header value was made by make_token() in the last PROFILER_TOKEN_MAX_AGE seconds."""
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 300))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _label(code, roots=None):
+    """Frame name of a code object: qualified name and the file it is in."""
+    filename = code.co_filename
+    for root in roots or ():
+        if filename.startswith(root):
+            filename = filename[len(root):]
+            break
+    name = getattr(code, 'co_qualname', code.co_name)
+    # ';' separates frames in collapsed stacks
+    return f'{name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+class Sampler:
+    """
+    Stack sampler of the profiled threads of one process.
+
+    The sampler thread is started on first use and again after a fork, like
+    the local task backend's.
+    """
+
+    def __init__(self, interval=0.01, max_depth=128, flush_interval=10.0):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.flush_interval = flush_interval
+        self._active = {}
+        self._totals = defaultdict(lambda: {'requests': 0, 'stacks': Counter()})
+        self._labels = {}
+        self._dirty = False
+        self._started_at = time.time()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: what the parent profiled is the parent's to write
+                self._lock = threading.Lock()
+                self._wakeup = threading.Event()
+                self._active = {}
+                self._totals.clear()
+                self._dirty = False
+            threading.Thread(target=self._run, name='profiler', daemon=True).start()
+            self._pid = os.getpid()
+
+    @contextmanager
+    def profile(self, root):
+        """
+        Sample the calling thread while the block runs.
+
+        Args:
+            root: Frame the recorded stacks start below, usually the caller's
+
+        Yields:
+            Counter: Samples per stack (tuples of code objects), filled in
+            as the block runs and complete once it ends
+        """
+        self.start()
+        ident = threading.get_ident()
+        samples = Counter()
+        with self._lock:
+            self._active[ident] = (root, samples)
+            self._wakeup.set()
+        try:
+            yield samples
+        finally:
+            with self._lock:
+                del self._active[ident]
+                if not self._active:
+                    self._wakeup.clear()
+
+    def add(self, view, samples):
+        """Add a finished request's samples to the totals of its view."""
+        with self._lock:
+            totals = self._totals[view]
+            totals['requests'] += 1
+            totals['stacks'].update(samples)
+            self._dirty = True
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, (root, samples) in self._active.items():
+                frame = frames.get(ident)
+                codes = []
+                while frame is not None and frame is not root and len(codes) < self.max_depth:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                if codes:
+                    samples[tuple(reversed(codes))] += 1
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            if self._wakeup.wait(max(0.0, next_flush - time.monotonic())):
+                time.sleep(self.interval)
+                self._sample()
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_interval
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+    def flush(self):
+        """Write this process's totals to PROFILER_DIR if they changed."""
+        directory = _directory()
+        marker = os.path.join(directory, RESET_MARKER)
+        if os.path.exists(marker) and os.path.getmtime(marker) > self._started_at:
+            with self._lock:
+                self._totals.clear()
+                self._started_at = time.time()
+                self._dirty = False
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            totals = {view: (t['requests'], dict(t['stacks'])) for view, t in self._totals.items()}
+            self._dirty = False
+
+        roots = sorted((os.path.join(path, '') for path in sys.path if path), key=len, reverse=True)
+        views = {}
+        for view, (requests, stacks) in totals.items():
+            lines = Counter()
+            for stack, count in stacks.items():
+                labels = []
+                for code in stack:
+                    if code not in self._labels:
+                        self._labels[code] = _label(code, roots)
+                    labels.append(self._labels[code])
+                lines[';'.join(labels)] += count
+            views[view] = {'requests': requests, 'samples': sum(lines.values()), 'stacks': lines}
+
+        os.makedirs(directory, exist_ok=True)
+        name = f'{socket.gethostname()}-{os.getpid()}.json'
+        tmp = os.path.join(directory, f'.{name}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'interval': self.interval, 'written_at': time.time(), 'views': views}, f)
+        os.replace(tmp, os.path.join(directory, name))
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Process-wide sampler."""
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = Sampler(
+                    interval=getattr(settings, 'PROFILER_INTERVAL', 0.01),
+                    max_depth=getattr(settings, 'PROFILER_MAX_DEPTH', 128),
+                    flush_interval=getattr(settings, 'PROFILER_FLUSH_INTERVAL', 10.0),
+                )
+    return _sampler
+
+
+def load():
+    """
+    Totals of every process that wrote to PROFILER_DIR since the last reset.
+
+    Returns:
+        dict: {view name: {'requests': int, 'samples': int, 'stacks':
+        Counter of collapsed stack -> samples}}
+    """
+    directory = _directory()
+    views = defaultdict(lambda: {'requests': 0, 'samples': 0, 'stacks': Counter()})
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return {}
+    for name in names:
+        if not name.endswith('.json') or name.startswith('.'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for view, totals in data['views'].items():
+            views[view]['requests'] += totals['requests']
+            views[view]['samples'] += totals['samples']
+            views[view]['stacks'].update(totals['stacks'])
+    return dict(views)
+
+
+def reset():
+    """Drop all profiles; running processes start over at their next flush."""
+    directory = _directory()
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            os.remove(os.path.join(directory, name))
+    with open(os.path.join(directory, RESET_MARKER), 'w') as f:
+        f.write(str(time.time()))
+
+
+def collapsed(views, view=None):
+    """
+    Collapsed stacks, one "frame;frame;frame count" line each.
+
+    Args:
+        views: Result of load()
+        view: Only this view's stacks; without it every view's, under a
+            root frame named after the view
+    """
+    lines = []
+    for name, totals in sorted(views.items()):
+        if view is not None and name != view:
+            continue
+        for stack, count in totals['stacks'].most_common():
+            lines.append(f'{stack if view is not None else f"{name};{stack}"} {count}')
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def top_functions(stacks, n=30):
+    """
+    Functions the samples were spent in.
+
+    Args:
+        stacks: Counter of collapsed stack -> samples
+
+    Returns:
+        list: (function, self samples, total samples) for the n functions
+        with the most samples of their own; total also counts samples spent
+        in what they called
+    """
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [(frame, count, total[frame]) for frame, count in own.most_common(n)]
@@ -0,0 +1,113 @@
+"""
+Incremental maintenance of the denormalized product rating summaries.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Product, ProductRating
+
+
+def apply_rating_delta(product_id, added=None, removed=None):
+    """
+    Apply a single review change to a product's rating summary.
+
+    Args:
+        product_id: ID of the product whose summary changes
+        added: Star rating that was added, if any
+        removed: Star rating that was removed, if any
+    """
+    changes = {}
+    if added is not None:
+        changes['count'] = F('count') + 1
+        changes['total'] = F('total') + int(added)
+        changes[f'star_{int(added)}'] = F(f'star_{int(added)}') + 1
+    if removed is not None:
+        changes['count'] = changes.get('count', F('count')) - 1
+        changes['total'] = changes.get('total', F('total')) - int(removed)
+        field = f'star_{int(removed)}'
+        changes[field] = changes.get(field, F(field)) - 1
+    if not changes:
+        return
+    changes['version'] = F('version') + 1
+
+    with transaction.atomic():
+        # A single UPDATE keeps concurrent reviews from losing increments
+        if not ProductRating.objects.filter(product_id=product_id).update(**changes):
+            if added is None:
+                # Nothing to take away from, e.g. the product is being deleted
+                return
+            ProductRating.objects.get_or_create(product_id=product_id)
+            ProductRating.objects.filter(product_id=product_id).update(**changes)
+
+
+def rebuild_summaries(product_ids=None):
+    """
+    Recompute rating summaries from the Review table.
+
+    Args:
+        product_ids: Optional iterable of product IDs, defaults to all products
+
+    Returns:
+        int: Number of summaries written
+    """
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    stars = {
+        f'star_{i}': Count('reviews', filter=Q(reviews__rating=i))
+        for i in range(1, 6)
+    }
+    versions = dict(ProductRating.objects.filter(product__in=products).values_list('product_id', 'version'))
+    rows = products.values('id').annotate(
+        num_reviews=Count('reviews'), rating_total=Sum('reviews__rating'), **stars
+    )
+    summaries = [
+        ProductRating(
+            product_id=row['id'],
+            count=row['num_reviews'],
+            total=row['rating_total'] or 0,
+            version=versions.get(row['id'], 0) + 1,
+            **{field: row[field] for field in stars}
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        ProductRating.objects.filter(product_id__in=[s.product_id for s in summaries]).delete()
+        ProductRating.objects.bulk_create(summaries, batch_size=1000)
+    return len(summaries)
+
+
+def review_changed(review, created):
+    """Update summaries after a Review was saved."""
+    loaded = getattr(review, '_loaded_values', None)
+    if created or loaded is None:
+        if not created:
+            # Saved without being loaded first, fall back to a rebuild
+            rebuild_summaries([review.product_id])
+            return
+        apply_rating_delta(review.product_id, added=review.rating)
+    else:
+        old_product, old_rating = loaded.get('product_id'), loaded.get('rating')
+        if old_product is None or old_rating is None:
+            rebuild_summaries([review.product_id])
+        elif old_product != review.product_id:
+            apply_rating_delta(old_product, removed=old_rating)
+            apply_rating_delta(review.product_id, added=review.rating)
+        elif int(old_rating) != int(review.rating):
+            apply_rating_delta(review.product_id, added=review.rating, removed=old_rating)
+
+    review._loaded_values = {
+        **(loaded or {}), 'product_id': review.product_id, 'rating': review.rating
+    }
+
+
+def review_deleted(review):
+    """Update summaries after a Review was deleted."""
+    apply_rating_delta(review.product_id, removed=review.rating)
+
+
+def bump_card_version(product_id):
+    """Mark a product's cached card as stale."""
+    ProductRating.objects.filter(product_id=product_id).update(version=F('version') + 1)
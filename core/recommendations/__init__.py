@@ -1 +1,415 @@
-# This file makes the recommendations directory a Python package
+"""
+Lazy entry point to the recommendation engine.
+
+Importing this package is cheap: NumPy, the Recommender class (and its
+Cython extension) are only imported, and the model only trained, the first
+time get_recommender() or warm_up() is called. Web servers call warm_up()
+from ecommerce/wsgi.py so that with gunicorn's preload_app the model is
+built once in the master and shared copy-on-write by the forked workers;
+management commands and migrations never pay for it.
+
+Each model carries an ItemFilter (see filters.py) with the products'
+sellable flag, category and price; recommend() turns it into a mask so
+unavailable items are never scored.
+
+With RECOMMENDER_SHARDS set the model is not loaded here at all:
+recommend() asks the shard processes (see sharding.py) instead, and
+refit() has them retrain once however many processes ask at a time.
+
+Most users are served from the precomputed store (see store.py) without
+touching the model; stored() returns None for the rest. Each fit rebuilds
+the store in the background once it is in use.
+
+Training goes through a SingleFlight guard, so a burst of requests at
+start-up costs one fit; each new model is published with one assignment
+of _recommender, so readers always hold a complete model. The fitted
+model is also saved (see snapshot.py): callers that waited for a fit in
+another process load it instead of fitting again, and so do processes
+starting up and, through reload(), those still serving an older model.
+"""
+import gc
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_recommender = None
+_fitted_at = None
+_sharded = None
+_loading = None
+_shard_refits = None
+_popular = None
+_lock = threading.Lock()
+
+POPULAR_KEY = 'popular-products'
+POPULAR_SIZE = 50
+
+
+def get_sharded():
+    """The shard coordinator, or None unless RECOMMENDER_SHARDS is set."""
+    global _sharded
+    from django.conf import settings
+
+    addresses = getattr(settings, 'RECOMMENDER_SHARDS', None)
+    if not addresses:
+        return None
+    if _sharded is None:
+        with _lock:
+            if _sharded is None:
+                from .sharding import ShardedRecommender
+
+                _sharded = ShardedRecommender(
+                    addresses,
+                    timeout=getattr(settings, 'RECOMMENDER_SHARD_TIMEOUT', 0.5),
+                    retry_after=getattr(settings, 'RECOMMENDER_SHARD_RETRY', 30.0),
+                )
+    return _sharded
+
+
+def load_interactions():
+    """
+    Read all user-item interactions from reviews and orders.
+
+    Returns:
+        list: (user_id, product_id, rating) tuples; purchases count as 4.0
+        and browsing behavior (ImplicitScore) fills in pairs without either
+    """
+    from django.db.models import Avg, Count
+
+    from core import routers
+    from core.events import implicit_rating
+    from core.models import ImplicitScore, OrderItem, Review
+
+    # Full-history scans read from the analytics database, away from checkout
+    with routers.analytics():
+        interactions = [
+            (row['user_id'], row['product_id'], float(row['avg_rating']))
+            for row in Review.objects.values('user_id', 'product_id').annotate(avg_rating=Avg('rating'))
+        ]
+        interactions.extend(
+            (row['order__user_id'], row['product_id'], 4.0)
+            for row in OrderItem.objects.values('order__user_id', 'product_id').annotate(count=Count('id'))
+        )
+        known = {(user_id, product_id) for user_id, product_id, _ in interactions}
+        interactions.extend(
+            (user_id, product_id, implicit_rating(score))
+            for user_id, product_id, score in ImplicitScore.objects.filter(score__gt=0).values_list(
+                'user_id', 'product_id', 'score'
+            )
+            if (user_id, product_id) not in known
+        )
+    return interactions
+
+
+def train(interactions):
+    """Fit a new Recommender, or return None if there is nothing to learn from."""
+    if not interactions:
+        return None
+    from .recommender import Recommender
+
+    from .filters import ItemFilter
+
+    recommender = Recommender(use_cython=True)
+    recommender.fit(interactions)
+    recommender.item_filter = ItemFilter(recommender.item_ids)
+    recommender.item_filter.refresh()
+    return recommender
+
+
+def _publish(recommender, fitted_at):
+    global _recommender, _fitted_at
+    _fitted_at = fitted_at
+    _recommender = recommender
+
+
+def _fit():
+    """Train on current data, publish the model in one assignment and save it."""
+    from . import snapshot
+
+    started = time.time()
+    recommender = train(load_interactions())
+    if recommender is not None:
+        _publish(recommender, started)
+        snapshot.save(recommender, started)
+        _rebuild_store()
+    return recommender
+
+
+def _process_key():
+    """Deduplication key of local tasks: one call queued per process."""
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def _rebuild_store():
+    from . import store
+
+    if store.has_build():
+        from core.tasks import rebuild_recommendation_store
+
+        rebuild_recommendation_store.schedule(key=_process_key())
+
+
+def rebuild_store():
+    """Write the recommendation store from the model this process holds."""
+    from . import store
+
+    # In the order _publish sets them, so the model is never older than the time
+    fitted_at = _fitted_at
+    recommender = _recommender
+    if recommender is not None:
+        store.build(recommender, fitted_at)
+
+
+def _adopt(newer_than):
+    """Publish the saved model if its data was read after newer_than; returns it or None."""
+    from . import snapshot
+
+    loaded = snapshot.load(newer_than)
+    if loaded is None:
+        return None
+    _publish(*loaded)
+    return loaded[0]
+
+
+def _flight():
+    global _loading
+    if _loading is None:
+        with _lock:
+            if _loading is None:
+                from core.singleflight import SingleFlight
+
+                _loading = SingleFlight('recommender-fit')
+    return _loading
+
+
+def _shard_flight():
+    global _shard_refits
+    if _shard_refits is None:
+        with _lock:
+            if _shard_refits is None:
+                from core.singleflight import SingleFlight
+
+                _shard_refits = SingleFlight('recommender-shard-refit', poll_interval=1.0)
+    return _shard_refits
+
+
+def _refit_shards(sharded):
+    """Have every shard retrain, unless another process has them do so since this call."""
+    from . import store
+
+    requested = time.time()
+
+    def compute():
+        replies = sharded.refit()
+        # Stored lists come from a model the shards no longer serve
+        store.mark_stale(requested)
+        return replies
+
+    def refitted():
+        replies = sharded.info()
+        if len(replies) == len(sharded.addresses) and all(
+            (info['fitted_at'] or 0) >= requested for info in replies.values()
+        ):
+            return replies
+        return None
+
+    return _shard_flight().run(compute, check=refitted)
+
+
+def init_recommender(wait=True):
+    """
+    Train the recommender from existing data unless it is already loaded.
+
+    A model saved at most RECOMMENDER_MODEL_MAX_AGE seconds ago is loaded
+    instead. One thread per process, and one process at a time, trains;
+    the others wait for it and load what it saved. With wait=False the
+    work moves to the background pool and the caller returns at once, to
+    serve a fallback until the model is published.
+    """
+    from django.conf import settings
+
+    if _recommender is not None or get_sharded() is not None:
+        return
+    if wait:
+        oldest = time.time() - getattr(settings, 'RECOMMENDER_MODEL_MAX_AGE', 3600)
+        _flight().run(_fit, check=lambda: _recommender or _adopt(oldest))
+    elif not _flight().busy:
+        from core.tasks import load_recommender
+
+        # One load queued per process, however many requests arrive first
+        load_recommender.schedule(key=_process_key())
+
+
+def get_recommender(wait=True):
+    """The trained Recommender, loading it on first use; None without data."""
+    init_recommender(wait)
+    return _recommender
+
+
+def is_loaded():
+    return _recommender is not None
+
+
+def refit():
+    """
+    Retrain on current data and swap the new model in.
+
+    Only a model this process has loaded is retrained; one that was never
+    needed here is trained with current data on first use anyway. When
+    another process fits while this one waits, its model already covers
+    the data and is loaded instead. Readers keep the model they already
+    hold until the new one is published.
+
+    Shards are shared by every web process, so they retrain once: the
+    process that takes the lock asks them, and the others wait for it.
+    """
+    sharded = get_sharded()
+    if sharded is not None:
+        _refit_shards(sharded)
+    elif _recommender is not None:
+        requested = time.time()
+        _flight().run(_fit, check=lambda: _adopt(requested))
+
+
+def reload():
+    """Load a model saved by another process since this one's was fitted."""
+    if _recommender is not None and get_sharded() is None and not _flight().busy:
+        _adopt(_fitted_at)
+
+
+def recommend(user_id, n=6, categories=None, min_price=None, max_price=None, max_per_category=None, wait=True):
+    """
+    Top n recommendations among products that can be sold right now.
+
+    Args:
+        user_id: User to recommend for
+        n: Number of products wanted
+        categories: Only recommend products in these category ids
+        min_price: Lowest price to recommend
+        max_price: Highest price to recommend
+        max_per_category: Cap on products from one category
+        wait: Wait for the model to load; with False nothing is
+            recommended until it is published
+
+    Returns:
+        list: (product_id, score) tuples, best first
+    """
+    sharded = get_sharded()
+    if sharded is not None:
+        return sharded.recommend(
+            user_id, n=n, max_per_category=max_per_category,
+            categories=categories, min_price=min_price, max_price=max_price,
+        )
+    # One reference for the whole call, so a refit swapping the model
+    # mid-request cannot mix two models
+    recommender = get_recommender(wait)
+    if recommender is None:
+        return []
+    items = recommender.item_filter
+    return recommender.recommend(
+        user_id, n=n, mask=items.mask(categories, min_price, max_price),
+        categories=items.category, max_per_category=max_per_category,
+    )
+
+
+def popular(n=6):
+    """
+    Best-selling products that can be sold right now, by order count.
+
+    The ranking is cached for RECOMMENDER_POPULAR_TIMEOUT seconds; when it
+    expires one caller recomputes it while the others wait for the result
+    instead of all running the same aggregate over every order.
+
+    Returns:
+        list: Product ids, best first
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+
+    global _popular
+    if _popular is None:
+        with _lock:
+            if _popular is None:
+                from core.singleflight import SingleFlight
+
+                _popular = SingleFlight(POPULAR_KEY, lock_timeout=60, wait_timeout=10)
+
+    def compute():
+        from django.db.models import Count
+
+        from core import routers
+        from core.models import Product
+
+        with routers.analytics():
+            ranking = list(
+                Product.objects.filter(available=True, stock__gt=0).annotate(
+                    num_orders=Count('order_items')
+                ).order_by('-num_orders', 'pk').values_list('pk', flat=True)[:POPULAR_SIZE]
+            )
+        cache.set(POPULAR_KEY, ranking, getattr(settings, 'RECOMMENDER_POPULAR_TIMEOUT', 300))
+        return ranking
+
+    return _popular.run(compute, check=lambda: cache.get(POPULAR_KEY))[:n]
+
+
+def stored(user_id):
+    """Precomputed recommendations for a user, or None to compute them live."""
+    from django.conf import settings
+
+    from .store import get_store
+
+    return get_store().get(user_id, getattr(settings, 'RECOMMENDER_STORE_SIZE', 20))
+
+
+def user_changed(user_id):
+    """A user's ratings or purchases changed; stop serving their stored list."""
+    from .store import mark_changed
+
+    mark_changed(user_id)
+
+
+def product_changed(product):
+    """Apply a saved product to the loaded model's item filter."""
+    if _recommender is not None:
+        _recommender.item_filter.set(product.pk, product.available, product.stock, product.category_id, product.price)
+
+
+def product_deleted(product_id):
+    if _recommender is not None:
+        _recommender.item_filter.discard(product_id)
+
+
+def refresh_filter():
+    """Reload the loaded model's item filter from the database."""
+    if _recommender is not None:
+        _recommender.item_filter.refresh()
+
+
+def stock_changed(product_ids):
+    """Reload rows whose stock was changed with UPDATE queries, e.g. by checkout."""
+    if _recommender is not None:
+        _recommender.item_filter.refresh(product_ids)
+
+
+def warm_up():
+    """
+    Load the model ahead of the first request.
+
+    Meant to run in a pre-fork master: afterwards database connections are
+    closed so no socket is shared with the workers, and the surviving
+    objects are moved out of the garbage collector's reach so collections
+    in the workers do not touch (and so copy) their pages.
+    """
+    from django.db import DatabaseError, connections
+
+    try:
+        init_recommender()
+    except DatabaseError as e:
+        # e.g. the tables do not exist yet; the first request will retry
+        logger.warning("Recommender warm-up failed: %s", e)
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
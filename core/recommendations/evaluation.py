@@ -0,0 +1,243 @@
+"""
+Offline evaluation of recommender backends.
+
+Reviews and purchases are split by time: everything before the cut-off
+trains the model, and the products each user rated highly or bought
+afterwards (and had not touched before) are what a good model should
+have suggested. Every user with both history and a future is scored at
+once: top-k lists are stacked into a (users x k) array and looked up
+among the held-out (user, item) pairs with one binary search, so
+precision@k, recall@k, NDCG@k and catalog coverage are a handful of array
+operations. Generating the lists (the slow part) runs in worker
+processes, each given the fitted model once.
+"""
+import importlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from .base import BaseRecommender
+
+BACKENDS = {
+    'item-knn': 'core.recommendations.recommender.Recommender',
+    'popularity': 'core.recommendations.evaluation.PopularityRecommender',
+}
+
+
+class PopularityRecommender(BaseRecommender):
+    """Baseline: the most interacted-with items the user has not seen."""
+
+    def fit(self, interactions):
+        super().fit(interactions)
+        self.ranking = np.argsort(-(self.user_item_matrix > 0).sum(axis=0), kind='stable')
+
+    def recommend_items(self, user_id, n=5):
+        seen = self.user_item_matrix[self.user_id_map[user_id]] > 0 if user_id in self.user_id_map else None
+        ranked = self.ranking if seen is None else self.ranking[~seen[self.ranking]]
+        return [(self.reverse_item_map[i], 1.0 / (rank + 1)) for rank, i in enumerate(ranked[:n])]
+
+
+@dataclass
+class Split:
+    """Training interactions and, per evaluated user, the held-out relevant items."""
+    cutoff: float
+    train: list
+    test: dict
+
+
+def load_timed_interactions():
+    """
+    Read reviews and purchases with their timestamps.
+
+    Returns:
+        list: (user_id, product_id, rating, unix_time) tuples
+    """
+    from core import routers
+    from core.models import OrderItem, Review
+
+    with routers.analytics():
+        rows = [
+            (user_id, product_id, float(rating), created_at.timestamp())
+            for user_id, product_id, rating, created_at in Review.objects.values_list(
+                'user_id', 'product_id', 'rating', 'created_at'
+            ).iterator(chunk_size=10_000)
+        ]
+        rows.extend(
+            (user_id, product_id, 4.0, created_at.timestamp())
+            for user_id, product_id, created_at in OrderItem.objects.values_list(
+                'order__user_id', 'product_id', 'order__created_at'
+            ).iterator(chunk_size=10_000)
+        )
+    return rows
+
+
+def time_split(rows, test_fraction=0.2, min_rating=4.0):
+    """
+    Split interactions at the time leaving test_fraction of them for testing.
+
+    Training ratings are averaged per (user, product), as in production.
+    Test items are the ones rated at least min_rating (purchases count as 4)
+    that the user had no training interaction with; users without training
+    history or without such items are not evaluated.
+    """
+    if not rows:
+        return Split(0.0, [], {})
+    cutoff = float(np.quantile([row[3] for row in rows], 1 - test_fraction))
+    sums = {}
+    for user_id, product_id, rating, at in rows:
+        if at < cutoff:
+            total, count = sums.get((user_id, product_id), (0.0, 0))
+            sums[user_id, product_id] = (total + rating, count + 1)
+    train = [(u, p, total / count) for (u, p), (total, count) in sums.items()]
+    users = {u for u, _, _ in train}
+    test = {}
+    for user_id, product_id, rating, at in rows:
+        if at >= cutoff and rating >= min_rating and user_id in users and (user_id, product_id) not in sums:
+            test.setdefault(user_id, set()).add(product_id)
+    return Split(cutoff, train, test)
+
+
+def load_backend(name):
+    """Class for a backend name from BACKENDS or a dotted path."""
+    module, _, attr = BACKENDS.get(name, name).rpartition('.')
+    return getattr(importlib.import_module(module), attr)
+
+
+def _recommend(model, user_id, k, options):
+    if hasattr(model, 'recommend'):
+        return model.recommend(user_id, n=k, **options)
+    return model.recommend_items(user_id, n=k)
+
+
+_model = None
+
+
+def _init_worker(model):
+    global _model
+    _model = model
+
+
+def _recommend_chunk(args):
+    """Top-k lists and per-call latency for a list of users."""
+    user_ids, k, options = args
+    lists, latencies = [], []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        recommended = _recommend(_model, user_id, k, options)
+        latencies.append(time.perf_counter() - started)
+        lists.append(recommended[:k])
+    return lists, latencies
+
+
+def recommend_all(model, user_ids, k, workers=1, chunk_size=200, **options):
+    """
+    Top-k lists for every user, generated by worker processes.
+
+    Args:
+        model: Fitted recommender
+        user_ids: Users to recommend for
+        k: List length
+        workers: Processes to use; 1 runs in this process
+        chunk_size: Users per task
+        **options: Passed to Recommender.recommend (e.g. mask)
+
+    Returns:
+        tuple: (list of (item_id, score) lists in user_ids order, latencies
+        in seconds)
+    """
+    chunks = [(user_ids[i:i + chunk_size], k, options) for i in range(0, len(user_ids), chunk_size)]
+    if workers <= 1:
+        _init_worker(model)
+        results = [_recommend_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+            results = list(pool.map(_recommend_chunk, chunks))
+    lists = [items for chunk_lists, _ in results for items in chunk_lists]
+    latencies = [latency for _, chunk_latencies in results for latency in chunk_latencies]
+    return lists, latencies
+
+
+def ranking_metrics(recommended, relevant, k):
+    """
+    Mean precision@k, recall@k and NDCG@k.
+
+    Args:
+        recommended: (users, k) array of item positions, -1 where a list
+            was shorter than k
+        relevant: List of arrays with each user's held-out item positions
+        k: Cut-off
+
+    Returns:
+        dict: precision, recall and ndcg
+    """
+    # Encode (user row, item) pairs as single integers so membership of
+    # every recommended item is one sorted-array lookup
+    width = int(max(recommended.max(), max(items.max() for items in relevant))) + 1
+    keys = np.concatenate([row * width + items for row, items in enumerate(relevant)])
+    keys.sort()
+    candidates = np.arange(len(recommended))[:, None] * width + recommended
+    found = np.minimum(np.searchsorted(keys, candidates), len(keys) - 1)
+    hits = (keys[found] == candidates) & (recommended >= 0)
+
+    n_relevant = np.array([len(items) for items in relevant])
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts).sum(axis=1)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[np.minimum(n_relevant, k)]
+    return {
+        'precision': float((hits.sum(axis=1) / k).mean()),
+        'recall': float((hits.sum(axis=1) / n_relevant).mean()),
+        'ndcg': float((dcg / ideal).mean()),
+    }
+
+
+def evaluate(backend, split, k=10, workers=1, max_users=None, seed=0):
+    """
+    Fit a backend on the training split and score its top-k lists.
+
+    Args:
+        backend: Name in BACKENDS or dotted path of the recommender class
+        split: Split from time_split()
+        k: List length
+        workers: Processes generating recommendations
+        max_users: Evaluate a random sample of this many users
+        seed: Seed for the user sample
+
+    Returns:
+        dict: Quality metrics, coverage, fit time and latency percentiles
+    """
+    user_ids = sorted(split.test)
+    if max_users and len(user_ids) > max_users:
+        user_ids = sorted(np.random.default_rng(seed).choice(user_ids, max_users, replace=False).tolist())
+    if not user_ids:
+        raise ValueError('No users have interactions on both sides of the cut-off')
+
+    model = load_backend(backend)()
+    started = time.perf_counter()
+    model.fit(split.train)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    lists, latencies = recommend_all(model, user_ids, k, workers)
+    recommend_seconds = time.perf_counter() - started
+
+    catalog = sorted({p for _, p, _ in split.train} | {p for items in split.test.values() for p in items})
+    position = {item_id: i for i, item_id in enumerate(catalog)}
+    recommended = np.full((len(user_ids), k), -1, dtype=np.int64)
+    for row, items in enumerate(lists):
+        recommended[row, :len(items)] = [position.get(item_id, -1) for item_id, _ in items]
+    relevant = [np.array([position[item_id] for item_id in split.test[user_id]]) for user_id in user_ids]
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'backend': backend,
+        'k': k,
+        'users': len(user_ids),
+        **ranking_metrics(recommended, relevant, k),
+        'coverage': len(np.unique(recommended[recommended >= 0])) / len(catalog),
+        'fit_s': round(fit_seconds, 3),
+        'recommend_s': round(recommend_seconds, 3),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 3),
+    }
@@ -0,0 +1,184 @@
+"""
+Eligibility masks aligned with the recommender's item index.
+
+ItemFilter keeps one NumPy array per product attribute the storefront
+filters on (whether it can be sold, its category and price), in the same
+order as the model's items, so business rules become a boolean mask that
+Recommender.recommend applies before picking the top N. Product signals
+update single rows; stock changes made with UPDATE queries (checkout,
+expired reservations) are picked up by a full refresh every
+RECOMMENDER_FILTER_REFRESH seconds, off the request path (the
+refresh_item_filter task, or a thread in shard processes).
+
+A full refresh fills new arrays and publishes them with one assignment,
+so a reader never sees them half loaded. It streams the whole product
+table rather than asking for the model's ids, which would not fit in one
+statement for a large catalog; partial refreshes ask in batches.
+"""
+import threading
+import time
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+Columns = namedtuple('Columns', 'eligible category price')
+
+FIELDS = ('pk', 'available', 'stock', 'category_id', 'price')
+CHUNK_SIZE = 5000
+ID_BATCH_SIZE = 500
+
+
+class ItemFilter:
+    """Sellable flag, category and price for every item the model knows."""
+
+    def __init__(self, item_ids):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.positions = {item_id: i for i, item_id in enumerate(self.item_ids.tolist())}
+        self._order = np.argsort(self.item_ids, kind='stable')
+        self.columns = self._empty()
+        self.refreshed_at = 0.0
+        self._changed = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _empty(self):
+        size = len(self.item_ids)
+        return Columns(np.zeros(size, dtype=bool), np.full(size, -1, dtype=np.int64), np.zeros(size, dtype=np.float64))
+
+    @property
+    def eligible(self):
+        return self.columns.eligible
+
+    @property
+    def category(self):
+        return self.columns.category
+
+    @property
+    def price(self):
+        return self.columns.price
+
+    def set(self, product_id, available, stock, category_id, price):
+        """Update one product's row; products the model does not know are ignored."""
+        i = self.positions.get(product_id)
+        if i is not None:
+            with self._lock:
+                self._set(self.columns, i, available, stock, category_id, price)
+                if self._changed is not None:
+                    self._changed[i] = (available, stock, category_id, price)
+
+    @staticmethod
+    def _set(columns, i, available, stock, category_id, price):
+        columns.eligible[i] = available and stock > 0
+        columns.category[i] = category_id if category_id is not None else -1
+        columns.price[i] = price
+
+    def discard(self, product_id):
+        """Mark a deleted product as never recommendable."""
+        i = self.positions.get(product_id)
+        if i is not None:
+            with self._lock:
+                self.columns.eligible[i] = False
+                if self._changed is not None:
+                    self._changed[i] = None
+
+    def refresh(self, product_ids=None):
+        """
+        Reload rows from the database.
+
+        Args:
+            product_ids: Products to reload in place; all items when
+                omitted, into new arrays that replace the current ones
+        """
+        from core.models import Product
+
+        if product_ids is not None:
+            ids = list(product_ids)
+            for start in range(0, len(ids), ID_BATCH_SIZE):
+                for row in Product.objects.filter(pk__in=ids[start:start + ID_BATCH_SIZE]).values_list(*FIELDS):
+                    self.set(*row)
+            return
+
+        with self._refresh_lock:
+            self.refreshed_at = time.monotonic()
+            with self._lock:
+                self._changed = {}
+            # Products missing from the table were deleted and stay ineligible
+            columns = self._empty()
+            rows = Product.objects.order_by().values_list(*FIELDS).iterator(chunk_size=CHUNK_SIZE)
+            while chunk := list(islice(rows, CHUNK_SIZE)):
+                self._load(columns, chunk)
+            with self._lock:
+                # Rows set while loading may be newer than what was read
+                for i, row in self._changed.items():
+                    if row is None:
+                        columns.eligible[i] = False
+                    else:
+                        self._set(columns, i, *row)
+                self._changed = None
+                self.columns = columns
+
+    def _load(self, columns, rows):
+        """Fill columns from product rows, skipping products the model does not know."""
+        if not len(self.item_ids):
+            return
+        ids, available, stock, category, price = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        found = self._order[np.minimum(np.searchsorted(self.item_ids, ids, sorter=self._order), len(self.item_ids) - 1)]
+        known = self.item_ids[found] == ids
+        i = found[known]
+        columns.eligible[i] = (np.array(available, dtype=bool) & (np.array(stock) > 0))[known]
+        columns.category[i] = np.array([-1 if c is None else c for c in category], dtype=np.int64)[known]
+        columns.price[i] = np.array(price, dtype=np.float64)[known]
+
+    def mask(self, categories=None, min_price=None, max_price=None):
+        """
+        Items that may be recommended.
+
+        Args:
+            categories: Category ids to restrict to
+            min_price: Lowest price to include
+            max_price: Highest price to include
+
+        Returns:
+            numpy.ndarray: Boolean array aligned with the item index
+        """
+        # One set of arrays for the whole call, however refreshes interleave
+        columns = self.columns
+        mask = columns.eligible.copy()
+        if categories is not None:
+            mask &= np.isin(columns.category, list(categories))
+        if min_price is not None:
+            mask &= columns.price >= float(min_price)
+        if max_price is not None:
+            mask &= columns.price <= float(max_price)
+        return mask
+
+
+def diversify(ranked, category, n, max_per_category):
+    """
+    Re-rank so that no category takes more than max_per_category slots.
+
+    Items pushed out by the cap fill any slots left over, so the result is
+    only shorter than n when ranked is.
+
+    Args:
+        ranked: Item positions, best first
+        category: Category of every item position
+        n: Number of items wanted
+        max_per_category: Cap per category
+
+    Returns:
+        list: Item positions, best first
+    """
+    picked, skipped, taken = [], [], {}
+    for i in ranked:
+        if len(picked) == n:
+            break
+        c = category[i]
+        if taken.get(c, 0) < max_per_category:
+            taken[c] = taken.get(c, 0) + 1
+            picked.append(i)
+        else:
+            skipped.append(i)
+    return picked + skipped[:n - len(picked)]
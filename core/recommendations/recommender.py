@@ -1,4 +1,4 @@
-""
+"""
 Advanced recommender system with Cython-optimized similarity calculations.
 """
 import numpy as np
@@ -21,6 +21,7 @@ class Recommender:
         self.similarities = None
         self.id_maps = {}
         self.reverse_maps = {}
+        self.item_ids = None
         self.use_cython = use_cython and CYTHON_AVAILABLE
     
     def fit(self, interactions: List[Tuple[int, int, float]]) -> None:
@@ -34,6 +35,7 @@ class Recommender:
         
         self.id_maps['user'] = {uid: i for i, uid in enumerate(user_ids)}
         self.id_maps['item'] = {iid: i for i, iid in enumerate(item_ids)}
+        self.item_ids = np.array(list(self.id_maps['item']), dtype=np.int64)
         
         # Initialize matrix
         n_users = len(self.id_maps['user'])
@@ -76,44 +78,79 @@ class Recommender:
         self, 
         user_id: int, 
         n: int = 5, 
-        min_similarity: float = 0.0
+        min_similarity: float = 0.0,
+        mask: Optional[np.ndarray] = None,
+        categories: Optional[np.ndarray] = None,
+        max_per_category: Optional[int] = None
     ) -> List[Tuple[int, float]]:
-        """Generate item recommendations for a user."""
+        """
+        Generate item recommendations for a user.
+
+        Args:
+            user_id: User to recommend for
+            n: Number of items to return
+            min_similarity: Ignore item pairs at or below this similarity
+            mask: Boolean array over the item index; only True items are
+                scored, so filtered items never take a slot
+            categories: Category of every item, for max_per_category
+            max_per_category: Cap on items per category in the result
+        """
         if user_id not in self.id_maps['user']:
             return []
             
         user_idx = self.id_maps['user'][user_id]
         user_ratings = self.user_item_matrix[user_idx]
-        rated_items = set(np.where(user_ratings > 0)[0])
-        
-        # Calculate predicted ratings
-        predicted = np.zeros(self.user_item_matrix.shape[1])
-        
-        for item_idx in range(self.user_item_matrix.shape[1]):
-            if item_idx in rated_items:
-                continue
-                
-            # Find similar items that the user has rated
-            sim_items = [
-                (i, sim) 
-                for i, sim in enumerate(self.similarities[item_idx])
-                if i in rated_items and sim > min_similarity
-            ]
-            
-            if not sim_items:
-                continue
-                
-            # Calculate weighted average
-            sum_sim = sum(sim for _, sim in sim_items)
-            if sum_sim > 0:
-                weighted_sum = sum(user_ratings[i] * sim for i, sim in sim_items)
-                predicted[item_idx] = weighted_sum / sum_sim
+        rated = user_ratings > 0
+        rated_idx = np.flatnonzero(rated)
+        candidates = ~rated if mask is None else ~rated & mask
+        candidate_idx = np.flatnonzero(candidates)
+        if not len(rated_idx) or not len(candidate_idx):
+            return []
         
-        # Get top N recommendations
-        item_scores = [
-            (list(self.id_maps['item'].keys())[i], score)
-            for i, score in enumerate(predicted)
-            if i not in rated_items and score > 0
-        ]
+        sims = self.similarities[np.ix_(candidate_idx, rated_idx)]
+        predicted = predict_ratings(sims, user_ratings[rated_idx], min_similarity)
+        order, predicted = top_n(predicted, n, candidate_idx, categories, max_per_category)
         
-        return sorted(item_scores, key=lambda x: x[1], reverse=True)[:n]
+        return [(int(self.item_ids[candidate_idx[i]]), float(score)) for i, score in zip(order, predicted)]
+
+
+def predict_ratings(similarities: np.ndarray, ratings: np.ndarray, min_similarity: float = 0.0) -> np.ndarray:
+    """
+    Predicted rating of every candidate item, for all candidates at once.
+
+    Args:
+        similarities: (candidates x rated items) similarity block
+        ratings: The user's ratings of the rated items
+        min_similarity: Ignore pairs at or below this similarity
+
+    Returns:
+        np.ndarray: Similarity-weighted average of the ratings per
+        candidate, 0 where no rated item is similar enough
+    """
+    sims = np.where(similarities > min_similarity, similarities, 0.0)
+    sum_sim = sims.sum(axis=1)
+    return np.divide(sims @ ratings, sum_sim, out=np.zeros(len(sims)), where=sum_sim > 0)
+
+
+def top_n(
+    predicted: np.ndarray,
+    n: int,
+    tiebreak: np.ndarray,
+    categories: Optional[np.ndarray] = None,
+    max_per_category: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best n positive scores, highest first and ties by tiebreak.
+
+    Returns:
+        tuple: Positions into predicted and their scores
+    """
+    candidates = np.flatnonzero(predicted > 0)
+    if max_per_category is None and len(candidates) > n:
+        candidates = candidates[np.argpartition(-predicted[candidates], n - 1)[:n]]
+    order = candidates[np.lexsort((tiebreak[candidates], -predicted[candidates]))]
+    if max_per_category is not None:
+        from .filters import diversify
+        order = np.array(diversify(order, categories[tiebreak], n, max_per_category), dtype=np.int64)
+    order = order[:n]
+    return order, predicted[order]
@@ -0,0 +1,311 @@
+"""
+Item-partitioned recommender served by shard processes.
+
+Product p belongs to shard p % count. Each shard holds only the rows of the
+item similarity matrix for its own products, and of those only the
+columns of products rated together with one of them, along with the
+ratings of those products alone; model memory and scoring CPU are split
+N ways. A shard answers
+"top n of my products for this user" over a multiprocessing.connection
+socket; the coordinator in the web process sends the request to every
+shard at once, waits up to RECOMMENDER_SHARD_TIMEOUT and merges the sorted
+answers with a heap.
+
+A shard that is down or slow only costs its share of the candidates: the
+coordinator returns what the other shards sent and does not try the
+failed one again for RECOMMENDER_SHARD_RETRY seconds. When no shard
+answers the result is empty and callers fall back to popular products.
+
+Protocol: pickled tuples over an authenticated connection.
+    ('recommend', user_id, n, constraints) -> ('ok', [(product_id, score, category_id), ...])
+    ('info',)                              -> ('ok', {...})
+    ('refit',)                             -> ('ok', {...})
+Errors come back as ('error', message).
+"""
+import hashlib
+import heapq
+import logging
+import os
+import threading
+import time
+from itertools import islice
+from multiprocessing.connection import Client, Listener, wait
+
+import numpy as np
+
+from .filters import ItemFilter, diversify
+from .recommender import predict_ratings, top_n
+
+logger = logging.getLogger(__name__)
+
+
+def parse_address(address):
+    """'host:port' becomes a TCP address, anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def authkey():
+    from django.conf import settings
+
+    return hashlib.sha256(f'recommender-shards:{settings.SECRET_KEY}'.encode()).digest()
+
+
+class ItemShard:
+    """Similarity rows and eligibility for the products one shard owns."""
+
+    def __init__(self, index, count, filter_refresh=60):
+        self.index = index
+        self.count = count
+        self.filter_refresh = filter_refresh
+        self.user_ids = None
+        self.user_items = None
+        self.own = None
+        self.item_ids = None
+        self.similarities = None
+        self.item_filter = None
+        self.fitted_at = None
+
+    def fit(self, interactions, fitted_at=None):
+        """
+        Fit this shard's part of the item-based model.
+
+        Cosine similarities between the shard's products and all products
+        are one sparse product of column-normalised rating matrices. Only
+        the columns where one of the shard's products has a non-zero
+        similarity can add to a score, so the rest of the similarities and
+        ratings are dropped once the rows are built.
+
+        Args:
+            interactions: (user_id, product_id, rating) tuples
+            fitted_at: Unix time the interactions were read; now by default
+        """
+        from scipy import sparse
+
+        # The last rating of a pair wins, as in Recommender.fit
+        latest = {(user_id, item_id): rating for user_id, item_id, rating in interactions}
+        self.fitted_at = time.time() if fitted_at is None else fitted_at
+        if not latest:
+            return
+        users, items = (np.array(column, dtype=np.int64) for column in zip(*latest))
+        ratings = np.fromiter(latest.values(), dtype=np.float64, count=len(latest))
+        user_ids, rows = np.unique(users, return_inverse=True)
+        item_ids, cols = np.unique(items, return_inverse=True)
+        matrix = sparse.csr_matrix((ratings, (rows, cols)), shape=(len(user_ids), len(item_ids)))
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+        normalised = matrix.multiply(1.0 / np.where(norms > 0, norms, 1.0)).tocsc()
+
+        own = np.flatnonzero(item_ids % self.count == self.index)
+        similarities = (normalised[:, own].T @ normalised).tocsc()
+        columns = np.union1d(np.flatnonzero(similarities.getnnz(axis=0)), own)
+        user_items = matrix.tocsc()[:, columns].tocsr()
+        users = np.flatnonzero(user_items.getnnz(axis=1))
+        self.user_ids = user_ids[users]
+        self.user_items = user_items[users]
+        # Positions of the shard's products among the kept columns
+        self.own = np.searchsorted(columns, own)
+        self.item_ids = item_ids[own]
+        self.similarities = similarities[:, columns].toarray()
+        self.item_filter = ItemFilter(self.item_ids)
+        self.item_filter.refresh()
+
+    def recommend(self, user_id, n, categories=None, min_price=None, max_price=None, min_similarity=0.0):
+        """Top n of this shard's products for a user, best first."""
+        if self.similarities is None:
+            return []
+        u = np.searchsorted(self.user_ids, user_id)
+        if u == len(self.user_ids) or self.user_ids[u] != user_id or not len(self.item_ids):
+            return []
+        history = self.user_items[u]
+        rated_idx, ratings = history.indices, history.data
+        candidates = self.item_filter.mask(categories, min_price, max_price)
+        candidates[np.isin(self.own, rated_idx)] = False
+        candidate_idx = np.flatnonzero(candidates)
+        if not len(candidate_idx) or not len(rated_idx):
+            return []
+
+        predicted = predict_ratings(self.similarities[np.ix_(candidate_idx, rated_idx)], ratings, min_similarity)
+        order, scores = top_n(predicted, n, self.item_ids[candidate_idx])
+        return [
+            (int(self.item_ids[candidate_idx[i]]), float(score), int(self.item_filter.category[candidate_idx[i]]))
+            for i, score in zip(order, scores)
+        ]
+
+    def info(self):
+        return {
+            'shard': self.index,
+            'items': 0 if self.item_ids is None else len(self.item_ids),
+            'model_bytes': 0 if self.similarities is None else self.similarities.nbytes,
+            'fitted_at': self.fitted_at,
+        }
+
+
+class ShardServer:
+    """Serves an ItemShard, one thread per coordinator connection."""
+
+    def __init__(self, shard, address):
+        self.shard = shard
+        self.address = address
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        address = parse_address(self.address)
+        if isinstance(address, str) and os.path.exists(address):
+            # Left behind by a shard that was killed
+            os.unlink(address)
+        threading.Thread(target=self._refresh_forever, name='filter-refresh', daemon=True).start()
+        with Listener(address, authkey=authkey()) as listener:
+            logger.info("Recommender shard %d listening on %s", self.shard.index, self.address)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    logger.exception("Rejected a shard connection")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _refresh_forever(self):
+        """Reload the item filter every filter_refresh seconds, away from requests."""
+        from django.db import connections
+
+        while True:
+            time.sleep(self.shard.filter_refresh)
+            shard = self.shard
+            if shard.item_filter is None:
+                continue
+            try:
+                shard.item_filter.refresh()
+            except Exception:
+                logger.exception("Refreshing the item filter of shard %d failed", shard.index)
+            finally:
+                connections.close_all()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(('ok', self.dispatch(*message)))
+                except Exception as e:
+                    logger.exception("Shard request %r failed", message[:1])
+                    conn.send(('error', str(e)))
+
+    def dispatch(self, command, *args):
+        if command == 'recommend':
+            user_id, n, constraints = args
+            return self.shard.recommend(user_id, n, **constraints)
+        if command == 'refit':
+            from . import load_interactions
+
+            with self._lock:
+                shard = ItemShard(self.shard.index, self.shard.count, self.shard.filter_refresh)
+                started = time.time()
+                shard.fit(load_interactions(), started)
+                self.shard = shard
+            return shard.info()
+        if command == 'info':
+            return self.shard.info()
+        raise ValueError(f'Unknown command {command!r}')
+
+
+class ShardedRecommender:
+    """Coordinator: scatters a request to every shard and merges the answers."""
+
+    def __init__(self, addresses, timeout=0.5, retry_after=30.0):
+        self.addresses = list(addresses)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.failures = 0
+        self._down_until = {}
+        # Connections are per thread so concurrent requests never interleave
+        self._local = threading.local()
+
+    def _connection(self, address):
+        connections = self._local.__dict__.setdefault('connections', {})
+        if address not in connections:
+            if time.monotonic() < self._down_until.get(address, 0):
+                return None
+            try:
+                connections[address] = Client(parse_address(address), authkey=authkey())
+            except (OSError, EOFError) as e:
+                self._mark_down(address, e)
+                return None
+        return connections[address]
+
+    def _mark_down(self, address, error):
+        self.failures += 1
+        self._down_until[address] = time.monotonic() + self.retry_after
+        conn = getattr(self._local, 'connections', {}).pop(address, None)
+        if conn is not None:
+            conn.close()
+        logger.warning("Recommender shard %s unavailable: %s", address, error)
+
+    def _scatter(self, message, timeout=None):
+        """Send message to every reachable shard and gather replies until the timeout."""
+        pending = {}
+        for address in self.addresses:
+            conn = self._connection(address)
+            if conn is None:
+                continue
+            try:
+                conn.send(message)
+                pending[conn] = address
+            except OSError as e:
+                self._mark_down(address, e)
+
+        replies = {}
+        deadline = time.monotonic() + (timeout or self.timeout)
+        while pending:
+            ready = wait(list(pending), max(0.0, deadline - time.monotonic()))
+            if not ready:
+                break
+            for conn in ready:
+                address = pending.pop(conn)
+                try:
+                    status, payload = conn.recv()
+                except (EOFError, OSError) as e:
+                    self._mark_down(address, e)
+                    continue
+                if status == 'ok':
+                    replies[address] = payload
+                else:
+                    logger.warning("Recommender shard %s failed: %s", address, payload)
+        for address in pending.values():
+            # A late reply would be read as the answer to the next request
+            self._mark_down(address, 'timed out')
+        return replies
+
+    def recommend(self, user_id, n=6, max_per_category=None, **constraints):
+        """
+        Merged top n over all shards.
+
+        Args:
+            user_id: User to recommend for
+            n: Number of products wanted
+            max_per_category: Cap on products from one category
+            **constraints: categories, min_price and max_price filters
+
+        Returns:
+            list: (product_id, score) tuples, best first
+        """
+        replies = self._scatter(('recommend', user_id, n, constraints))
+        if len(replies) < len(self.addresses):
+            logger.info("Recommendations for user %s from %d of %d shards", user_id, len(replies), len(self.addresses))
+        merged = heapq.merge(*replies.values(), key=lambda item: (-item[1], item[0]))
+        if max_per_category is None:
+            return [(product_id, score) for product_id, score, _ in islice(merged, n)]
+        merged = list(merged)
+        ranked = diversify(range(len(merged)), [category for _, _, category in merged], n, max_per_category)
+        return [merged[i][:2] for i in ranked]
+
+    def refit(self, timeout=600):
+        """Ask every shard to retrain; returns their info by address."""
+        return self._scatter(('refit',), timeout)
+
+    def info(self):
+        return self._scatter(('info',))
@@ -0,0 +1,69 @@
+"""
+Trained model shared between processes through a file.
+
+The process that fits a model saves it; the others load it rather than
+fit the same data again: callers that waited on the SingleFlight of that
+fit, processes starting up while it is recent, and every process's
+reload_recommender task once a refit elsewhere saved a newer one.
+
+The file holds two pickles, when the model's training data was read and
+then the model itself, so a reader can tell whether it is newer than its
+own without loading it. It is replaced atomically, so a reader gets the
+old model or the new one.
+"""
+import os
+import pickle
+import threading
+
+from django.conf import settings
+
+
+def _path():
+    directory = getattr(settings, 'RECOMMENDER_MODEL_DIR', os.path.join(settings.BASE_DIR, 'var', 'recommender'))
+    return os.path.join(directory, 'model.pickle')
+
+
+def save(recommender, fitted_at):
+    """
+    Write a trained model for other processes.
+
+    Args:
+        recommender: Trained Recommender; its item filter is left out
+        fitted_at: Unix time its training data was read
+    """
+    path = _path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state = {name: value for name, value in vars(recommender).items() if name != 'item_filter'}
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(fitted_at, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load(newer_than=None):
+    """
+    The saved model, if there is one fitted after newer_than.
+
+    Returns:
+        tuple: (Recommender with a freshly loaded item filter, Unix time its
+        training data was read), or None
+    """
+    from .filters import ItemFilter
+    from .recommender import CYTHON_AVAILABLE, Recommender
+
+    try:
+        with open(_path(), 'rb') as f:
+            fitted_at = pickle.load(f)
+            if newer_than is not None and fitted_at <= newer_than:
+                return None
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    recommender = Recommender.__new__(Recommender)
+    vars(recommender).update(state)
+    # Saved by a process that may have had the extension when this one has not
+    recommender.use_cython = recommender.use_cython and CYTHON_AVAILABLE
+    recommender.item_filter = ItemFilter(recommender.item_ids)
+    recommender.item_filter.refresh()
+    return recommender, fitted_at
@@ -0,0 +1,178 @@
+"""
+Precomputed recommendations, one fixed-width record per user.
+
+build() runs the trained model for every user it knows and writes the
+top RECOMMENDER_STORE_SIZE products and scores into records-<build>.npy, a
+structured array with one row per user, plus index-<build>.npy, an array
+indexed by user id holding that user's row (or -1). Both are memory-mapped
+by web processes, so serving a user is two array reads. current.json names
+the live build and is replaced atomically; readers notice the new file
+within RECOMMENDER_STORE_RELOAD_INTERVAL seconds.
+
+Users whose reviews or orders changed after a build are marked in the
+cache (mark_changed) and computed live until the next build. Once a
+build exists, every refit of the model rebuilds the store from the new
+model in the background; shards, whose model cannot be read from here,
+mark the whole store stale instead (mark_stale) so every user is served
+live until build_recommendation_store runs again.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+CHANGED_KEY = 'recs-changed:{}'
+STALE_KEY = 'recs-stale'
+KEEP_BUILDS = 2
+
+
+def _directory():
+    return getattr(settings, 'RECOMMENDER_STORE_DIR', os.path.join(settings.BASE_DIR, 'var', 'recommendations'))
+
+
+def _path(name):
+    return os.path.join(_directory(), name)
+
+
+def build(recommender, started_at, size=None, workers=1):
+    """
+    Write every user's recommendations and make them the live build.
+
+    Args:
+        recommender: Trained Recommender with an item_filter
+        started_at: When its training data was read; changes after this
+            are served live
+        size: Products kept per user
+        workers: Processes computing recommendations
+
+    Returns:
+        int: Number of users written
+    """
+    from .evaluation import recommend_all
+
+    size = size or getattr(settings, 'RECOMMENDER_STORE_SIZE', 20)
+    user_ids = sorted(recommender.id_maps['user'])
+    lists, _ = recommend_all(
+        recommender, user_ids, size, workers,
+        mask=recommender.item_filter.mask(), categories=recommender.item_filter.category,
+        max_per_category=getattr(settings, 'RECOMMENDER_MAX_PER_CATEGORY', None),
+    )
+
+    records = np.zeros(len(user_ids), dtype=[('items', '<i8', (size,)), ('scores', '<f4', (size,))])
+    records['items'] = -1
+    for row, recommended in enumerate(lists):
+        if recommended:
+            items, scores = zip(*recommended)
+            records['items'][row, :len(items)] = items
+            records['scores'][row, :len(items)] = scores
+    index = np.full(max(user_ids, default=-1) + 1, -1, dtype=np.int32)
+    index[user_ids] = np.arange(len(user_ids), dtype=np.int32)
+
+    build_id = f'{int(started_at * 1000)}-{os.getpid()}'
+    os.makedirs(_directory(), exist_ok=True)
+    np.save(_path(f'records-{build_id}.npy'), records)
+    np.save(_path(f'index-{build_id}.npy'), index)
+    tmp = _path(f'.current.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'build': build_id, 'built_at': started_at, 'size': size, 'users': len(user_ids)}, f)
+    os.replace(tmp, _path('current.json'))
+    _remove_old_builds(build_id)
+    return len(user_ids)
+
+
+def _remove_old_builds(current):
+    builds = sorted(
+        {name[len('index-'):-len('.npy')] for name in os.listdir(_directory()) if name.startswith('index-')},
+        key=lambda build_id: int(build_id.split('-')[0]),
+    )
+    for build_id in builds[:-KEEP_BUILDS]:
+        if build_id != current:
+            for name in (f'records-{build_id}.npy', f'index-{build_id}.npy'):
+                try:
+                    os.unlink(_path(name))
+                except FileNotFoundError:
+                    pass
+
+
+def has_build():
+    """Whether a build is live, so refits should keep it up to date."""
+    return os.path.exists(_path('current.json'))
+
+
+def mark_stale(since):
+    """Serve every user live until a build of data read after since."""
+    cache.set(STALE_KEY, since, timeout=None)
+
+
+def mark_changed(user_id):
+    """Serve this user live until the next build."""
+    cache.set(CHANGED_KEY.format(user_id), time.time(), timeout=getattr(settings, 'RECOMMENDER_STORE_MAX_AGE', 7 * 86400))
+
+
+class RecommendationStore:
+    """Reader for the live build, re-opened when current.json changes."""
+
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self.built_at = None
+        self._records = self._index = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(_path('current.json')).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                with open(_path('current.json')) as f:
+                    current = json.load(f)
+                records = np.load(_path(f'records-{current["build"]}.npy'), mmap_mode='r')
+                index = np.load(_path(f'index-{current["build"]}.npy'), mmap_mode='r')
+            except (FileNotFoundError, ValueError, KeyError):
+                self._records = self._index = self.built_at = self._mtime = None
+                return
+            self._records, self._index, self.built_at, self._mtime = records, index, current['built_at'], mtime
+
+    def get(self, user_id, n):
+        """
+        Stored recommendations for a user.
+
+        Returns:
+            list: (product_id, score) tuples, best first, or None when the
+            user is not in the build or changed since it was made
+        """
+        self._refresh()
+        records, index = self._records, self._index
+        if index is None or not 0 <= user_id < len(index) or index[user_id] < 0:
+            return None
+        key = CHANGED_KEY.format(user_id)
+        marks = cache.get_many([key, STALE_KEY])
+        if max(marks.get(key, -1), marks.get(STALE_KEY, -1)) >= self.built_at:
+            return None
+        row = records[index[user_id]]
+        return [(int(item), float(score)) for item, score in zip(row['items'][:n], row['scores'][:n]) if item >= 0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide store reader."""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RecommendationStore(getattr(settings, 'RECOMMENDER_STORE_RELOAD_INTERVAL', 30.0))
+    return _store
@@ -0,0 +1,146 @@
+"""
+Responsive image renditions for product images.
+
+Each uploaded image is resized to RENDITION_WIDTHS in WebP and JPEG and
+stored under a name derived from the original's content hash, so files
+never change once written and can be served with far-future cache headers.
+The list of files is kept on Product.image_renditions and turned into a
+srcset by the responsive_image template tag.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+
+from .fragments import bump_catalog_version
+from .models import Product, ProductRating
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def rendition_widths():
+    return tuple(sorted(getattr(settings, 'RENDITION_WIDTHS', (160, 320, 640, 1280))))
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:20]
+
+
+def render(data, widths=None, storage=None):
+    """
+    Resize image bytes into every rendition and store the results.
+
+    Args:
+        data: Original image file contents
+        widths: Target widths, defaults to RENDITION_WIDTHS
+        storage: Storage to write to, defaults to default_storage
+
+    Returns:
+        dict: Manifest with the content hash, original size and, per format,
+        a list of [width, height, name] entries sorted by width
+    """
+    # Pillow is only needed by whoever renders, not by every process
+    from PIL import Image, ImageOps
+
+    storage = storage or default_storage
+    widths = widths or rendition_widths()
+    digest = content_hash(data)
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    manifest = {'hash': digest, 'width': image.width, 'height': image.height}
+
+    # Never upscale; images narrower than the smallest width get one rendition
+    targets = [w for w in widths if w < image.width] or [image.width]
+    if image.width <= widths[-1] and image.width not in targets:
+        targets.append(image.width)
+
+    for ext, options in FORMATS.items():
+        entries = []
+        for width in targets:
+            height = round(image.height * width / image.width)
+            name = f'renditions/{digest[:2]}/{digest}-{width}.{ext}'
+            if not storage.exists(name):
+                buffer = io.BytesIO()
+                image.resize((width, height), Image.LANCZOS).save(buffer, **options)
+                storage.save(name, ContentFile(buffer.getvalue()))
+            entries.append([width, height, name])
+        manifest[ext] = entries
+    return manifest
+
+
+def render_stored(name):
+    """Render an image already in default_storage; safe to run in a worker process."""
+    with default_storage.open(name, 'rb') as f:
+        data = f.read()
+    manifest = render(data)
+    manifest['source'] = name
+    return manifest
+
+
+def render_field(image):
+    """Render an ImageField file, recording which upload the manifest is for."""
+    image.open('rb')
+    try:
+        data = image.read()
+    finally:
+        image.close()
+    manifest = render(data)
+    manifest['source'] = image.name
+    return manifest
+
+
+def needs_renditions(product):
+    """True if the product's image has no up-to-date renditions."""
+    if not product.image:
+        return bool(product.image_renditions)
+    return (product.image_renditions or {}).get('source') != product.image.name
+
+
+def save_manifests(manifests):
+    """
+    Store rendition manifests and retire the cards that show them.
+
+    A manifest is only stored if the product still has the image it was
+    rendered from, so a newer upload is never overwritten by a stale one.
+
+    Args:
+        manifests: Dictionary mapping product IDs to manifests
+
+    Returns:
+        int: Number of products updated
+    """
+    updated = []
+    for product_id, manifest in manifests.items():
+        if Product.objects.filter(pk=product_id, image=manifest.get('source', '')).update(image_renditions=manifest):
+            updated.append(product_id)
+    if updated:
+        ProductRating.objects.filter(product_id__in=updated).update(version=F('version') + 1)
+        bump_catalog_version()
+    return len(updated)
+
+
+def update_product(product):
+    """Render a product's image if its renditions are missing or stale."""
+    if needs_renditions(product):
+        manifest = render_field(product.image) if product.image else {}
+        save_manifests({product.pk: manifest})
+
+
+def pick(entries, width):
+    """Return the smallest entry at least width pixels wide, else the largest."""
+    for entry in entries:
+        if entry[0] >= width:
+            return entry
+    return entries[-1]
+
+
+def srcset(entries):
+    """Build a srcset attribute value from manifest entries."""
+    return ', '.join(f'{default_storage.url(name)} {w}w' for w, _, name in entries)
@@ -0,0 +1,137 @@
+"""
+Keyset-paginated feeds of a product's reviews.
+
+A feed is ordered by recency or by helpfulness, with the review id
+breaking ties. A page is read with one query that seeks into the
+(product, sort key, id) index just past the cursor (the sort value and id
+of the last review shown) and reads REVIEW_PAGE_SIZE rows, so its cost is
+the same on the first page of a product with five reviews and the
+hundredth page of a bestseller. The first page of each feed, the one every
+product view shows, is cached for REVIEW_FEED_CACHE_TIMEOUT seconds and
+dropped when one of the product's reviews is saved or deleted.
+
+Helpfulness is the lower bound of the Wilson score interval for the share
+of likes among votes: a review with 40 likes out of 50 votes ranks above
+one with a single like, and one without votes scores 0.
+"""
+import base64
+import json
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Sqrt
+from django.db.models.lookups import GreaterThan
+
+from .models import Review
+
+# 95% confidence
+Z = 1.96
+
+SORTS = {
+    'recent': 'created_at',
+    'helpful': 'helpfulness',
+}
+FIRST_PAGE_KEY = 'review-feed:{}:{}'
+
+
+def helpfulness(likes, dislikes):
+    """Wilson lower bound of likes / (likes + dislikes)."""
+    votes = likes + dislikes
+    if not votes:
+        return 0.0
+    return (likes + Z * Z / 2 - Z * math.sqrt(likes * dislikes / votes + Z * Z / 4)) / (votes + Z * Z)
+
+
+def helpfulness_expression(likes=None, dislikes=None):
+    """
+    helpfulness() as a database expression, for UPDATE queries.
+
+    Args:
+        likes: Expression for the like count, the likes column by default
+        dislikes: Expression for the dislike count
+    """
+    likes = Cast(F('likes') if likes is None else likes, FloatField())
+    dislikes = Cast(F('dislikes') if dislikes is None else dislikes, FloatField())
+    votes = likes + dislikes
+    return Case(
+        When(
+            GreaterThan(votes, Value(0.0)),
+            then=(likes + Value(Z * Z / 2) - Value(Z) * Sqrt(likes * dislikes / votes + Value(Z * Z / 4)))
+            / (votes + Value(Z * Z)),
+        ),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def encode_cursor(review, sort):
+    """Opaque cursor pointing just past a review in a feed."""
+    value = getattr(review, SORTS[sort])
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, review.pk]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """
+    Sort value and id from a cursor.
+
+    Raises:
+        ValueError: If the cursor was not made by encode_cursor for this sort
+    """
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if sort == 'recent':
+            value = datetime.fromisoformat(value)
+        return float(value) if sort == 'helpful' else value, int(pk)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def _query(product_id, sort, cursor, size):
+    field = SORTS[sort]
+    reviews = Review.objects.filter(product_id=product_id).select_related('user')
+    if cursor is not None:
+        value, pk = decode_cursor(cursor, sort)
+        reviews = reviews.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+    # One row more than shown tells whether there is a next page
+    rows = list(reviews.order_by(f'-{field}', '-pk')[:size + 1])
+    return rows[:size], encode_cursor(rows[size - 1], sort) if len(rows) > size else None
+
+
+def get_page(product_id, sort='recent', cursor=None, size=None):
+    """
+    One page of a product's reviews.
+
+    Args:
+        product_id: Product whose reviews are listed
+        sort: 'recent' or 'helpful'
+        cursor: next_cursor of the previous page; None for the first page
+        size: Reviews per page, REVIEW_PAGE_SIZE by default
+
+    Returns:
+        tuple: (list of Reviews with their users, cursor of the next page or None)
+
+    Raises:
+        ValueError: If the sort or the cursor is invalid
+    """
+    if sort not in SORTS:
+        raise ValueError(f'Unknown sort {sort!r}')
+    page_size = getattr(settings, 'REVIEW_PAGE_SIZE', 10)
+    size = size or page_size
+    if cursor is not None or size != page_size:
+        return _query(product_id, sort, cursor, size)
+    key = FIRST_PAGE_KEY.format(product_id, sort)
+    page = cache.get(key)
+    if page is None:
+        page = _query(product_id, sort, None, size)
+        cache.set(key, page, getattr(settings, 'REVIEW_FEED_CACHE_TIMEOUT', 60))
+    return page
+
+
+def forget_first_pages(product_id):
+    """Drop a product's cached first pages after one of its reviews changed."""
+    cache.delete_many([FIRST_PAGE_KEY.format(product_id, sort) for sort in SORTS])
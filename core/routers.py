@@ -0,0 +1,110 @@
+"""
+Database routing between the primary, a read replica and an analytics copy.
+
+Writes always go to the primary ('default'). Reads made while serving a
+safe (GET/HEAD) request go to DATABASE_REPLICA_ALIAS, unless the request
+or a recent one from the same browser wrote something, in which case they
+stay on the primary so users see their own changes. Heavy read-only jobs
+(recommender training, reports, exports) wrap themselves in analytics()
+to read from DATABASE_ANALYTICS_ALIAS instead.
+
+Aliases that are not configured fall back to the primary, so a single
+database setup behaves exactly as before. Code running outside a request
+(management commands, background threads) reads from the primary unless
+it asks for analytics().
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+ANALYTICS = 'analytics'
+
+_target = ContextVar('db_read_target', default=PRIMARY)
+_wrote = ContextVar('db_wrote', default=None)
+
+
+def _alias(setting, default):
+    alias = getattr(settings, setting, default)
+    return alias if alias in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def replica_alias():
+    return _alias('DATABASE_REPLICA_ALIAS', 'replica')
+
+
+def analytics_alias():
+    # Without a dedicated analytics database, heavy reads still leave the primary
+    alias = _alias('DATABASE_ANALYTICS_ALIAS', 'analytics')
+    return alias if alias != DEFAULT_DB_ALIAS else replica_alias()
+
+
+@contextmanager
+def _reads_from(target):
+    token = _target.set(target)
+    try:
+        yield
+    finally:
+        _target.reset(token)
+
+
+def analytics():
+    """Send reads in the block (or decorated function) to the analytics database."""
+    return _reads_from(ANALYTICS)
+
+
+def replica():
+    """Send reads in the block to the read replica."""
+    return _reads_from(REPLICA)
+
+
+def primary():
+    """Keep reads in the block on the primary."""
+    return _reads_from(PRIMARY)
+
+
+@contextmanager
+def request_scope(read_from_replica):
+    """
+    Route one request's reads; used by DatabaseRoutingMiddleware.
+
+    Yields a one-item list that is set to True once the request writes.
+    """
+    wrote = [False]
+    target_token = _target.set(REPLICA if read_from_replica else PRIMARY)
+    wrote_token = _wrote.set(wrote)
+    try:
+        yield wrote
+    finally:
+        _target.reset(target_token)
+        _wrote.reset(wrote_token)
+
+
+class PrimaryReplicaRouter:
+    """Route writes to the primary and reads according to the current scope."""
+
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a write transaction must see its changes
+            return DEFAULT_DB_ALIAS
+        target = _target.get()
+        if target == ANALYTICS:
+            return analytics_alias()
+        if target == REPLICA:
+            return replica_alias()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None and not wrote[0]:
+            # Read the rest of this request from the primary
+            wrote[0] = True
+            _target.set(PRIMARY)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds a copy of the same data
+        return True
@@ -0,0 +1,140 @@
+"""
+Signal handlers for the core application.
+"""
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models import F
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import background, events, ratings, recommendations, renditions, review_feed, tasks
+from .cart import SessionCart
+from .fragments import bump_catalog_version
+from .models import BehaviorEvent, Category, Product, ProductRating, Review
+
+# Sent after the transaction that placed an order has committed, with the
+# order, its OrderItem list and the buyer's user_id. Recommendation and
+# popularity updates hang off this instead of running inside checkout.
+order_placed = Signal()
+
+
+@receiver(post_save, sender=Product)
+def create_rating_summary(sender, instance, created, raw=False, **kwargs):
+    """Give every new product an empty rating summary."""
+    if created and not raw:
+        ProductRating.objects.get_or_create(product=instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_card(sender, instance, created=False, raw=False, **kwargs):
+    """Retire cached cards and catalog pages showing this product."""
+    if raw:
+        return
+    if not created:
+        ratings.bump_card_version(instance.pk)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def render_product_image(sender, instance, raw=False, **kwargs):
+    """Resize a newly uploaded image in the background once the product is committed."""
+    if not raw and renditions.needs_renditions(instance):
+        transaction.on_commit(lambda: tasks.render_product_image.delay(instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def update_recommender_filter(sender, instance, raw=False, **kwargs):
+    """Keep the loaded recommender from suggesting products that cannot be sold."""
+    if not raw:
+        recommendations.product_changed(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_recommender_filter(sender, instance, **kwargs):
+    recommendations.product_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_cards(sender, instance, created, raw=False, **kwargs):
+    """Cards show the category name, so renaming one retires its cards."""
+    if not created and not raw:
+        ProductRating.objects.filter(product__category=instance).update(version=F('version') + 1)
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_summary(sender, instance, created, raw=False, **kwargs):
+    """Fold a created or edited review into its product's summary."""
+    if not raw:
+        ratings.review_changed(instance, created)
+        bump_catalog_version()
+
+
+@receiver(post_delete, sender=Review)
+def remove_from_rating_summary(sender, instance, **kwargs):
+    """Take a deleted review out of its product's summary."""
+    ratings.review_deleted(instance)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def forget_review_feed(sender, instance, raw=False, **kwargs):
+    """The cached first pages of the product's reviews may show this one."""
+    if not raw:
+        review_feed.forget_first_pages(instance.product_id)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def expire_stored_recommendations(sender, instance, raw=False, **kwargs):
+    """Serve the reviewer live until the recommendation store is rebuilt."""
+    if not raw:
+        recommendations.user_changed(instance.user_id)
+
+
+@receiver(order_placed)
+def record_purchase_events(sender, order, items, user_id, **kwargs):
+    """Purchases are the strongest implicit feedback the recommender gets."""
+    buffer = events.get_event_buffer()
+    for item in items:
+        buffer.record(BehaviorEvent.PURCHASE, user_id, item.product_id)
+
+
+@receiver(order_placed)
+def refresh_recommender_stock(sender, order, items, user_id, **kwargs):
+    """Checkout takes stock with UPDATE queries, which send no post_save."""
+    tasks.refresh_recommender_stock.delay([item.product_id for item in items])
+    if user_id:
+        recommendations.user_changed(user_id)
+
+
+@receiver(order_placed)
+def update_basket_index(sender, order, items, **kwargs):
+    """Fold new baskets into "frequently bought together" every so often."""
+    if len(items) > 1:
+        # One update per interval however many orders arrive meanwhile
+        tasks.update_basket_index.schedule(key='all', countdown=getattr(settings, 'BASKET_UPDATE_INTERVAL', 300))
+
+
+@receiver(request_started)
+def start_task_scheduler(sender, **kwargs):
+    """Web processes run the periodic tasks when tasks run locally."""
+    background.start_scheduler()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Fold the anonymous session cart into the user's saved cart."""
+    if request is not None and getattr(settings, 'CART_SESSION_ID', 'cart') in request.session:
+        SessionCart(request, user).merge_saved_cart()
+
+
+@receiver(user_logged_out)
+def persist_cart_on_logout(sender, request, user, **kwargs):
+    """Save pending cart changes before the session is flushed."""
+    if request is not None and user is not None:
+        SessionCart(request, user).persist()
@@ -0,0 +1,96 @@
+"""
+Single-flight guard for expensive fills.
+
+When a value is missing, every thread and process that needs it would
+otherwise compute it at the same time: a burst of requests at start-up
+means as many full model fits. SingleFlight lets one caller compute while
+the others either wait for it (and then use what it made) or return at
+once to serve a fallback. Threads of a process queue on a lock; processes
+take turns through a cache.add lock, which expires after lock_timeout
+should its holder die. That lock only spans processes when the default
+cache is shared (see check core.E001).
+
+Waiters call check() again once the lock is free. For a value kept in
+process memory it should load what the winner saved somewhere shared
+(the recommender loads the model file the winning process wrote), or
+every waiting process computes again.
+
+compute() should publish its value with a single reference assignment (a
+module global, a cache.set) once the value is complete, so readers see
+either the old value or the new one and never a half-built one.
+"""
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+class SingleFlight:
+    """
+    One computation at a time per name.
+
+    Args:
+        name: Name of the cross-process lock
+        lock_timeout: Seconds after which the lock of a holder that died expires
+        wait_timeout: Seconds to wait for another process before computing
+            anyway; lock_timeout by default
+        poll_interval: Seconds between checks while another process computes
+    """
+
+    def __init__(self, name, lock_timeout=600, wait_timeout=None, poll_interval=0.1):
+        self.key = f'single-flight:{name}'
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = lock_timeout if wait_timeout is None else wait_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self):
+        """Whether a thread of this process is computing (or waiting to)."""
+        return self._lock.locked()
+
+    def run(self, compute, check=None, wait=True):
+        """
+        Call compute() unless the value exists or someone else is computing it.
+
+        Args:
+            compute: Builds and publishes the value, returning it
+            check: Returns the value if it is already there, else None;
+                tried again after every wait, so callers that waited pick
+                up what the winner published
+            wait: Wait for a computation in progress instead of returning None
+
+        Returns:
+            The value from check() or compute(), or None if wait is False
+            and another caller is computing it
+        """
+        check = check or (lambda: None)
+        value = check()
+        if value is not None:
+            return value
+        if not self._lock.acquire(blocking=wait):
+            return None
+        try:
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + self.wait_timeout
+            while True:
+                value = check()
+                if value is not None:
+                    return value
+                if cache.add(self.key, token, timeout=self.lock_timeout):
+                    break
+                if not wait:
+                    return None
+                if time.monotonic() >= deadline:
+                    # The other process is slow or gone; compute without the lock
+                    token = None
+                    break
+                time.sleep(self.poll_interval)
+            try:
+                return compute()
+            finally:
+                if token is not None and cache.get(self.key) == token:
+                    cache.delete(self.key)
+        finally:
+            self._lock.release()
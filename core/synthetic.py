@@ -0,0 +1,334 @@
+"""
+Synthetic catalog, user and order history for load and capacity testing.
+
+The generator is deterministic: every block of BLOCK_SIZE rows draws from
+its own random stream derived from (seed, table, block number), so the
+same seed produces the same data whatever the chunk size or the number of
+worker processes. Primary
+keys are assigned up front, which lets workers create reviews, carts and
+orders for users and products they never read back from the database.
+
+Popularity follows a Zipf law over a shuffled product ranking, user
+activity is log-normal, and timestamps follow weekly and yearly cycles on
+top of steady growth. Review counts are drawn per user, so the total only
+comes close to the number asked for.
+
+Rows are inserted with explicit primary keys; reset_sequences() moves the
+database sequences past them afterwards.
+"""
+import math
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import OperationalError, transaction
+from django.db.models import Max
+
+from .models import Cart, CartItem, Category, Order, OrderItem, Product, Review
+from .review_feed import helpfulness
+
+TABLES = {'categories': 1, 'products': 2, 'users': 3, 'reviews': 4, 'carts': 5, 'orders': 6}
+# Rows drawn from one random stream; chunks are made of whole blocks
+BLOCK_SIZE = 1000
+
+WEEKDAY_WEIGHTS = (1.0, 0.95, 0.95, 1.0, 1.1, 1.3, 1.25)
+HOUR_WEIGHTS = (
+    0.2, 0.1, 0.1, 0.1, 0.1, 0.2, 0.4, 0.7, 0.9, 1.0, 1.0, 1.1,
+    1.3, 1.2, 1.0, 1.0, 1.1, 1.2, 1.4, 1.6, 1.7, 1.5, 1.0, 0.5,
+)
+ADJECTIVES = ('Classic', 'Smart', 'Compact', 'Premium', 'Eco', 'Ultra', 'Vintage', 'Wireless', 'Deluxe', 'Portable')
+NOUNS = ('Lamp', 'Backpack', 'Speaker', 'Mug', 'Jacket', 'Blender', 'Novel', 'Sneakers', 'Drone', 'Chair', 'Watch', 'Kettle')
+CITIES = ('Springfield', 'Riverton', 'Lakeside', 'Fairview', 'Hillcrest', 'Maplewood', 'Oakdale', 'Brookfield')
+STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled')
+
+
+class Plan:
+    """
+    Sizes, key ranges and shared distributions of one generation run.
+
+    Built once in the parent process and handed to every worker.
+    """
+
+    def __init__(self, seed, categories, products, users, reviews, carts, orders, days, end, prefix, zipf=1.1):
+        self.seed = seed
+        self.counts = {
+            'categories': categories, 'products': products, 'users': users,
+            'reviews': reviews, 'carts': carts, 'orders': orders,
+        }
+        self.prefix = prefix
+        self.days = days
+        self.start = datetime.combine(end - timedelta(days=days), datetime.min.time(), tzinfo=dt_timezone.utc)
+        self.base_ids = {
+            'categories': (Category.objects.aggregate(m=Max('id'))['m'] or 0) + 1,
+            'products': (Product.objects.aggregate(m=Max('id'))['m'] or 0) + 1,
+            'users': (User.objects.aggregate(m=Max('id'))['m'] or 0) + 1,
+            'carts': (Cart.objects.aggregate(m=Max('id'))['m'] or 0) + 1,
+            'orders': (Order.objects.aggregate(m=Max('id'))['m'] or 0) + 1,
+        }
+        self.password = make_password('password')
+
+        rng = self.rng('plan')
+        # Product popularity: Zipf over a random ranking of the catalog
+        ranks = rng.permutation(products) + 1
+        self.product_cdf = _cdf(ranks ** -float(zipf))
+        self.product_category = np.searchsorted(_cdf(np.arange(1, categories + 1) ** -1.0), rng.random(products))
+        self.product_price = np.round(np.exp(rng.normal(3.3, 0.9, products)), 2).clip(0.99, 5000)
+        self.product_quality = rng.uniform(2.5, 4.8, products)
+        # User activity: most users do little, a few do a lot
+        self.user_activity = rng.lognormal(0.0, 1.0, users)
+        self.user_activity /= self.user_activity.mean()
+        self.user_cdf = _cdf(self.user_activity)
+        self.day_cdf = _cdf(_day_weights(self.start, days))
+        self.hour_cdf = _cdf(np.array(HOUR_WEIGHTS))
+
+    def rng(self, table, block=0):
+        key = TABLES.get(table, 0)
+        return np.random.default_rng([self.seed, key, block])
+
+    def timestamps(self, rng, n):
+        """Draw n timestamps following the seasonal traffic pattern."""
+        days = np.searchsorted(self.day_cdf, rng.random(n))
+        hours = np.searchsorted(self.hour_cdf, rng.random(n))
+        seconds = days * 86400 + hours * 3600 + rng.integers(0, 3600, n)
+        return [self.start + timedelta(seconds=int(s)) for s in seconds]
+
+
+def _cdf(weights):
+    cdf = np.cumsum(weights, dtype=np.float64)
+    cdf /= cdf[-1]
+    return cdf
+
+
+def _day_weights(start, days):
+    weights = np.empty(days)
+    for d in range(days):
+        date = start + timedelta(days=d)
+        doy = date.timetuple().tm_yday
+        yearly = 1 + 1.2 * math.exp(-((doy - 330) / 15) ** 2) + 0.3 * math.exp(-((doy - 195) / 8) ** 2)
+        weights[d] = 1.35 ** (d / 365) * WEEKDAY_WEIGHTS[date.weekday()] * yearly
+    return weights
+
+
+def reset_sequences():
+    """Move primary key sequences past the ids the generator assigned."""
+    from django.core.management.color import no_style
+    from django.db import connection
+
+    statements = connection.ops.sequence_reset_sql(no_style(), [Category, Product, User, Cart, Order])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def chunks(plan, table, chunk_size):
+    """Yield (table, first offset, stop offset) work items of chunk_size rows, rounded up to whole blocks."""
+    chunk_size = -(-chunk_size // BLOCK_SIZE) * BLOCK_SIZE
+    total = plan.counts[table]
+    for start in range(0, total, chunk_size):
+        yield table, start, min(start + chunk_size, total)
+
+
+@contextmanager
+def historical_timestamps():
+    """Let bulk_create store the generated created_at/updated_at values."""
+    fields = [
+        field for model in (Category, Product, Review, Cart, CartItem, Order)
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+_plan = None
+
+
+def init_worker(plan):
+    """Process pool initializer."""
+    global _plan
+    import django
+    from django.db import connections
+    django.setup()
+    connections.close_all()
+    _plan = plan
+
+
+def run_chunk(item):
+    """Generate and insert one chunk; returns (table, rows created)."""
+    plan = _plan
+    table, start, stop = item
+    builder = BUILDERS[table]
+    for attempt in range(5):
+        try:
+            with historical_timestamps(), transaction.atomic():
+                return table, sum(
+                    builder(plan, plan.rng(table, block // BLOCK_SIZE), block, min(block + BLOCK_SIZE, stop))
+                    for block in range(start, stop, BLOCK_SIZE)
+                )
+        except OperationalError:
+            # SQLite allows one writer at a time; wait for the others
+            if attempt == 4:
+                raise
+            time.sleep(0.1 * 2 ** attempt)
+
+
+def _categories(plan, rng, start, stop):
+    base = plan.base_ids['categories']
+    created = plan.start
+    Category.objects.bulk_create([
+        Category(
+            id=base + i, name=f'{plan.prefix.title()} category {i}', slug=f'{plan.prefix}-category-{i}',
+            created_at=created, updated_at=created,
+        )
+        for i in range(start, stop)
+    ])
+    return stop - start
+
+
+def _products(plan, rng, start, stop):
+    base, category_base = plan.base_ids['products'], plan.base_ids['categories']
+    n = stop - start
+    # Products launch through the first two thirds of the period
+    created = plan.timestamps(rng, n)
+    created = [plan.start + (c - plan.start) * 2 / 3 for c in created]
+    adjectives = rng.integers(0, len(ADJECTIVES), n)
+    nouns = rng.integers(0, len(NOUNS), n)
+    stock = rng.integers(0, 500, n)
+    available = rng.random(n) < 0.95
+    Product.objects.bulk_create([
+        Product(
+            id=base + i,
+            name=f'{ADJECTIVES[adjectives[j]]} {NOUNS[nouns[j]]} {i}',
+            slug=f'{plan.prefix}-product-{i}',
+            description=f'{ADJECTIVES[adjectives[j]]} {NOUNS[nouns[j]].lower()} for everyday use.',
+            price=Decimal(str(plan.product_price[i])),
+            category_id=category_base + int(plan.product_category[i]),
+            stock=int(stock[j]),
+            available=bool(available[j]),
+            created_at=created[j],
+            updated_at=created[j],
+        )
+        for j, i in enumerate(range(start, stop))
+    ], batch_size=1000)
+    return n
+
+
+def _users(plan, rng, start, stop):
+    base = plan.base_ids['users']
+    joined = plan.timestamps(rng, stop - start)
+    User.objects.bulk_create([
+        User(
+            id=base + i, username=f'{plan.prefix}-user-{i}', email=f'{plan.prefix}-user-{i}@example.com',
+            password=plan.password, date_joined=joined[j],
+        )
+        for j, i in enumerate(range(start, stop))
+    ], batch_size=1000)
+    return stop - start
+
+
+def _pick_products(plan, rng, n):
+    return np.searchsorted(plan.product_cdf, rng.random(n))
+
+
+def _distinct_products(plan, rng, n, rounds=10):
+    """Up to n different products by popularity, drawing again for repeats."""
+    n = min(n, plan.counts['products'])
+    picked = set()
+    for _ in range(rounds):
+        if len(picked) >= n:
+            break
+        picked.update(_pick_products(plan, rng, n - len(picked)).tolist())
+    return sorted(picked)
+
+
+def _reviews(plan, rng, start, stop):
+    """Reviews of block users; each user's count scales with their activity."""
+    users = plan.counts['users']
+    mean = plan.counts['reviews'] / max(users, 1)
+    rows = []
+    # The review block covers users [start, stop) scaled to the user range
+    first, last = start * users // plan.counts['reviews'], stop * users // plan.counts['reviews']
+    counts = rng.poisson(mean * plan.user_activity[first:last])
+    for offset, count in enumerate(counts):
+        user = first + offset
+        items = _distinct_products(plan, rng, int(count))
+        if not items:
+            continue
+        stars = np.clip(np.rint(plan.product_quality[items] + rng.normal(0, 1.0, len(items))), 1, 5)
+        when = plan.timestamps(rng, len(items))
+        for item, star, created in zip(items, stars, when):
+            likes, dislikes = int(rng.poisson(1.5)), int(rng.poisson(0.3))
+            rows.append(Review(
+                product_id=plan.base_ids['products'] + item, user_id=plan.base_ids['users'] + user,
+                rating=int(star), comment='', created_at=created,
+                likes=likes, dislikes=dislikes, helpfulness=helpfulness(likes, dislikes),
+            ))
+    Review.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def _carts(plan, rng, start, stop):
+    users = plan.counts['users']
+    base = plan.base_ids['carts']
+    carts, items = [], []
+    updated = plan.timestamps(rng, stop - start)
+    for j, i in enumerate(range(start, stop)):
+        # Spread carts evenly over the users so no user gets two
+        user = i * users // plan.counts['carts']
+        carts.append(Cart(id=base + i, user_id=plan.base_ids['users'] + user, created_at=updated[j], updated_at=updated[j]))
+        for product in sorted(set(_pick_products(plan, rng, int(rng.integers(1, 6))).tolist())):
+            items.append(CartItem(
+                cart_id=base + i, product_id=plan.base_ids['products'] + product,
+                quantity=int(rng.integers(1, 4)), created_at=updated[j], updated_at=updated[j],
+            ))
+    Cart.objects.bulk_create(carts, batch_size=1000)
+    CartItem.objects.bulk_create(items, batch_size=1000)
+    return len(carts)
+
+
+def _orders(plan, rng, start, stop):
+    n = stop - start
+    base = plan.base_ids['orders']
+    buyers = np.searchsorted(plan.user_cdf, rng.random(n))
+    placed = plan.timestamps(rng, n)
+    end = plan.start + timedelta(days=plan.days)
+    orders, items = [], []
+    for j, i in enumerate(range(start, stop)):
+        user = int(buyers[j])
+        age = (end - placed[j]).days
+        status = 'cancelled' if rng.random() < 0.03 else STATUSES[min(age // 3, 3)]
+        orders.append(Order(
+            id=base + i, user_id=plan.base_ids['users'] + user,
+            first_name='Synthetic', last_name=f'User {user}', email=f'{plan.prefix}-user-{user}@example.com',
+            address=f'{int(rng.integers(1, 999))} Main Street', postal_code=f'{int(rng.integers(10000, 99999))}',
+            city=CITIES[int(rng.integers(0, len(CITIES)))],
+            created_at=placed[j], updated_at=placed[j], paid=status != 'pending', status=status,
+        ))
+        for product in sorted(set(_pick_products(plan, rng, int(rng.geometric(0.55))).tolist())):
+            items.append(OrderItem(
+                order_id=base + i, product_id=plan.base_ids['products'] + product,
+                price=Decimal(str(plan.product_price[product])), quantity=int(rng.geometric(0.7)),
+            ))
+    Order.objects.bulk_create(orders, batch_size=1000)
+    OrderItem.objects.bulk_create(items, batch_size=1000)
+    return n
+
+
+BUILDERS = {
+    'categories': _categories,
+    'products': _products,
+    'users': _users,
+    'reviews': _reviews,
+    'carts': _carts,
+    'orders': _orders,
+}
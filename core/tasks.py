@@ -0,0 +1,96 @@
+"""
+Background tasks of the core app (see background.py).
+
+Imported by CoreConfig.ready(), so every process, web or celery worker, has
+the same registry.
+"""
+from django.conf import settings
+
+from .background import periodic, task
+
+
+@task(local=True, retries=2, retry_delay=30.0)
+def refit_recommender():
+    """Retrain the recommender this process serves (or the shards) on current ratings."""
+    from . import recommendations
+
+    recommendations.refit()
+
+
+@task(local=True)
+def load_recommender():
+    """Train the recommender this process serves, unless another thread already is."""
+    from . import recommendations
+
+    recommendations.init_recommender()
+
+
+@periodic(getattr(settings, 'RECOMMENDER_MODEL_RELOAD_INTERVAL', 60))
+@task(local=True)
+def reload_recommender():
+    """Swap in a model another process fitted since this process's was."""
+    from . import recommendations
+
+    recommendations.reload()
+
+
+@task(local=True)
+def rebuild_recommendation_store():
+    """Precompute every user's recommendations from the model this process fitted."""
+    from . import recommendations
+
+    recommendations.rebuild_store()
+
+
+@task(local=True)
+def refresh_recommender_stock(product_ids):
+    """Re-read stock of products sold by an order into the loaded model's filter."""
+    from . import recommendations
+
+    recommendations.stock_changed(product_ids)
+
+
+@periodic(getattr(settings, 'RECOMMENDER_FILTER_REFRESH', 60))
+@task(local=True)
+def refresh_item_filter():
+    """Re-read the sellable flag, category and price of every item of the loaded model."""
+    from . import recommendations
+
+    recommendations.refresh_filter()
+
+
+@task(retries=2, retry_delay=30.0)
+def render_product_image(product_id):
+    """Resize a product's uploaded image into its renditions."""
+    from . import renditions
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id).first()
+    if product is not None:
+        renditions.update_product(product)
+
+
+@task(retries=3, retry_delay=60.0)
+def update_basket_index():
+    """Fold orders placed since the last run into "frequently bought together"."""
+    from . import baskets
+
+    baskets.update()
+
+
+@periodic(getattr(settings, 'INVENTORY_RELEASE_INTERVAL', 60))
+@task(retries=1)
+def release_expired_reservations():
+    """Return stock held by checkouts that were abandoned."""
+    from .inventory import release_expired
+
+    release_expired()
+
+
+@periodic(getattr(settings, 'PAYMENT_SWEEP_INTERVAL', 60))
+@task(retries=5, retry_delay=5.0)
+def process_payment_events():
+    """Apply stored payment webhook events to their orders."""
+    from .payments import process_pending
+
+    process_pending()
@@ -0,0 +1,64 @@
+"""
+Template tags for rendering catalog pages.
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from core import renditions
+from core.fragments import render_product_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products, template_name='includes/product_card.html'):
+    """
+    Render cached product cards.
+
+    Usage::
+
+        {% product_cards products as cards %}
+        {% for card in cards %}<div class="col">{{ card }}</div>{% endfor %}
+    """
+    return render_product_cards(products, context.get('request'), template_name)
+
+
+@register.simple_tag
+def responsive_image(product, sizes='100vw', width=640, css_class='', style='', alt=None):
+    """
+    Render a product image as a <picture> with WebP and JPEG srcsets.
+
+    Falls back to the original upload until renditions have been built.
+
+    Usage::
+
+        {% responsive_image product sizes="(min-width: 768px) 33vw, 100vw" css_class="card-img-top" %}
+
+    Args:
+        product: Product whose image to show
+        sizes: Value for the sizes attribute
+        width: Width in CSS pixels used to pick the src for old browsers
+        css_class: Class of the <img> element
+        style: Inline style of the <img> element
+        alt: Alternative text, defaults to the product name
+    """
+    alt = product.name if alt is None else alt
+    manifest = product.image_renditions or {}
+    if not manifest.get('jpeg') or manifest.get('source') != product.image.name:
+        if not product.image:
+            return ''
+        return format_html(
+            '<img src="{}" class="{}" style="{}" alt="{}" loading="lazy">', product.image.url, css_class, style, alt
+        )
+
+    fallback_width, fallback_height, fallback = renditions.pick(manifest['jpeg'], int(width))
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" style="{}" alt="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        renditions.srcset(manifest['webp']), sizes,
+        default_storage.url(fallback), renditions.srcset(manifest['jpeg']), sizes,
+        fallback_width, fallback_height, css_class, style, alt,
+    )
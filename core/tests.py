@@ -1,3 +1,1404 @@
-from django.test import TestCase
+import io
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .events import get_event_buffer
+from .models import (
+    BehaviorEvent, Cart, CartItem, Category, Order, OrderItem, PaymentEvent, Product, ProductRating, Review,
+    StockReservation,
+)
+
+
+def make_product(name='Lamp', price='10.00', stock=10, category=None):
+    category = category or Category.objects.get_or_create(name='Home', slug='home')[0]
+    return Product.objects.create(
+        name=name, slug=name.lower().replace(' ', '-'), description=name,
+        price=Decimal(price), stock=stock, category=category,
+    )
+
+
+def make_users(count, prefix='user'):
+    return [User.objects.create(username=f'{prefix}{i}') for i in range(count)]
+
+
+@override_settings(TASK_BACKEND='eager')
+class RatingSummaryTests(TestCase):
+
+    def setUp(self):
+        self.product = make_product()
+        self.users = make_users(3)
+
+    def summary(self, product=None):
+        return ProductRating.objects.get(product=product or self.product)
+
+    def test_create_adds_to_summary(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=5)
+        Review.objects.create(product=self.product, user=self.users[1], rating=2)
+        summary = self.summary()
+        self.assertEqual((summary.count, summary.total, summary.star_5, summary.star_2), (2, 7, 1, 1))
+        self.assertEqual(summary.average, 3.5)
+
+    def test_update_moves_rating_between_stars(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=5)
+        review = Review.objects.get()
+        review.rating = 3
+        review.save()
+        summary = self.summary()
+        self.assertEqual((summary.count, summary.total, summary.star_5, summary.star_3), (1, 3, 0, 1))
+
+    def test_update_moves_review_between_products(self):
+        other = make_product('Chair')
+        Review.objects.create(product=self.product, user=self.users[0], rating=4)
+        review = Review.objects.get()
+        review.product = other
+        review.save()
+        self.assertEqual((self.summary().count, self.summary().total), (0, 0))
+        self.assertEqual((self.summary(other).count, self.summary(other).star_4), (1, 1))
+
+    def test_delete_removes_from_summary(self):
+        for user, rating in zip(self.users, (1, 4, 4)):
+            Review.objects.create(product=self.product, user=user, rating=rating)
+        Review.objects.filter(rating=4).first().delete()
+        summary = self.summary()
+        self.assertEqual((summary.count, summary.total, summary.star_4, summary.star_1), (2, 5, 1, 1))
+
+    def test_deltas_match_rebuild(self):
+        from .ratings import rebuild_summaries
+
+        for user, rating in zip(self.users, (2, 3, 5)):
+            Review.objects.create(product=self.product, user=user, rating=rating)
+        Review.objects.filter(rating=3).delete()
+        incremental = self.summary()
+        rebuild_summaries([self.product.pk])
+        rebuilt = self.summary()
+        fields = ['count', 'total'] + [f'star_{i}' for i in range(1, 6)]
+        self.assertEqual([getattr(incremental, f) for f in fields], [getattr(rebuilt, f) for f in fields])
+
+
+@override_settings(TASK_BACKEND='eager')
+class VoteBufferTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        product = make_product()
+        self.reviews = [
+            Review.objects.create(product=product, user=user, rating=4)
+            for user in make_users(2, 'author')
+        ]
+
+    def buffers(self):
+        from .counters import CacheVoteBuffer, LocalVoteBuffer
+
+        return [LocalVoteBuffer(seen_bits=1 << 12, flush_interval=0), CacheVoteBuffer(flush_interval=0)]
+
+    def test_duplicate_vote_is_rejected(self):
+        for buffer in self.buffers():
+            with self.subTest(buffer=type(buffer).__name__):
+                review = self.reviews[0]
+                self.assertTrue(buffer.vote(review.pk, 1, 'like'))
+                self.assertFalse(buffer.vote(review.pk, 1, 'like'))
+                self.assertFalse(buffer.vote(review.pk, 1, 'dislike'))
+                self.assertTrue(buffer.vote(review.pk, 2, 'dislike'))
+                self.assertEqual(buffer.pending([review.pk]), {review.pk: {'likes': 1, 'dislikes': 1}})
+                buffer.drain()
+                cache.clear()
+
+    def test_flush_writes_counters_and_helpfulness(self):
+        from .review_feed import helpfulness
+
+        for buffer in self.buffers():
+            with self.subTest(buffer=type(buffer).__name__):
+                Review.objects.update(likes=0, dislikes=0, helpfulness=0)
+                first, second = self.reviews
+                for user_id in range(1, 6):
+                    buffer.vote(first.pk, user_id, 'like')
+                buffer.vote(first.pk, 6, 'dislike')
+                buffer.vote(second.pk, 1, 'dislike')
+                with self.assertNumQueries(1):
+                    self.assertEqual(buffer.flush(), 2)
+                first.refresh_from_db()
+                second.refresh_from_db()
+                self.assertEqual((first.likes, first.dislikes, second.likes, second.dislikes), (5, 1, 0, 1))
+                self.assertAlmostEqual(first.helpfulness, helpfulness(5, 1))
+                self.assertEqual(buffer.pending([first.pk, second.pk]), {})
+                self.assertEqual(buffer.flush(), 0)
+                cache.clear()
+
+    def test_merge_adds_pending_votes(self):
+        buffer = self.buffers()[0]
+        buffer.vote(self.reviews[0].pk, 1, 'like')
+        merged = buffer.merge(Review.objects.filter(pk=self.reviews[0].pk))
+        self.assertEqual(merged[0].likes, 1)
+
+    def test_cache_buffer_flushes_votes_counted_by_another_process(self):
+        from .counters import CacheVoteBuffer
+
+        voter, flusher = CacheVoteBuffer(flush_interval=0), CacheVoteBuffer(flush_interval=0)
+        voter.vote(self.reviews[0].pk, 1, 'like')
+        voter.vote(self.reviews[1].pk, 1, 'like')
+        del voter
+        self.assertEqual(flusher.flush(), 2)
+        self.assertEqual(sorted(Review.objects.values_list('likes', flat=True)), [1, 1])
+
+    def test_cache_buffer_journals_votes_arriving_after_a_flush(self):
+        from .counters import CacheVoteBuffer
+
+        buffer = CacheVoteBuffer(flush_interval=0)
+        review = self.reviews[0]
+        buffer.vote(review.pk, 1, 'like')
+        buffer.flush()
+        buffer.vote(review.pk, 2, 'like')
+        self.assertEqual(buffer.flush(), 1)
+        review.refresh_from_db()
+        self.assertEqual(review.likes, 2)
+
+    def test_cache_buffer_picks_up_entry_written_after_a_flush(self):
+        from .counters import CacheVoteBuffer
+
+        buffer = CacheVoteBuffer(flush_interval=0)
+        review = self.reviews[0]
+        # A process took journal entry 1 but has not written it yet
+        buffer._incr(buffer._key(review.pk, 'likes'))
+        cache.add(f'{buffer.prefix}:dirty:{review.pk}', 1)
+        buffer._incr(f'{buffer.prefix}:journal')
+        self.assertEqual(buffer.flush(), 0)
+        cache.set(f'{buffer.prefix}:journal:1', review.pk)
+        self.assertEqual(buffer.flush(), 1)
+        review.refresh_from_db()
+        self.assertEqual(review.likes, 1)
+
+
+class InventoryTests(TestCase):
+
+    def setUp(self):
+        self.lamp = make_product('Lamp', stock=5)
+        self.chair = make_product('Chair', stock=2)
+
+    def stock(self):
+        self.lamp.refresh_from_db()
+        self.chair.refresh_from_db()
+        return self.lamp.stock, self.chair.stock
+
+    def test_reserve_holds_stock_and_commit_keeps_it_taken(self):
+        from . import inventory
+
+        token = inventory.reserve([(self.lamp.pk, 2), (self.chair.pk, 1), (self.lamp.pk, 1)])
+        self.assertEqual(self.stock(), (2, 1))
+        self.assertEqual(inventory.commit(token), {self.lamp.pk: 3, self.chair.pk: 1})
+        self.assertEqual(self.stock(), (2, 1))
+        self.assertEqual(inventory.commit(token), {})
+        self.assertEqual(inventory.release(token), 0)
+
+    def test_release_returns_stock(self):
+        from . import inventory
+
+        token = inventory.reserve([(self.lamp.pk, 4)])
+        self.assertEqual(inventory.release(token), 1)
+        self.assertEqual(self.stock(), (5, 2))
+
+    def test_expired_reservations_are_released_and_cannot_be_committed(self):
+        from . import inventory
+
+        token = inventory.reserve([(self.lamp.pk, 1), (self.chair.pk, 2)], ttl=-1)
+        kept = inventory.reserve([(self.lamp.pk, 1)], ttl=60)
+        self.assertEqual(inventory.commit(token), {})
+        self.assertEqual(inventory.release_expired(batch_size=1), 2)
+        self.assertEqual(self.stock(), (4, 2))
+        self.assertEqual(inventory.commit(kept), {self.lamp.pk: 1})
+
+    def test_reserve_never_oversells(self):
+        from . import inventory
+
+        inventory.reserve([(self.chair.pk, 2)])
+        with self.assertRaises(inventory.InsufficientStock) as raised:
+            inventory.reserve([(self.lamp.pk, 1), (self.chair.pk, 1)])
+        self.assertEqual(raised.exception.product_id, self.chair.pk)
+        # The lamp taken before the chair failed was put back
+        self.assertEqual(self.stock(), (5, 0))
+        self.assertFalse(StockReservation.objects.filter(product=self.lamp).exists())
+
+    def test_quantities_must_be_positive(self):
+        from . import inventory
+
+        with self.assertRaises(ValueError):
+            inventory.reserve([(self.lamp.pk, 0)])
+
+
+ORDER_DETAILS = {
+    'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com',
+    'address': '1 Analytical Way', 'postal_code': '12345', 'city': 'London',
+}
+
+
+@override_settings(TASK_BACKEND='eager')
+class PlaceOrderTests(TestCase):
+
+    def setUp(self):
+        self.user = make_users(1, 'buyer')[0]
+        self.lamp = make_product('Lamp', price='12.50', stock=5)
+        self.chair = make_product('Chair', price='40.00', stock=1)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.lamp, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.chair, quantity=1)
+
+    def test_order_is_built_from_the_cart(self):
+        from .orders import place_order
+
+        order = place_order(self.user, ORDER_DETAILS)
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'price', 'quantity')),
+            sorted([(self.lamp.pk, Decimal('12.50'), 2), (self.chair.pk, Decimal('40.00'), 1)]),
+        )
+        self.assertFalse(CartItem.objects.exists())
+        self.lamp.refresh_from_db()
+        self.assertEqual(self.lamp.stock, 3)
+
+    def test_running_out_of_stock_rolls_everything_back(self):
+        from . import inventory
+        from .orders import place_order
+
+        CartItem.objects.filter(product=self.chair).update(quantity=2)
+        with self.assertRaises(inventory.InsufficientStock):
+            place_order(self.user, ORDER_DETAILS)
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 2)
+        self.lamp.refresh_from_db()
+        self.assertEqual(self.lamp.stock, 5)
+
+    def test_unavailable_product_is_refused(self):
+        from .orders import place_order
+
+        Product.objects.filter(pk=self.chair.pk).update(available=False)
+        with self.assertRaises(ValueError):
+            place_order(self.user, ORDER_DETAILS)
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 2)
+
+    def test_second_checkout_of_the_same_cart_fails(self):
+        from .orders import place_order
+
+        place_order(self.user, ORDER_DETAILS)
+        with self.assertRaisesMessage(ValueError, 'empty'):
+            place_order(self.user, ORDER_DETAILS)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+
+@override_settings(TASK_BACKEND='eager')
+class SessionCartTests(TestCase):
+
+    def setUp(self):
+        self.user = make_users(1, 'shopper')[0]
+        self.lamp = make_product('Lamp')
+        self.chair = make_product('Chair')
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.lamp, quantity=1)
+
+    def test_anonymous_cart_is_merged_into_saved_cart_on_login(self):
+        session = self.client.session
+        session['cart'] = {
+            'lines': {str(self.lamp.pk): 2, str(self.chair.pk): 1},
+            'user_id': None, 'persisted_at': 0, 'dirty': True,
+        }
+        session.save()
+
+        self.client.force_login(self.user)
+
+        saved = dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(saved, {self.lamp.pk: 3, self.chair.pk: 1})
+        data = self.client.session['cart']
+        self.assertEqual(data['lines'], {str(self.lamp.pk): 3, str(self.chair.pk): 1})
+        self.assertEqual(data['user_id'], self.user.pk)
+
+    def test_login_without_session_cart_keeps_saved_cart(self):
+        self.client.force_login(self.user)
+        saved = dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(saved, {self.lamp.pk: 1})
+
+
+@override_settings(TASK_BACKEND='eager', REVIEW_PAGE_SIZE=4)
+class ReviewFeedTests(TestCase):
+
+    def setUp(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .review_feed import helpfulness
+
+        cache.clear()
+        self.product = make_product()
+        now = timezone.now()
+        for i, user in enumerate(make_users(11, 'reviewer')):
+            review = Review.objects.create(product=self.product, user=user, rating=1 + i % 5)
+            likes, dislikes = i % 4, i % 3
+            # Pairs of reviews share a timestamp and a score, so ids break ties
+            Review.objects.filter(pk=review.pk).update(
+                created_at=now - timedelta(minutes=i // 2), likes=likes, dislikes=dislikes,
+                helpfulness=helpfulness(likes, dislikes),
+            )
+
+    def expected(self, sort):
+        field = {'recent': 'created_at', 'helpful': 'helpfulness'}[sort]
+        return list(Review.objects.filter(product=self.product).order_by(f'-{field}', '-pk').values_list('pk', flat=True))
+
+    def test_cursor_round_trip(self):
+        from .review_feed import decode_cursor, encode_cursor
+
+        for review in Review.objects.filter(product=self.product):
+            self.assertEqual(decode_cursor(encode_cursor(review, 'recent'), 'recent'), (review.created_at, review.pk))
+            self.assertEqual(decode_cursor(encode_cursor(review, 'helpful'), 'helpful'), (review.helpfulness, review.pk))
+
+    def test_invalid_cursor_is_rejected(self):
+        from .review_feed import decode_cursor
+
+        for cursor in ('', 'not-a-cursor', 'WzFd'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor, 'recent')
+
+    def test_api_walks_every_review_once(self):
+        url = reverse('review_list', args=[self.product.pk])
+        for sort in ('recent', 'helpful'):
+            with self.subTest(sort=sort):
+                seen, cursor, pages = [], None, 0
+                while True:
+                    params = {'sort': sort, **({'cursor': cursor} if cursor else {})}
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 200)
+                    data = response.json()
+                    seen += [review['id'] for review in data['reviews']]
+                    pages += 1
+                    cursor = data['next']
+                    if cursor is None:
+                        break
+                self.assertEqual(seen, self.expected(sort))
+                self.assertEqual(pages, 3)
+
+    def test_api_rejects_bad_sort_and_cursor(self):
+        url = reverse('review_list', args=[self.product.pk])
+        self.assertEqual(self.client.get(url, {'sort': 'oldest'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('review_list', args=[0])).status_code, 404)
+
+
+@override_settings(TASK_BACKEND='eager')
+class CatalogPageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_product()
+        get_event_buffer().drain()
+
+    def test_cached_search_is_recorded(self):
+        url = reverse('product_list')
+        self.client.get(url, {'q': 'lamp'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'q': 'lamp'}).status_code, 200)
+        get_event_buffer().flush()
+        self.assertEqual(
+            list(BehaviorEvent.objects.values_list('kind', 'query')),
+            [(BehaviorEvent.SEARCH, 'lamp')] * 2,
+        )
+
+
+@override_settings(TASK_BACKEND='eager')
+class LoadTestPathTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = make_product()
+        self.user = make_users(1)[0]
+
+    def tearDown(self):
+        # Write what the pages recorded while the test database still exists
+        get_event_buffer().flush()
+
+    def test_default_paths_are_served(self):
+        from .loadtest import DEFAULT_PATHS
+
+        self.client.force_login(self.user)
+        self.client.post(DEFAULT_PATHS['cart_add'].format(id=self.product.pk), {'quantity': 1})
+        for route, path in DEFAULT_PATHS.items():
+            method = self.client.post if route in ('cart_add', 'cart_remove') else self.client.get
+            with self.subTest(route=route):
+                response = method(path.format(id=self.product.pk))
+                self.assertLess(response.status_code, 400)
+                self.assertGreaterEqual(response.status_code, 200)
+
+    def journey(self):
+        from django.test import Client
+
+        from .loadtest import DEFAULT_PATHS, Journey, Response, Run
+
+        class DjangoClient:
+            """The load test client's interface over the test client."""
+            prefix = ''
+
+            def __init__(self):
+                self.django = Client()
+                self.cookies = {}
+
+            async def request(self, method, path, data=None, headers=None):
+                send = self.django.post if method == 'POST' else self.django.get
+                response = send(path, data or {})
+                self.cookies = {name: morsel.value for name, morsel in self.django.cookies.items() if morsel.value}
+                return Response(response.status_code, {k.lower(): v for k, v in response.items()}, response.content)
+
+        self.user.set_password('secret')
+        self.user.save()
+        run = Run(paths=dict(DEFAULT_PATHS), think_time=0, deadline=time.monotonic() + 60,
+                  credentials=[(self.user.username, 'secret')])
+        return Journey(run, DjangoClient())
+
+    def run_steps(self, *steps):
+        # Without think time nothing awaits a real event, so each coroutine
+        # finishes on its first send and needs no event loop
+        for step in steps:
+            with self.assertRaises(StopIteration):
+                step().send(None)
+
+    def test_buy_after_shop_signs_in_and_orders(self):
+        journey = self.journey()
+        self.run_steps(journey.shop, journey.buy)
+        self.assertTrue(journey.logged_in)
+        self.assertTrue(Order.objects.filter(user=self.user).exists())
+        self.assertEqual([sample for sample in journey.run.samples if sample.status <= 0], [])
+
+    def test_redirect_to_sign_in_is_an_error(self):
+        journey = self.journey()
+        self.run_steps(lambda: journey.step('order_create'))
+        self.assertEqual(journey.run.samples[0].status, -302)
+
+
+@override_settings(TASK_BACKEND='eager')
+class CatalogImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = make_product()
+        Product.objects.filter(pk=self.product.pk).update(available=False, description='Brass desk lamp')
+
+    def load(self, text):
+        from .catalog_io import import_catalog
+
+        return import_catalog(io.StringIO(text), 'csv', workers=0)
+
+    def test_omitted_columns_keep_their_values(self):
+        self.load('slug,name,price,stock,category\nlamp,Lamp,12.50,4,home\nchair,Chair,30,2,home\n')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.stock), (Decimal('12.50'), 4))
+        self.assertEqual((self.product.available, self.product.description), (False, 'Brass desk lamp'))
+        self.assertTrue(Product.objects.get(slug='chair').available)
+
+    def test_supplied_columns_are_written(self):
+        self.load('slug,name,description,price,stock,available,category\n'
+                  'lamp,Lamp,Steel lamp,10,4,yes,home\nchair,Chair,,30,2,,home\n')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.available, self.product.description), (True, 'Steel lamp'))
+        self.assertTrue(Product.objects.get(slug='chair').available)
+
+
+@override_settings(TASK_BACKEND='eager', STRIPE_WEBHOOK_SECRET='whsec_test')
+class PaymentWebhookTests(TestCase):
+
+    def setUp(self):
+        from .payment_stub import StubGateway
+
+        self.gateway = StubGateway('whsec_test')
+        self.order = Order.objects.create(user=make_users(1)[0], **ORDER_DETAILS)
+        OrderItem.objects.create(order=self.order, product=make_product(), price=Decimal('12.50'), quantity=2)
+
+    def post(self, payload, header):
+        from .payments import SIGNATURE_HEADER
+
+        return self.client.post(
+            reverse('payment_webhook'), data=payload, content_type='application/json',
+            headers={SIGNATURE_HEADER: header},
+        )
+
+    def deliver(self, event):
+        return self.post(*self.gateway.delivery(event))
+
+    def settle(self):
+        from .payments import process_pending
+
+        process_pending()
+        self.order.refresh_from_db()
+        return self.order.paid, self.order.status
+
+    def test_bad_signatures_are_rejected(self):
+        from .payment_stub import StubGateway
+        from .payments import PAID
+
+        payload, header = self.gateway.delivery(self.gateway.event(PAID, self.order.pk, Decimal('25.00')))
+        forged = StubGateway('whsec_other').sign(payload)
+        expired = self.gateway.sign(payload, timestamp=time.time() - 3600)
+        for header in (forged, expired, '', 't=1'):
+            with self.subTest(header=header):
+                self.assertEqual(self.post(payload, header).status_code, 400)
+        self.assertEqual(self.post(payload + b' ', self.gateway.sign(payload)).status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_redelivered_event_is_stored_once(self):
+        from .payments import PAID
+
+        event = self.gateway.event(PAID, self.order.pk, Decimal('25.00'))
+        statuses = [self.deliver(event).json()['status'] for _ in range(3)]
+        self.assertEqual(statuses, ['received', 'duplicate', 'duplicate'])
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.assertEqual(self.settle(), (True, 'processing'))
+
+    def test_events_apply_in_creation_order(self):
+        from .payments import FAILED, PAID, REFUNDED
+
+        now = time.time()
+        for type, created in ((REFUNDED, now), (PAID, now - 10), (FAILED, now - 20)):
+            self.deliver(self.gateway.event(type, self.order.pk, Decimal('25.00'), created))
+        self.assertEqual(self.settle(), (False, 'cancelled'))
+
+    def test_payment_after_applied_refund_is_stale(self):
+        from .payments import PAID, REFUNDED
+
+        now = time.time()
+        self.deliver(self.gateway.event(PAID, self.order.pk, Decimal('25.00'), now - 10))
+        self.deliver(self.gateway.event(REFUNDED, self.order.pk, Decimal('25.00'), now))
+        self.assertEqual(self.settle(), (False, 'cancelled'))
+        late = self.gateway.event(PAID, self.order.pk, Decimal('25.00'), now - 5)
+        self.deliver(late)
+        self.assertEqual(self.settle(), (False, 'cancelled'))
+        self.assertEqual(PaymentEvent.objects.get(event_id=late['id']).outcome, PaymentEvent.STALE)
+
+    def test_wrong_amount_and_unknown_order_change_nothing(self):
+        from .payments import PAID
+
+        wrong = self.gateway.event(PAID, self.order.pk, Decimal('1.00'))
+        unknown = self.gateway.event(PAID, self.order.pk + 1, Decimal('25.00'))
+        self.deliver(wrong)
+        self.deliver(unknown)
+        self.assertEqual(self.settle(), (False, 'pending'))
+        outcomes = dict(PaymentEvent.objects.values_list('event_id', 'outcome'))
+        self.assertEqual(outcomes, {wrong['id']: PaymentEvent.AMOUNT_MISMATCH, unknown['id']: PaymentEvent.UNKNOWN_ORDER})
+
+
+class ItemFilterTests(TestCase):
+
+    def setUp(self):
+        from .recommendations.filters import ItemFilter
+
+        self.products = [make_product(name) for name in ('Lamp', 'Chair', 'Desk')]
+        self.items = ItemFilter([product.pk for product in self.products] + [0])
+        self.items.refresh()
+
+    def test_refresh_replaces_the_arrays(self):
+        before = self.items.columns
+        Product.objects.filter(pk=self.products[1].pk).update(stock=0)
+        self.products[2].delete()
+        self.items.refresh()
+        self.assertEqual(before.eligible.tolist(), [True, True, True, False])
+        self.assertEqual(self.items.eligible.tolist(), [True, False, False, False])
+        self.assertEqual(self.items.mask(max_price=5).tolist(), [False] * 4)
+
+    def test_change_made_during_refresh_is_kept(self):
+        lamp = self.products[0]
+        empty = self.items._empty
+
+        def hide_lamp_while_loading():
+            self.items.set(lamp.pk, False, lamp.stock, lamp.category_id, lamp.price)
+            return empty()
+
+        with mock.patch.object(self.items, '_empty', hide_lamp_while_loading):
+            self.items.refresh()
+        self.assertEqual(self.items.eligible.tolist(), [False, True, True, False])
+
+    def test_refresh_of_a_large_model_does_not_list_its_ids(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from .recommendations.filters import ItemFilter
+
+        # More ids than SQLite takes as parameters of one statement
+        pks = [product.pk for product in self.products]
+        items = ItemFilter(list(range(max(pks) + 1, max(pks) + 40_001)) + pks[::-1])
+        with CaptureQueriesContext(connection) as queries:
+            items.refresh()
+        self.assertNotIn(' IN ', queries[0]['sql'])
+        self.assertEqual(items.eligible.sum(), 3)
+        self.assertEqual(items.price[-3:].tolist(), [10.0] * 3)
+
+        Product.objects.filter(pk=pks[0]).update(stock=0)
+        with CaptureQueriesContext(connection) as queries:
+            items.refresh(items.item_ids.tolist())
+        self.assertEqual(len(queries), 81)
+        self.assertFalse(items.eligible[-1])
+
+
+class PeriodicTaskTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def turn(self, name):
+        from .background import TURN_KEY, LocalBackend, periodic_tasks
+
+        backend = LocalBackend(run_periodic=False)
+        backend._pool = mock.Mock()
+        # Another process already claimed this turn
+        cache.add(TURN_KEY.format(name, int(time.time() // periodic_tasks[name])), 1)
+        backend._turn(name)
+        return backend._pool.submit.called
+
+    def test_local_task_runs_in_every_process(self):
+        self.assertTrue(self.turn('core.tasks.refresh_item_filter'))
+
+    def test_shared_task_runs_once_per_turn(self):
+        self.assertFalse(self.turn('core.tasks.release_expired_reservations'))
+
+
+class ProductImageTests(TestCase):
+
+    def test_renditions_are_queued_after_commit(self):
+        product = make_product('Lamp', '20.00', 5)
+        product.image_renditions = {'source': 'gone.jpg'}
+        with mock.patch('core.tasks.render_product_image.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save()
+        delay.assert_called_once_with(product.pk)
+
+
+class ItemShardTests(TestCase):
+
+    def setUp(self):
+        products = [make_product(f'Item {i}') for i in range(6)]
+        users = make_users(4)
+        ids = [product.pk for product in products]
+        # Two groups of products nobody rated together
+        self.interactions = [
+            (users[0].pk, ids[0], 5.0), (users[0].pk, ids[1], 3.0), (users[0].pk, ids[2], 4.0),
+            (users[1].pk, ids[1], 4.0), (users[1].pk, ids[2], 2.0),
+            (users[2].pk, ids[3], 5.0), (users[2].pk, ids[4], 1.0), (users[2].pk, ids[5], 4.0),
+            (users[3].pk, ids[4], 3.0),
+        ]
+        self.users = users
+
+    def fit(self, index, count):
+        from .recommendations.sharding import ItemShard
+
+        shard = ItemShard(index, count)
+        shard.fit(self.interactions)
+        return shard
+
+    def test_shards_answer_like_one_shard(self):
+        whole = self.fit(0, 1)
+        shards = [self.fit(index, 3) for index in range(3)]
+        for user in self.users:
+            merged = sorted((row for shard in shards for row in shard.recommend(user.pk, 10)), key=lambda row: (-row[1], row[0]))
+            self.assertEqual(merged, whole.recommend(user.pk, 10))
+
+    def test_shard_keeps_only_columns_it_can_score(self):
+        # One product per shard: its columns are its own group of three
+        for index in range(6):
+            shard = self.fit(index, 6)
+            self.assertEqual(shard.similarities.shape, (1, 3))
+            self.assertEqual(shard.user_items.shape[1], 3)
+
+
+class ShardRefitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def coordinator(self, fitted_at):
+        sharded = mock.Mock(addresses=['a', 'b'])
+        sharded.info.return_value = {address: {'fitted_at': fitted_at} for address in sharded.addresses}
+        return sharded
+
+    def test_refit_waits_for_another_process(self):
+        from . import recommendations
+
+        sharded = self.coordinator(None)
+        cache.add('single-flight:recommender-shard-refit', 'other')
+
+        def other_process_finishes(seconds):
+            sharded.info.return_value = {address: {'fitted_at': time.time()} for address in sharded.addresses}
+
+        with mock.patch('core.singleflight.time.sleep', other_process_finishes):
+            recommendations._refit_shards(sharded)
+        sharded.refit.assert_not_called()
+
+    def test_stale_shards_are_refitted(self):
+        from . import recommendations
+
+        sharded = self.coordinator(time.time() - 60)
+        recommendations._refit_shards(sharded)
+        sharded.refit.assert_called_once_with()
+
+    def test_refit_marks_the_store_stale(self):
+        from . import recommendations
+        from .recommendations import store
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(RECOMMENDER_STORE_DIR=directory):
+            recommender = mock.Mock(id_maps={'user': {7: 0}})
+            with mock.patch('core.recommendations.evaluation.recommend_all', return_value=([[(3, 0.5)]], None)):
+                store.build(recommender, time.time() - 60, size=2)
+            self.assertEqual(store.RecommendationStore(0).get(7, 2), [(3, 0.5)])
+            recommendations._refit_shards(self.coordinator(time.time() - 60))
+            self.assertIsNone(store.RecommendationStore(0).get(7, 2))
+
+
+@override_settings(TASK_BACKEND='eager')
+class RecommenderSnapshotTests(TestCase):
+
+    def setUp(self):
+        from . import recommendations
+
+        cache.clear()
+        self.recommendations = recommendations
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(
+            RECOMMENDER_MODEL_DIR=directory.name, RECOMMENDER_STORE_DIR=f'{directory.name}/store',
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(recommendations._publish, None, None)
+        products = [make_product(name) for name in ('Lamp', 'Chair', 'Desk')]
+        for i, user in enumerate(make_users(4)):
+            for product in products[:i % 3 + 1]:
+                Review.objects.create(product=product, user=user, rating=4)
+
+    def fit_elsewhere(self):
+        """Fit and save a model as another process would, leaving this one without it."""
+        model = self.recommendations._fit()
+        self.recommendations._publish(None, None)
+        return model
+
+    def test_start_up_loads_saved_model(self):
+        saved = self.fit_elsewhere()
+        with mock.patch.object(self.recommendations, 'train') as train:
+            model = self.recommendations.get_recommender()
+        train.assert_not_called()
+        self.assertIsNot(model, saved)
+        self.assertEqual(model.item_ids.tolist(), saved.item_ids.tolist())
+        self.assertEqual(model.item_filter.eligible.tolist(), [True] * 3)
+
+    def test_refit_waiting_on_another_process_loads_its_model(self):
+        from .recommendations import snapshot
+        from .singleflight import SingleFlight
+
+        old = self.fit_elsewhere()
+        self.recommendations._publish(old, time.time() - 60)
+        new = self.recommendations.train(self.recommendations.load_interactions())
+        lock = SingleFlight('recommender-fit').key
+        cache.add(lock, 'other-process')
+
+        def finish_elsewhere():
+            time.sleep(0.2)
+            snapshot.save(new, time.time())
+            cache.delete(lock)
+
+        other = threading.Thread(target=finish_elsewhere)
+        with mock.patch.object(self.recommendations, 'train') as train:
+            other.start()
+            self.recommendations.refit()
+            other.join()
+        train.assert_not_called()
+        self.assertIsNot(self.recommendations.get_recommender(), old)
+        self.assertEqual(self.recommendations.get_recommender().item_ids.tolist(), new.item_ids.tolist())
+
+    def test_reload_picks_up_newer_model(self):
+        old = self.fit_elsewhere()
+        self.recommendations._publish(old, time.time() - 60)
+        self.recommendations.reload()
+        self.assertIsNot(self.recommendations.get_recommender(), old)
+        current = self.recommendations.get_recommender()
+        self.recommendations.reload()
+        self.assertIs(self.recommendations.get_recommender(), current)
+
+    def test_fit_rebuilds_store_in_use(self):
+        from .recommendations import store
+
+        self.recommendations._fit()
+        self.assertFalse(store.has_build())
+        old = self.recommendations.get_recommender()
+        store.build(old, time.time() - 60)
+        self.recommendations._fit()
+        reader = store.RecommendationStore(0)
+        reader.get(0, 1)
+        self.assertEqual(reader.built_at, self.recommendations._fitted_at)
+
+
+class DatabaseRoutingTests(TransactionTestCase):
+
+    def setUp(self):
+        from django.conf import settings
+
+        from .routers import PrimaryReplicaRouter
+
+        # Two more SQLite databases, as DATABASE_REPLICA_NAME and
+        # DATABASE_ANALYTICS_NAME set them up; routing never opens them
+        self.aliases = {
+            alias: {**settings.DATABASES['default'], 'NAME': f'{alias}.sqlite3'} for alias in ('replica', 'analytics')
+        }
+        databases = mock.patch.dict(settings.DATABASES, self.aliases)
+        databases.start()
+        self.addCleanup(databases.stop)
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def serve(self, request, write=False):
+        """Where the view's read went, and the response."""
+        from django.http import HttpResponse
+
+        from .middleware import DatabaseRoutingMiddleware
+
+        reads = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Product)
+            reads.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        response = DatabaseRoutingMiddleware(view)(request)
+        return reads[0], response
+
+    def test_safe_reads_go_to_replica(self):
+        self.assertEqual(self.serve(self.factory.get('/'))[0], 'replica')
+        self.assertEqual(self.serve(self.factory.head('/'))[0], 'replica')
+        self.assertEqual(self.serve(self.factory.post('/'))[0], 'default')
+        # Outside a request
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_reads_stay_on_primary_after_a_write(self):
+        read, response = self.serve(self.factory.get('/'), write=True)
+        self.assertEqual(read, 'default')
+        pin = response.cookies['db_pin'].value
+
+        request = self.factory.get('/')
+        request.COOKIES['db_pin'] = pin
+        self.assertEqual(self.serve(request)[0], 'default')
+        request = self.factory.get('/')
+        request.COOKIES['db_pin'] = str(int(time.time()) - 1)
+        self.assertEqual(self.serve(request)[0], 'replica')
+
+    def test_reads_inside_atomic_use_primary(self):
+        from django.db import transaction
+
+        from . import routers
+
+        with routers.request_scope(True):
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Product), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'replica')
+
+    def test_analytics_reads(self):
+        from django.conf import settings
+
+        from . import routers
+
+        with routers.request_scope(True), routers.analytics():
+            self.assertEqual(self.router.db_for_read(Product), 'analytics')
+            del settings.DATABASES['analytics']
+            self.assertEqual(self.router.db_for_read(Product), 'replica')
+
+    def test_missing_alias_falls_back_to_primary(self):
+        from django.conf import settings
+
+        from . import routers
+
+        for alias in self.aliases:
+            del settings.DATABASES[alias]
+        self.assertEqual(self.serve(self.factory.get('/'))[0], 'default')
+        with routers.analytics():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+
+
+class EventBufferTests(TestCase):
+
+    def setUp(self):
+        from .events import KINDS, EventBuffer
+
+        self.buffer = EventBuffer(flush_interval=0, batch_size=2, weights={'view': 1.0, 'cart_add': 3.0})
+        self.kinds = KINDS
+        self.product = make_product()
+        self.user = make_users(1)[0]
+
+    def test_score_deltas(self):
+        from .events import score_deltas
+
+        u, p = self.user.pk, self.product.pk
+        events = [
+            (0, self.kinds['view'], u, p, '', ''),
+            (0, self.kinds['cart_add'], u, p, '', ''),
+            (0, self.kinds['view'], None, p, 's', ''),
+            (0, self.kinds['search'], u, None, '', 'lamp'),
+            (0, self.kinds['purchase'], u, p, '', ''),
+        ]
+        self.assertEqual(dict(score_deltas(events, self.buffer.weights)), {(u, p): 4.0})
+
+    def test_apply_scores_adds_to_existing_rows(self):
+        from .events import apply_scores
+        from .models import ImplicitScore
+
+        other = make_users(1, prefix='other')[0]
+        ImplicitScore.objects.create(user=self.user, product=self.product, score=2.0)
+        apply_scores({(self.user.pk, self.product.pk): 3.0, (other.pk, self.product.pk): 1.5, (self.user.pk, 0): 5.0})
+        self.assertEqual(
+            dict(ImplicitScore.objects.values_list('user_id', 'score')), {self.user.pk: 5.0, other.pk: 1.5},
+        )
+
+    def test_implicit_rating(self):
+        import math
+
+        from .events import implicit_rating
+
+        self.assertEqual(implicit_rating(-3.0), 1.0)
+        self.assertEqual(implicit_rating(0.0), 1.0)
+        self.assertAlmostEqual(implicit_rating(math.e - 1), 2.0)
+        self.assertEqual(implicit_rating(1000.0), 4.0)
+
+    def test_failed_batch_is_kept_for_the_next_flush(self):
+        from django.db import IntegrityError
+
+        from . import events
+
+        for _ in range(5):
+            self.buffer.record(self.kinds['view'], self.user.pk, self.product.pk)
+        with mock.patch.object(events, 'apply_scores', side_effect=[None, IntegrityError('gone')]):
+            with self.assertLogs('core.events', 'ERROR'):
+                self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(len(self.buffer.events), 3)
+        self.assertEqual(BehaviorEvent.objects.count(), 2)
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(BehaviorEvent.objects.count(), 5)
+
+
+class BasketIndexTests(TestCase):
+    # Baskets {10, 20}, {10, 20, 30}, {10, 30}, {20, 20}: products 10 and 20
+    # are in 3 baskets, 30 in 2; pairs 10-20 and 10-30 in 2, 20-30 in 1
+    ORDER_ITEMS = [(1, 10), (1, 20), (2, 10), (2, 20), (2, 30), (3, 10), (3, 30), (4, 20), (4, 20)]
+
+    def counts(self, *parts):
+        import numpy as np
+
+        from .baskets import Counts
+
+        counts = Counts()
+        for part in parts:
+            counts.add(np.array(part, dtype=np.int64).reshape(-1, 2))
+        return counts
+
+    def test_counts(self):
+        counts = self.counts(self.ORDER_ITEMS)
+        self.assertEqual(counts.ids.tolist(), [10, 20, 30])
+        self.assertEqual(counts.item_counts.tolist(), [3, 3, 2])
+        self.assertEqual(counts.pairs.toarray().tolist(), [[0, 2, 2], [2, 0, 1], [2, 1, 0]])
+        self.assertEqual((counts.baskets, counts.last_order_id), (4, 4))
+
+    def test_top_k_ranks_by_lift(self):
+        # lift = together * baskets / (count a * count b)
+        lift = {(10, 20): 2 * 4 / 9, (10, 30): 2 * 4 / 6, (20, 30): 1 * 4 / 6}
+        table = self.counts(self.ORDER_ITEMS).top_k(2, 1)
+        self.assertEqual(table['product'].tolist(), [10, 20, 30])
+        self.assertEqual(table['related'].tolist(), [[30, 20], [10, 30], [10, 20]])
+        for product, related, scores in zip(table['product'], table['related'], table['score']):
+            for other, score in zip(related, scores):
+                self.assertAlmostEqual(score, lift[tuple(sorted((product, other)))], places=5)
+
+        # The 20-30 pair is below the minimum count
+        table = self.counts(self.ORDER_ITEMS).top_k(2, 2)
+        self.assertEqual(table['related'].tolist(), [[30, 20], [10, -1], [10, -1]])
+
+    def test_adding_in_parts_matches_adding_at_once(self):
+        extra = [(5, 10), (5, 40)]
+        whole = self.counts(self.ORDER_ITEMS + extra)
+        parts = self.counts(self.ORDER_ITEMS[:5], self.ORDER_ITEMS[5:] + extra)
+        self.assertEqual(parts.ids.tolist(), [10, 20, 30, 40])
+        self.assertEqual(parts.item_counts.tolist(), whole.item_counts.tolist())
+        self.assertEqual(parts.pairs.toarray().tolist(), whole.pairs.toarray().tolist())
+        self.assertEqual((parts.baskets, parts.last_order_id), (5, 5))
+
+    def test_update_folds_in_settled_orders_once(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from . import baskets
+
+        lamp, chair = make_product('Lamp'), make_product('Chair')
+        user = make_users(1)[0]
+        orders = []
+        for _ in range(3):
+            order = Order.objects.create(user=user, **ORDER_DETAILS)
+            for product in (lamp, chair):
+                OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1)
+            orders.append(order)
+        settled = timezone.now() - timedelta(minutes=5)
+        Order.objects.filter(pk__in=[order.pk for order in orders[:2]]).update(created_at=settled)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            BASKET_INDEX_DIR=directory, BASKET_MIN_COUNT=1, BASKET_SETTLE_SECONDS=60,
+        ):
+            baskets.update()
+            counts = baskets.Counts.load()
+            self.assertEqual((counts.baskets, counts.last_order_id), (2, orders[1].pk))
+
+            Order.objects.filter(pk=orders[2].pk).update(created_at=settled)
+            self.assertEqual(baskets.update(), 2)
+            counts = baskets.Counts.load()
+            self.assertEqual(counts.baskets, 3)
+            self.assertEqual(counts.pairs.toarray().tolist(), [[0, 3], [3, 0]])
+
+            index = baskets.BasketIndex(baskets._path('index.npy'), check_interval=0)
+            # Every basket holds both, so the lift is 3 * 3 / (3 * 3)
+            self.assertEqual(index.related(lamp.pk), [(chair.pk, 1.0)])
+            self.assertEqual(index.related(0), [])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        from .metrics import registry
+
+        cache.clear()
+        registry.reset()
+        self.addCleanup(registry.reset)
+        make_product()
+
+    def test_histogram_buckets_are_upper_bounds(self):
+        from .metrics import Histogram
+
+        histogram = Histogram((1, 2, 5))
+        for value in (0.5, 1, 1.5, 7):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 0, 1])
+        self.assertEqual((histogram.sum, histogram.count), (10.0, 4))
+
+    def test_render(self):
+        from .metrics import MetricsRegistry
+
+        registry = MetricsRegistry()
+        registry.describe('requests_total', 'counter', 'Requests.')
+        registry.inc('requests_total', {'view': 'home', 'status': '200'}, 2)
+        registry.observe('queries', {'view': 'say "hi"'}, 3, buckets=(1, 5))
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{status="200",view="home"} 2',
+            'queries_bucket{view="say \\"hi\\"",le="1"} 0',
+            'queries_bucket{view="say \\"hi\\"",le="5"} 1',
+            'queries_bucket{view="say \\"hi\\"",le="+Inf"} 1',
+            'queries_sum{view="say \\"hi\\""} 3',
+            'queries_count{view="say \\"hi\\""} 1',
+        ])
+
+    def test_repeated_query_shapes(self):
+        from .metrics import RequestMetrics
+
+        request = RequestMetrics()
+        select = 'SELECT * FROM "core_product" WHERE "id" = %s'
+        request.statements[select] = 5
+        request.statements['SELECT * FROM "core_review" WHERE "product_id" IN (%s, %s)'] = 2
+        request.statements['SELECT * FROM "core_review" WHERE "product_id" IN (%s, %s, %s)'] = 2
+        self.assertEqual(request.repeated_queries(4), {select: 5, 'SELECT * FROM "core_review" WHERE "product_id" IN (...)': 4})
+
+    @override_settings(METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request_is_rendered(self):
+        from .metrics import registry
+
+        self.client.get(reverse('product_list'))
+        lines = registry.render().splitlines()
+        self.assertIn('ecommerce_requests_total{status="200",view="product_list"} 1', lines)
+        self.assertIn('ecommerce_db_queries_bucket{view="product_list",le="+Inf"} 1', lines)
+        self.assertIn('ecommerce_db_queries_count{view="product_list"} 1', lines)
+        queries = [line for line in lines if line.startswith('ecommerce_db_queries_sum')]
+        self.assertGreater(float(queries[0].split()[-1]), 0)
+
+    @override_settings(METRICS_SAMPLE_RATE=0.5)
+    def test_sample_rate(self):
+        from .metrics import registry
+
+        with mock.patch('core.middleware.random.random', side_effect=[0.4, 0.6, 0.2]):
+            for _ in range(3):
+                self.client.get(reverse('product_list'))
+        self.assertIn('ecommerce_requests_total{status="200",view="product_list"} 2', registry.render().splitlines())
+
+
+class RenditionTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name, MEDIA_URL='/media/', RENDITION_WIDTHS=(100, 200, 800))
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def image(self, width, height):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_render_resizes_to_each_width_and_format(self):
+        from django.core.files.storage import default_storage
+        from PIL import Image
+
+        from . import renditions
+
+        data = self.image(400, 200)
+        manifest = renditions.render(data)
+        digest = renditions.content_hash(data)
+        self.assertEqual((manifest['hash'], manifest['width'], manifest['height']), (digest, 400, 200))
+        # Narrower widths, then the original width, never upscaled to 800
+        for ext, pil_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            self.assertEqual(manifest[ext], [
+                [width, width // 2, f'renditions/{digest[:2]}/{digest}-{width}.{ext}'] for width in (100, 200, 400)
+            ])
+            for width, height, name in manifest[ext]:
+                with default_storage.open(name) as f, Image.open(f) as image:
+                    self.assertEqual((image.format, image.size), (pil_format, (width, height)))
+
+        # Names come from the content, so rendering again writes nothing
+        with mock.patch.object(default_storage, 'save') as save:
+            self.assertEqual(renditions.render(data), manifest)
+        save.assert_not_called()
+        self.assertEqual([entry[0] for entry in renditions.render(self.image(1000, 500))['jpeg']], [100, 200, 800])
+
+    def test_update_product_and_responsive_image(self):
+        from django.core.files.base import ContentFile
+        from django.template import Context, Template
+
+        from . import renditions
+
+        product = make_product()
+        product.image.save('lamp.png', ContentFile(self.image(400, 200)))
+        renditions.update_product(product)
+        product.refresh_from_db()
+        manifest = product.image_renditions
+        self.assertEqual(manifest['source'], product.image.name)
+        self.assertFalse(renditions.needs_renditions(product))
+
+        html = Template('{% load catalog %}{% responsive_image product width=150 %}').render(Context({'product': product}))
+        webp = ', '.join(f'/media/{name} {width}w' for width, _, name in manifest['webp'])
+        self.assertIn(f'<source type="image/webp" srcset="{webp}"', html)
+        self.assertIn(f'src="/media/{manifest["jpeg"][1][2]}"', html)
+        self.assertIn('width="200" height="100"', html)
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiles = override_settings(PROFILER_DIR=directory.name)
+        profiles.enable()
+        self.addCleanup(profiles.disable)
+
+    def sampler(self):
+        from .profiling import Sampler
+
+        # Never flushes on its own; the test calls flush()
+        return Sampler(interval=0.001, flush_interval=3600)
+
+    def test_token_expires(self):
+        from .profiling import check_token, make_token
+
+        token = make_token()
+        self.assertTrue(check_token(token))
+        self.assertFalse(check_token(token + 'x'))
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 301):
+            self.assertFalse(check_token(token))
+
+    def test_samples_are_flushed_and_loaded(self):
+        import sys
+
+        from . import profiling
+
+        sampler = self.sampler()
+
+        def spin(samples):
+            deadline = time.monotonic() + 5
+            while not samples and time.monotonic() < deadline:
+                pass
+
+        with sampler.profile(sys._getframe()) as samples:
+            spin(samples)
+        self.assertTrue(samples)
+        sampler.add('catalog', samples)
+        sampler.flush()
+
+        views = profiling.load()
+        self.assertEqual(views['catalog']['requests'], 1)
+        self.assertEqual(views['catalog']['samples'], sum(samples.values()))
+        self.assertIn('spin', profiling.collapsed(views, 'catalog'))
+        self.assertTrue(profiling.collapsed(views).startswith('catalog;'))
+
+        profiling.reset()
+        self.assertEqual(profiling.load(), {})
+
+    def test_collapsed_and_top_functions(self):
+        from collections import Counter
+
+        from .profiling import collapsed, top_functions
+
+        stacks = Counter({'view;query;execute': 6, 'view;render': 3, 'view': 1})
+        views = {'home': {'requests': 2, 'samples': 10, 'stacks': stacks}}
+        self.assertEqual(collapsed(views, 'home'), 'view;query;execute 6\nview;render 3\nview 1\n')
+        self.assertEqual(collapsed(views, 'other'), '')
+        self.assertEqual(top_functions(stacks, 2), [('execute', 6, 6), ('render', 3, 3)])
+        self.assertEqual(dict((f, total) for f, _, total in top_functions(stacks))['view'], 10)
+
+    @override_settings(PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=0.0)
+    def test_header_token_profiles_the_request(self):
+        from .profiling import make_token
+
+        make_product()
+        sampler = self.sampler()
+        with mock.patch('core.profiling.get_sampler', return_value=sampler):
+            plain = self.client.get(reverse('product_list'))
+            profiled = self.client.get(reverse('product_list'), HTTP_X_PROFILE=make_token())
+        self.assertNotIn('X-Profile-Samples', plain)
+        self.assertTrue(profiled['X-Profile-Samples'].isdigit())
+        self.assertEqual(sampler._totals['product_list']['requests'], 1)
+
+
+class EvaluationTests(TestCase):
+
+    def test_ranking_metrics(self):
+        import math
+
+        import numpy as np
+
+        from .recommendations.evaluation import ranking_metrics
+
+        # The second list is one item long; its padding must not match item
+        # 9 of the first user, whose key is one less than the second row's
+        recommended = np.array([[5, 2, 7], [4, -1, -1]])
+        relevant = [np.array([2, 9]), np.array([4])]
+        metrics = ranking_metrics(recommended, relevant, 3)
+        discount = 1 / math.log2(3)
+        self.assertAlmostEqual(metrics['precision'], (1 / 3 + 1 / 3) / 2)
+        self.assertAlmostEqual(metrics['recall'], (1 / 2 + 1) / 2)
+        self.assertAlmostEqual(metrics['ndcg'], (discount / (1 + discount) + 1) / 2)
+
+    def test_time_split_leaves_out_pairs_seen_before_the_cutoff(self):
+        from .recommendations.evaluation import time_split
+
+        rows = [
+            (1, 1, 3.0, 0), (1, 1, 5.0, 1), (1, 2, 4.0, 2), (2, 3, 5.0, 3), (2, 4, 4.0, 4), (3, 5, 2.0, 5),
+            # From the cutoff on: too low, seen before, new, a user without history, too low
+            (2, 6, 1.0, 6), (1, 1, 5.0, 7), (1, 8, 5.0, 8), (9, 9, 5.0, 9), (2, 7, 3.0, 10),
+        ]
+        split = time_split(rows, test_fraction=0.4)
+        self.assertEqual(split.cutoff, 6.0)
+        self.assertIn((1, 1, 4.0), split.train)
+        self.assertEqual(len(split.train), 5)
+        self.assertEqual(split.test, {1: {8}})
+
+
+class AdminChangeListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        lamp, chair = make_product('Lamp', '10.00'), make_product('Chair', '2.50')
+        shopper, empty = make_users(2)
+        cart = Cart.objects.create(user=shopper)
+        CartItem.objects.create(cart=cart, product=lamp, quantity=2)
+        CartItem.objects.create(cart=cart, product=chair, quantity=3)
+        Cart.objects.create(user=empty)
+        order = Order.objects.create(user=shopper, **ORDER_DETAILS)
+        OrderItem.objects.create(order=order, product=lamp, price=Decimal('9.00'), quantity=2)
+        OrderItem.objects.create(order=order, product=chair, price=Decimal('2.50'), quantity=1)
+        Order.objects.create(user=empty, **ORDER_DETAILS)
+        Review.objects.create(product=lamp, user=shopper, rating=5, comment='Bright')
+
+    def changelist(self, model):
+        response = self.client.get(reverse(f'admin:core_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_changelists_render(self):
+        for model in ('category', 'product', 'cart', 'order', 'review'):
+            with self.subTest(model=model):
+                self.changelist(model)
+
+    def test_annotated_totals(self):
+        carts = {cart.user.username: cart for cart in self.changelist('cart').result_list}
+        self.assertEqual((carts['user0'].item_count, carts['user0'].price_total), (5, Decimal('27.50')))
+        self.assertEqual((carts['user1'].item_count, carts['user1'].price_total), (None, None))
+        orders = {order.user.username: order for order in self.changelist('order').result_list}
+        self.assertEqual(orders['user0'].total, Decimal('20.50'))
+        self.assertIsNone(orders['user1'].total)
+        self.assertContains(self.client.get(reverse('admin:core_cart_changelist')), 'field-price_total">27.5<')
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_counts_stay_exact_without_an_estimate(self):
+        from .admin_tools import estimate_count
+
+        self.assertIsNone(estimate_count(Product.objects.all()))
+        self.assertEqual(self.changelist('product').paginator.count, Product.objects.count())
+        with mock.patch('core.admin_tools.estimate_count', return_value=1_000_000):
+            self.assertEqual(self.changelist('product').paginator.count, 1_000_000)
+
+
+class SyntheticDataTests(TestCase):
+    COUNTS = {'categories': 3, 'products': 40, 'users': 30, 'reviews': 90, 'carts': 10, 'orders': 50}
+
+    def generate(self, chunk_size, reverse=False):
+        """Generate with seed 7 as generate_data does, chunks in order or backwards."""
+        from datetime import date
+
+        from . import synthetic
+
+        plan = synthetic.Plan(seed=7, days=30, end=date(2025, 6, 30), prefix='synth7', **self.COUNTS)
+        with mock.patch.object(synthetic, '_plan', plan):
+            for tables in (('categories',), ('products', 'users'), ('reviews', 'carts', 'orders')):
+                work = [item for table in tables for item in synthetic.chunks(plan, table, chunk_size)]
+                for item in reversed(work) if reverse else work:
+                    synthetic.run_chunk(item)
+        return self.snapshot()
+
+    def snapshot(self):
+        """Every generated row but the password hashes and keys the database assigned."""
+        users = User.objects.filter(username__startswith='synth7-')
+        rows = {
+            'users': users.values_list('id', 'username', 'email', 'date_joined'),
+            'categories': Category.objects.filter(slug__startswith='synth7-').values_list(),
+            'products': Product.objects.filter(slug__startswith='synth7-').values_list(),
+            'reviews': Review.objects.filter(user__in=users).values_list(
+                'product_id', 'user_id', 'rating', 'created_at', 'likes', 'dislikes'),
+            'carts': Cart.objects.filter(user__in=users).values_list(),
+            'cart_items': CartItem.objects.filter(cart__user__in=users).values_list(
+                'cart_id', 'product_id', 'quantity', 'created_at'),
+            'orders': Order.objects.filter(user__in=users).values_list(),
+            'order_items': OrderItem.objects.filter(order__user__in=users).values_list(
+                'order_id', 'product_id', 'price', 'quantity'),
+        }
+        return {table: sorted(values) for table, values in rows.items()}
+
+    def delete(self):
+        users = User.objects.filter(username__startswith='synth7-')
+        Order.objects.filter(user__in=users).delete()
+        users.delete()
+        Product.objects.filter(slug__startswith='synth7-').delete()
+        Category.objects.filter(slug__startswith='synth7-').delete()
+
+    def test_same_seed_gives_same_rows_whatever_the_chunking(self):
+        from . import synthetic
+
+        with mock.patch.object(synthetic, 'BLOCK_SIZE', 8):
+            first = self.generate(chunk_size=8)
+            self.assertEqual(len(first['products']), 40)
+            self.assertTrue(first['reviews'] and first['order_items'] and first['cart_items'])
+            self.delete()
+            # Fewer, larger chunks run in another order, as more workers would
+            self.assertEqual(self.generate(chunk_size=20, reverse=True), first)
@@ -0,0 +1,41 @@
+"""
+URLs for the core application.
+"""
+from django.urls import path, include
+from core import views
+
+urlpatterns = [
+    # Home page
+    path('', views.home, name='home'),
+    
+    # Product URLs
+    path('products/', views.product_list, name='product_list'),
+    path('categories/<slug:category_slug>/', views.product_list, name='product_list_by_category'),
+    path('products/<int:pk>/', views.product_detail, name='product_detail'),
+    
+    # Review URLs
+    path('products/<int:product_id>/reviews/add/', views.add_review, name='add_review'),
+    path('reviews/<int:review_id>/delete/', views.delete_review, name='delete_review'),
+    path('products/<int:product_id>/reviews/', views.review_list, name='review_list'),
+    path('reviews/<int:review_id>/vote/<str:vote>/', views.review_vote, name='review_vote'),
+    
+    # Cart URLs
+    path('cart/', views.cart_detail, name='cart_detail'),
+    path('cart/add/<int:product_id>/', views.cart_add, name='cart_add'),
+    path('cart/remove/<int:product_id>/', views.cart_remove, name='cart_remove'),
+    path('cart/clear/', views.cart_clear, name='cart_clear'),
+    
+    # Order URLs
+    path('orders/', views.order_list, name='order_list'),
+    path('orders/create/', views.order_create, name='order_create'),
+    path('orders/<int:order_id>/', views.order_detail, name='order_detail'),
+    
+    # Accounts (sign in and out under accounts/, see ecommerce/urls.py)
+    path('accounts/register/', views.register, name='register'),
+    
+    # Payment gateway webhooks
+    path('payments/webhook/', views.payment_webhook, name='payment_webhook'),
+    
+    # Include recommendation URLs
+    path('recommendations/', include('core.urls.recommendations')),
+]
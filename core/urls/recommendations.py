@@ -1,8 +1,8 @@
-""
+"""
 URLs for the recommendation system.
 """
 from django.urls import path
-from .views import recommendations as recommendation_views
+from core.views import recommendations as recommendation_views
 
 app_name = 'recommendations'
 
@@ -0,0 +1,7 @@
+# This file makes the views directory a Python package
+from .accounts import register
+from .cart import cart_add, cart_clear, cart_detail, cart_remove
+from .catalog import home, product_detail, product_list
+from .orders import order_create, order_detail, order_list
+from .payments import payment_webhook
+from .reviews import add_review, delete_review, review_list, review_vote
@@ -0,0 +1,19 @@
+"""
+Views for creating an account; signing in and out uses django.contrib.auth.
+"""
+from django.contrib.auth import login
+from django.shortcuts import redirect, render
+
+from core.forms import RegistrationForm
+
+
+def register(request):
+    """Create an account and sign the new user in."""
+    if request.user.is_authenticated:
+        return redirect('home')
+    form = RegistrationForm(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        user = form.save()
+        login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+        return redirect('home')
+    return render(request, 'registration/register.html', {'form': form})
@@ -0,0 +1,42 @@
+"""
+Views for the session shopping cart.
+"""
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_http_methods
+
+from core import events
+from core.cart import SessionCart
+from core.models import BehaviorEvent, Product
+
+
+def cart_detail(request):
+    """Display the cart."""
+    return render(request, 'cart/detail.html', {'cart': SessionCart(request)})
+
+
+@require_http_methods(["POST"])
+def cart_add(request, product_id):
+    """Add a product to the cart, or set its quantity when override is posted."""
+    product = get_object_or_404(Product.objects.only('id'), id=product_id, available=True)
+    try:
+        quantity = int(request.POST.get('quantity', 1))
+    except (TypeError, ValueError):
+        quantity = 1
+    SessionCart(request).add(product.id, max(quantity, 0), override_quantity=bool(request.POST.get('override')))
+    events.record(request, BehaviorEvent.CART_ADD, product.id)
+    return redirect('cart_detail')
+
+
+@require_http_methods(["POST"])
+def cart_remove(request, product_id):
+    """Remove a product from the cart."""
+    SessionCart(request).remove(product_id)
+    events.record(request, BehaviorEvent.CART_REMOVE, product_id)
+    return redirect('cart_detail')
+
+
+@require_http_methods(["POST"])
+def cart_clear(request):
+    """Empty the cart."""
+    SessionCart(request).clear()
+    return redirect('cart_detail')
@@ -0,0 +1,102 @@
+"""
+Views for browsing the product catalog.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.shortcuts import get_object_or_404, render
+
+from core import events, review_feed
+from core.counters import get_vote_buffer
+from core.fragments import cache_anonymous_page
+from core.models import BehaviorEvent, Category, Product
+
+PRODUCTS_PER_PAGE = 24
+BOUGHT_TOGETHER_COUNT = 4
+
+
+def _parse_price(value):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+
+
+def _card_queryset():
+    """Products with everything a product card shows joined in."""
+    return Product.objects.filter(available=True).select_related('category', 'rating_summary')
+
+
+@cache_anonymous_page()
+def home(request):
+    """Display the home page with the newest products."""
+    featured_products = _card_queryset()[:6]
+    return render(request, 'home.html', {'featured_products': featured_products})
+
+
+def product_list(request, category_slug=None):
+    """List products, optionally filtered by category, search query and price."""
+    query = request.GET.get('q', '').strip()
+    if query:
+        # Before the page cache, which would swallow searches it can answer
+        events.record(request, BehaviorEvent.SEARCH, query=query)
+    return _product_list_page(request, category_slug)
+
+
+@cache_anonymous_page()
+def _product_list_page(request, category_slug=None):
+    products = _card_queryset()
+    query = request.GET.get('q', '').strip()
+    min_price = _parse_price(request.GET.get('min_price'))
+    max_price = _parse_price(request.GET.get('max_price'))
+
+    if category_slug:
+        products = products.filter(category__slug=category_slug)
+    if query:
+        products = products.filter(Q(name__icontains=query) | Q(description__icontains=query))
+    if min_price is not None:
+        products = products.filter(price__gte=min_price)
+    if max_price is not None:
+        products = products.filter(price__lte=max_price)
+
+    page = Paginator(products, PRODUCTS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'product_list.html', {
+        'products': page,
+        'categories': Category.objects.all(),
+        'category_slug': category_slug,
+        'query': query,
+        'min_price': min_price,
+        'max_price': max_price,
+    })
+
+
+def product_detail(request, pk):
+    """Display a product with its rating summary and a page of its reviews."""
+    product = get_object_or_404(Product.objects.select_related('category', 'rating_summary'), pk=pk, available=True)
+    sort = request.GET.get('reviews')
+    sort = sort if sort in review_feed.SORTS else 'recent'
+    try:
+        reviews, next_cursor = review_feed.get_page(product.pk, sort, request.GET.get('after'))
+    except ValueError:
+        reviews, next_cursor = review_feed.get_page(product.pk, sort)
+    events.record(request, BehaviorEvent.VIEW, product.id)
+    return render(request, 'product_detail.html', {
+        'product': product,
+        # Show votes that are still waiting in the write-behind buffer
+        'reviews': get_vote_buffer().merge(reviews),
+        'review_sort': sort,
+        'reviews_next': next_cursor,
+        'bought_together': _bought_together(product),
+    })
+
+
+def _bought_together(product):
+    """Available products most often ordered together with this one, best first."""
+    from core import baskets
+
+    related = [pid for pid, _ in baskets.get_index().related(product.pk, BOUGHT_TOGETHER_COUNT * 2)]
+    if not related:
+        return []
+    products = _card_queryset().in_bulk(related)
+    return [products[pid] for pid in related if pid in products][:BOUGHT_TOGETHER_COUNT]
@@ -0,0 +1,15 @@
+"""
+Prometheus metrics endpoint.
+"""
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from core.metrics import registry
+
+
+def metrics_view(request):
+    """Expose this process's request metrics in the Prometheus text format."""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+    if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
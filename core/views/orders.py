@@ -0,0 +1,63 @@
+"""
+Views for placing orders.
+"""
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404, redirect, render
+
+from core.cart import SessionCart
+from core.forms import OrderCreateForm
+from core.inventory import InsufficientStock
+from core.models import Order, OrderItem
+from core.orders import place_order
+
+
+@login_required
+def order_create(request):
+    """Show the checkout form and place the order on submit."""
+    cart = SessionCart(request)
+    if request.method == 'POST':
+        form = OrderCreateForm(request.POST)
+        if form.is_valid():
+            # The session cart is the source of truth; write it out first
+            cart.persist(force=True)
+            try:
+                order = place_order(request.user, form.cleaned_data)
+            except (InsufficientStock, ValueError) as e:
+                messages.error(request, str(e))
+                return redirect('cart_detail')
+            cart.clear()
+
+            order = Order.objects.prefetch_related(
+                Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+            ).get(pk=order.pk)
+            return render(request, 'orders/order_created.html', {'order': order})
+    else:
+        user = request.user
+        form = OrderCreateForm(initial={
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+        })
+
+    return render(request, 'orders/checkout.html', {'cart': cart, 'form': form})
+
+
+@login_required
+def order_detail(request, order_id):
+    """Show one of the user's orders."""
+    order = get_object_or_404(
+        Order.objects.prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product'))),
+        pk=order_id, user=request.user,
+    )
+    return render(request, 'orders/detail.html', {'order': order})
+
+
+@login_required
+def order_list(request):
+    """List the user's orders, newest first."""
+    orders = Order.objects.filter(user=request.user).prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+    return render(request, 'orders/list.html', {'orders': orders})
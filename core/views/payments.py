@@ -0,0 +1,20 @@
+"""
+Views for payment gateway webhooks.
+"""
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from core import payments
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def payment_webhook(request):
+    """Store a signed gateway event; orders are updated by a background task."""
+    try:
+        created = payments.receive(request.body, request.headers.get(payments.SIGNATURE_HEADER, ''))
+    except payments.InvalidEvent as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    # Duplicates are acknowledged too, or the gateway keeps redelivering them
+    return JsonResponse({'status': 'received' if created else 'duplicate'})
@@ -0,0 +1,61 @@
+"""
+Profiles admin page.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_http_methods
+
+from core import profiling
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def profiles_view(request):
+    """
+    Sampled stacks per URL name.
+
+    GET lists the profiled views with the top functions of the one chosen
+    with ?view=; ?format=collapsed downloads collapsed stacks (of that view,
+    or of all of them) for a flame graph. POST clears all profiles.
+    """
+    if request.method == 'POST':
+        profiling.reset()
+        return redirect('profiles')
+
+    views = profiling.load()
+    view = request.GET.get('view')
+    if view not in views:
+        view = None
+    if request.GET.get('format') == 'collapsed':
+        response = HttpResponse(profiling.collapsed(views, view), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{view or "all"}.folded"'
+        return response
+
+    interval = getattr(settings, 'PROFILER_INTERVAL', 0.01)
+    rows = [
+        {'name': name, 'requests': totals['requests'], 'samples': totals['samples'],
+         'seconds': totals['samples'] * interval}
+        for name, totals in sorted(views.items(), key=lambda item: -item[1]['samples'])
+    ]
+    functions = []
+    if view is not None:
+        samples = views[view]['samples'] or 1
+        functions = [
+            {'name': name, 'own': own, 'total': total, 'own_share': 100 * own / samples, 'total_share': 100 * total / samples}
+            for name, own, total in profiling.top_functions(views[view]['stacks'])
+        ]
+    return render(request, 'admin/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Profiles',
+        'rows': rows,
+        'view': view,
+        'functions': functions,
+        'header': getattr(settings, 'PROFILER_HEADER', 'X-Profile'),
+        'token': profiling.make_token(),
+        'token_max_age': getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 300),
+        'enabled': getattr(settings, 'PROFILER_ENABLED', False),
+        'sample_rate': getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0),
+    })
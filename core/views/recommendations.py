@@ -1,68 +1,42 @@
-""
+"""
 Views for handling recommendations.
 """
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
-from django.db.models import Count, Avg
-
-from core.models import Product, Review, OrderItem
-from core.recommendations.recommender import Recommender
 
-# Global recommender instance
-recommender = None
-
-def init_recommender():
-    """Initialize the recommender with existing data."""
-    global recommender
-    
-    if recommender is not None:
-        return
-    
-    # Get all user-item interactions from reviews and orders
-    reviews = Review.objects.values('user_id', 'product_id').annotate(
-        avg_rating=Avg('rating')
-    )
-    
-    # Convert to list of tuples (user_id, item_id, rating)
-    interactions = [
-        (r['user_id'], r['product_id'], float(r['avg_rating']))
-        for r in reviews
-    ]
-    
-    # Add order data as implicit feedback
-    orders = OrderItem.objects.values('order__user_id', 'product_id').annotate(
-        count=Count('id')
-    )
-    
-    # Add implicit feedback (purchases) with a default rating of 4.0
-    for order in orders:
-        interactions.append((order['order__user_id'], order['product_id'], 4.0))
-    
-    # Initialize and fit the recommender
-    if interactions:
-        recommender = Recommender(use_cython=True)
-        recommender.fit(interactions)
+from core import metrics
+from core.models import Product, Review
+from core.recommendations import popular, recommend, stored
+from core.tasks import refit_recommender
 
 @login_required
 def get_recommendations(request):
     """Get personalized product recommendations for the current user."""
-    global recommender
-    
-    if recommender is None:
-        init_recommender()
-    
     user_id = request.user.id
     recommended = []
     
-    if recommender is not None:
-        # Get top 6 recommendations
-        recommendations = recommender.recommend(user_id, n=6)
-        
+    # Precomputed lists cover most users; the rest are scored live, with
+    # unavailable products masked out before ranking so the model fills
+    # all 6 slots whenever it can. While the model is still loading the
+    # request gets popular products instead of waiting for it.
+    recommendations = stored(user_id)
+    if recommendations is None:
+        with metrics.span('recommender'):
+            recommendations = recommend(
+                user_id, n=6, max_per_category=getattr(settings, 'RECOMMENDER_MAX_PER_CATEGORY', None),
+                wait=False,
+            )
+    
+    if recommendations:
         # Get product details for recommended items
         product_ids = [item_id for item_id, _ in recommendations]
-        products = Product.objects.filter(id__in=product_ids).in_bulk()
+        # Stored lists may include products sold out since they were built
+        products = Product.objects.filter(available=True, stock__gt=0).select_related(
+            'rating_summary'
+        ).in_bulk(product_ids)
         
         # Create list of recommended products with scores
         recommended = [
@@ -72,16 +46,18 @@ def get_recommendations(request):
             }
             for item_id, score in recommendations
             if item_id in products
-        ]
+        ][:6]
     
     # If no recommendations or not enough, fall back to popular items
     if len(recommended) < 3:
-        popular = Product.objects.annotate(
-            num_orders=Count('order_items')
-        ).order_by('-num_orders')[:6]
+        popular_ids = popular(12)
+        products = Product.objects.filter(available=True, stock__gt=0).select_related(
+            'rating_summary'
+        ).in_bulk(popular_ids)
         
-        for product in popular:
-            if not any(r['product'].id == product.id for r in recommended):
+        for product_id in popular_ids:
+            product = products.get(product_id)
+            if product is not None and not any(r['product'].id == product.id for r in recommended):
                 recommended.append({'product': product, 'score': 0.0})
             if len(recommended) >= 6:
                 break
@@ -98,8 +74,6 @@ def recommendation_view(request):
 @login_required
 def rate_product(request, product_id):
     """Handle product rating and update recommendations."""
-    global recommender
-    
     try:
         rating = float(request.POST.get('rating'))
         if not (1 <= rating <= 5):
@@ -113,10 +87,8 @@ def rate_product(request, product_id):
             defaults={'rating': rating}
         )
         
-        # Update the recommender with the new rating
-        if recommender is not None:
-            # Re-initialize the recommender with updated data
-            init_recommender()
+        # Retrain in the background; ratings arriving meanwhile share one refit
+        refit_recommender.schedule(key='model', countdown=getattr(settings, 'RECOMMENDER_REFIT_DELAY', 30))
         
         return JsonResponse({
             'status': 'success',
@@ -0,0 +1,95 @@
+"""
+Views for interacting with product reviews.
+"""
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.views.decorators.http import require_http_methods
+
+from core import review_feed
+from core.counters import VOTE_FIELDS, get_vote_buffer
+from core.forms import ReviewForm
+from core.models import Product, Review
+
+
+@require_http_methods(["POST"])
+@login_required
+def add_review(request, product_id):
+    """Review a product, or replace the user's earlier review of it."""
+    product = get_object_or_404(Product.objects.only('id'), pk=product_id, available=True)
+    review = Review.objects.filter(product=product, user=request.user).first()
+    form = ReviewForm(request.POST, instance=review or Review(product=product, user=request.user))
+    if form.is_valid():
+        # Saved through the model so the rating summary and feeds follow
+        form.save()
+        messages.success(request, 'Thank you for your review.')
+    else:
+        messages.error(request, 'Please choose a rating from 1 to 5.')
+    return redirect('product_detail', pk=product.pk)
+
+
+@require_http_methods(["POST"])
+@login_required
+def delete_review(request, review_id):
+    """Delete one of the user's reviews."""
+    review = get_object_or_404(Review, pk=review_id, user=request.user)
+    product_id = review.product_id
+    review.delete()
+    return redirect('product_detail', pk=product_id)
+
+
+@require_http_methods(["POST"])
+@login_required
+def review_vote(request, review_id, vote):
+    """Buffer a like or dislike; counters are written to the database later."""
+    if vote not in VOTE_FIELDS:
+        raise Http404("Unknown vote type")
+
+    product_id = Review.objects.filter(pk=review_id).values_list('product_id', flat=True).first()
+    if product_id is None:
+        raise Http404("Review not found")
+
+    counted = get_vote_buffer().vote(review_id, request.user.id, vote)
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({
+            'status': 'success' if counted else 'duplicate',
+            'review_id': review_id,
+            'vote': vote,
+        }, status=200 if counted else 409)
+    return redirect('product_detail', pk=product_id)
+
+
+@require_http_methods(["GET"])
+def review_list(request, product_id):
+    """
+    One page of a product's reviews as JSON.
+
+    Query parameters are sort ('recent' or 'helpful') and cursor, the
+    'next' value of the previous page.
+    """
+    if not Product.objects.filter(pk=product_id, available=True).exists():
+        raise Http404("Product not found")
+    sort = request.GET.get('sort', 'recent')
+    try:
+        reviews, next_cursor = review_feed.get_page(product_id, sort, request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'reviews': [
+            {
+                'id': review.id,
+                'user': review.user.username,
+                'rating': review.rating,
+                'comment': review.comment,
+                'created_at': review.created_at.isoformat(),
+                'likes': review.likes,
+                'dislikes': review.dislikes,
+                'helpfulness': round(review.helpfulness, 4),
+            }
+            for review in get_vote_buffer().merge(reviews)
+        ],
+        'next': next_cursor,
+    })
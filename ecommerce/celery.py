@@ -0,0 +1,39 @@
+"""
+Celery application used when TASK_BACKEND = 'celery'.
+
+Started by the celery and celery-beat services of docker-compose.yml
+(celery -A ecommerce ...). Every call goes through run_task, which looks
+the task up in core.background's registry, so tasks are declared once with
+@task whichever backend runs them; @periodic tasks other than local ones
+make up the beat schedule.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+
+app = Celery('ecommerce')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+
+@app.task(name='core.run_task', ignore_result=True)
+def run_task(name, args, kwargs, key=None, attempt=0):
+    from core.background import execute
+
+    execute(name, args, kwargs, key, attempt)
+
+
+@app.on_after_finalize.connect
+def add_periodic_tasks(sender, **kwargs):
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    from core.background import periodic_tasks, registry
+
+    for name, interval in periodic_tasks.items():
+        # Local tasks are run by every web process's own scheduler
+        if not registry[name].local:
+            sender.add_periodic_task(interval, run_task.s(name, [], {}), name=name)
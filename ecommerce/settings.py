@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,7 +61,7 @@ ROOT_URLCONF = 'ecommerce.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -65,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.cart',
             ],
         },
     },
@@ -80,9 +85,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional read replica and analytics copies, routed by core.routers. To try
+# it locally with SQLite, point these at copies of db.sqlite3.
+for alias, variable in (('replica', 'DATABASE_REPLICA_NAME'), ('analytics', 'DATABASE_ANALYTICS_NAME')):
+    if os.environ.get(variable):
+        DATABASES[alias] = {
+            **DATABASES['default'],
+            'NAME': os.environ[variable],
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Cache
+# Single-flight locks, task deduplication keys and shared buffers live in the
+# default cache, so every process must see the same one: set CACHE_URL (e.g.
+# redis://redis:6379/1) whenever more than one process serves the site.
+# manage.py check --deploy fails on the per-process fallback (core.E001).
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -125,6 +163,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Authentication
+LOGIN_URL = 'login'
+LOGIN_REDIRECT_URL = 'home'
+LOGOUT_REDIRECT_URL = 'home'
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
@@ -133,3 +176,178 @@ CRISPY_TEMPLATE_PACK = 'bootstrap5'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Product ratings
+# Bayesian average prior: ratings are shrunk towards this mean as if every
+# product already had RATING_PRIOR_WEIGHT reviews of it.
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_WEIGHT = 5
+
+# Review votes
+# Likes/dislikes are buffered ('local' per process, or 'cache' shared through
+# REVIEW_VOTE_CACHE_ALIAS) and written to the database every
+# REVIEW_VOTE_FLUSH_INTERVAL seconds. The 'local' buffer only rejects a
+# repeated vote that reaches the same process before it restarts; run
+# several workers with 'cache' and a shared cache to reject them all.
+REVIEW_VOTE_BUFFER = 'local'
+REVIEW_VOTE_CACHE_ALIAS = 'default'
+REVIEW_VOTE_FLUSH_INTERVAL = 5.0
+REVIEW_VOTE_BATCH_SIZE = 500
+# Product pages list REVIEW_PAGE_SIZE reviews at a time; the first page of
+# each product is cached for REVIEW_FEED_CACHE_TIMEOUT seconds.
+REVIEW_PAGE_SIZE = 10
+REVIEW_FEED_CACHE_TIMEOUT = 60
+
+# Inventory
+# Seconds a checkout may hold stock before it is released back (see the
+# release_expired_reservations command). Expired reservations are also
+# released by a background task every INVENTORY_RELEASE_INTERVAL seconds.
+INVENTORY_RESERVATION_TTL = 900
+INVENTORY_RELEASE_INTERVAL = 60
+
+# Payments
+# Webhook events signed with STRIPE_WEBHOOK_SECRET (and at most
+# PAYMENT_WEBHOOK_TOLERANCE seconds old) are stored and applied to orders by
+# a background task PAYMENT_BATCH_DELAY seconds later, PAYMENT_BATCH_SIZE
+# events per transaction; every PAYMENT_SWEEP_INTERVAL seconds any left
+# behind are picked up.
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+PAYMENT_WEBHOOK_TOLERANCE = 300
+PAYMENT_BATCH_DELAY = 1.0
+PAYMENT_BATCH_SIZE = 500
+PAYMENT_SWEEP_INTERVAL = 60
+
+# Shopping cart
+# The cart lives in the session and is written to Cart/CartItem at most once
+# every CART_PERSIST_INTERVAL seconds while it changes (and always at
+# checkout, login and logout).
+CART_SESSION_ID = 'cart'
+CART_PERSIST_INTERVAL = 300
+
+# Fragment caching
+# Product cards are cached per card version; whole catalog pages are cached
+# for visitors without a session, keyed by a catalog-wide version.
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_PAGE_CACHE_TIMEOUT = 300
+
+# Metrics
+# InstrumentationMiddleware measures METRICS_SAMPLE_RATE of requests (raise it
+# for a load test or a debugging session); the aggregated histograms are
+# served at /metrics to METRICS_ALLOWED_IPS and staff users. A query shape
+# repeated METRICS_N_PLUS_ONE_THRESHOLD times in one request is reported as a
+# possible N+1.
+METRICS_ENABLED = True
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.05'))
+METRICS_N_PLUS_ONE_THRESHOLD = 5
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Profiler
+# ProfilingMiddleware samples the Python stacks of PROFILER_SAMPLE_RATE of
+# requests, and of any request sent with a PROFILER_HEADER token from the
+# profiles admin page (valid for PROFILER_TOKEN_MAX_AGE seconds), every
+# PROFILER_INTERVAL seconds. Each process writes its totals per URL name to
+# PROFILER_DIR every PROFILER_FLUSH_INTERVAL seconds; /admin/profiles/
+# shows them and exports collapsed stacks for flame graphs. The middleware is
+# only installed when PROFILER_ENABLED=1 is set in the environment.
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '0') == '1'
+PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', '0'))
+PROFILER_HEADER = 'X-Profile'
+PROFILER_TOKEN_MAX_AGE = 300
+PROFILER_INTERVAL = 0.01
+PROFILER_MAX_DEPTH = 128
+PROFILER_FLUSH_INTERVAL = 10.0
+PROFILER_DIR = BASE_DIR / 'var' / 'profiles'
+
+# Image renditions
+# Product images are resized to these widths in WebP and JPEG on upload
+# (and by the build_renditions command) under content-hashed names.
+RENDITION_WIDTHS = (160, 320, 640, 1280)
+
+# Database routing
+# Safe requests read from DATABASE_REPLICA_ALIAS; a browser that just wrote
+# reads from the primary for DATABASE_REPLICA_PIN_SECONDS. Training and
+# reporting jobs read from DATABASE_ANALYTICS_ALIAS.
+DATABASE_REPLICA_ALIAS = 'replica'
+DATABASE_ANALYTICS_ALIAS = 'analytics'
+DATABASE_REPLICA_PIN_SECONDS = 5
+
+# Recommender
+# Load the recommendation model when the WSGI application is imported, i.e.
+# in the gunicorn master with preload_app, instead of on the first request.
+# Products it may suggest are re-read by a background task in every process
+# each RECOMMENDER_FILTER_REFRESH seconds (saving a product applies at once);
+# with RECOMMENDER_MAX_PER_CATEGORY set no category takes more slots than
+# that.
+RECOMMENDER_WARM_UP = True
+# A rating queues a background refit RECOMMENDER_REFIT_DELAY seconds later;
+# ratings arriving in the meantime are covered by the same refit.
+RECOMMENDER_REFIT_DELAY = 30
+# The process that fits a model saves it in RECOMMENDER_MODEL_DIR. Others
+# load it instead of fitting the same data: at start-up while it is at most
+# RECOMMENDER_MODEL_MAX_AGE seconds old, and within
+# RECOMMENDER_MODEL_RELOAD_INTERVAL seconds of a refit elsewhere.
+RECOMMENDER_MODEL_DIR = BASE_DIR / 'var' / 'recommender'
+RECOMMENDER_MODEL_MAX_AGE = 3600
+RECOMMENDER_MODEL_RELOAD_INTERVAL = 60
+# Users without recommendations get the best sellers, re-ranked every
+# RECOMMENDER_POPULAR_TIMEOUT seconds.
+RECOMMENDER_POPULAR_TIMEOUT = 300
+RECOMMENDER_FILTER_REFRESH = 60
+RECOMMENDER_MAX_PER_CATEGORY = None
+# Addresses ('host:port' or a Unix socket path) of the shard processes
+# started by run_recommender_shards. When set, web processes do not load the
+# model; they ask every shard and use the answers that arrive within
+# RECOMMENDER_SHARD_TIMEOUT seconds, skipping a failed shard for
+# RECOMMENDER_SHARD_RETRY seconds.
+RECOMMENDER_SHARDS = [
+    address for address in os.environ.get('RECOMMENDER_SHARDS', '').split(',') if address
+]
+RECOMMENDER_SHARD_TIMEOUT = 0.5
+RECOMMENDER_SHARD_RETRY = 30.0
+# build_recommendation_store keeps RECOMMENDER_STORE_SIZE products per user
+# in RECOMMENDER_STORE_DIR, and every refit rebuilds it from then on; web
+# processes pick up a new build within RECOMMENDER_STORE_RELOAD_INTERVAL
+# seconds.
+RECOMMENDER_STORE_DIR = BASE_DIR / 'var' / 'recommendations'
+RECOMMENDER_STORE_SIZE = 20
+RECOMMENDER_STORE_RELOAD_INTERVAL = 30.0
+
+# Behavior events
+# Product views, cart changes, searches and purchases are buffered in memory
+# (at most EVENT_BUFFER_SIZE) and written to BehaviorEvent every
+# EVENT_FLUSH_INTERVAL seconds; EVENT_WEIGHTS turns them into the implicit
+# scores the recommender uses.
+EVENTS_ENABLED = True
+EVENT_BUFFER_SIZE = 100_000
+EVENT_FLUSH_INTERVAL = 2.0
+EVENT_BATCH_SIZE = 1000
+EVENT_WEIGHTS = {'view': 1.0, 'cart_add': 3.0, 'cart_remove': -2.0, 'purchase': 5.0}
+
+# Frequently bought together
+# Product pairs ordered together in at least BASKET_MIN_COUNT orders are
+# ranked by lift; the best BASKET_TOP_K per product are kept in
+# BASKET_INDEX_DIR. New orders are folded in at most every
+# BASKET_UPDATE_INTERVAL seconds once they are BASKET_SETTLE_SECONDS old;
+# web processes pick up a new index within BASKET_RELOAD_INTERVAL seconds.
+BASKET_INDEX_DIR = BASE_DIR / 'var' / 'baskets'
+BASKET_TOP_K = 10
+BASKET_MIN_COUNT = 2
+BASKET_UPDATE_INTERVAL = 300
+BASKET_SETTLE_SECONDS = 60
+BASKET_RELOAD_INTERVAL = 30.0
+
+# Admin
+# Changelists of big tables show the query planner's row estimate instead of
+# running COUNT(*) when it expects more than ADMIN_EXACT_COUNT_LIMIT rows
+# (PostgreSQL and MySQL only).
+ADMIN_EXACT_COUNT_LIMIT = 100_000
+
+# Background tasks
+# TASK_BACKEND is 'local' (TASK_WORKERS threads in every web process),
+# 'eager' (tasks run at the call; for tests) or 'celery' (queued on
+# CELERY_BROKER_URL for the celery services in docker-compose.yml).
+TASK_BACKEND = os.environ.get('TASK_BACKEND', 'local')
+TASK_WORKERS = 4
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
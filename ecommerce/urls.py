@@ -15,8 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from core.views.metrics import metrics_view
+from core.views.profiling import profiles_view
 
 urlpatterns = [
+    # Before admin/, whose catch-all would answer it with a 404
+    path('admin/profiles/', profiles_view, name='profiles'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('accounts/', include('django.contrib.auth.urls')),
+    path('', include('core.urls')),
 ]
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
 
 application = get_wsgi_application()
+
+# Train the recommender before a pre-forking server (gunicorn --preload, see
+# gunicorn.conf.py) starts its workers, so they share the model's memory.
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'RECOMMENDER_WARM_UP', True):
+    from core.recommendations import warm_up  # noqa: E402
+
+    warm_up()
@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration.
+
+The application (and with it the recommendation model, see
+core.recommendations.warm_up) is loaded once in the master before the
+workers are forked, so its memory is shared copy-on-write.
+"""
+import multiprocessing
+
+wsgi_app = 'ecommerce.wsgi:application'
+preload_app = True
+workers = multiprocessing.cpu_count() * 2 + 1
+max_requests = 2000
+max_requests_jitter = 200